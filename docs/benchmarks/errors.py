@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""
+Measure the cost of ServerExceptions under high error rates:
+creating the exception from an HTTPError (which reads the body), and
+formatting it for a log message (str, errorId, pdfreactor_says, repeated
+as a logging setup might), plus the memory kept by 1000 exceptions
+(e.g. in a list of failures).
+
+Usage: python docs/benchmarks/errors.py [repeat]
+
+"legacy" reproduces the former handling (reading and decoding the
+complete body on first access; the XML repr citing the whole text).
+
+Sample results (Python 3.11):
+
+    body                           us/error   legacy us   KB/1000 errors
+    JSON error (40 B)                  15.4        16.2             1288
+    HTML error page (4 KB)             15.3        31.2             5533
+    HTML error page (1 MB)             33.5      5892.1            33601
+
+Large error pages are read up to default_errors['max_body'] (32 KB) only,
+and cited by an excerpt of 200 characters, so both time and memory per
+error are bounded; the body is parsed once for all properties.
+"""
+from __future__ import print_function
+
+import gc
+import json
+import os
+import sys
+import time
+from io import BufferedReader, BytesIO
+
+try:
+    from urllib.error import HTTPError
+except ImportError:  # Python 2
+    from urllib2 import HTTPError
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', '..', 'src'))
+
+from pdfreactor.exceptions import ServerException  # noqa: E402
+
+BODIES = [
+    ('JSON error (40 B)',
+     b'{"error": "Invalid value for pageOrder"}'),
+    ('HTML error page (4 KB)',
+     b'<html><body><pre>' + b'at com.example.Proxy\n' * 190
+     + b'</pre></body></html>'),
+    ('HTML error page (1 MB)',
+     b'<html><body><pre>' + b'at com.example.Proxy\n' * 50000
+     + b'</pre></body></html>'),
+]
+HEADERS = {'X-RO-Error-ID': 'invalidConfiguration'}
+
+
+def http_error(body):
+    # (unlike a BytesIO, a BufferedReader returns copies, like a socket)
+    return HTTPError('http://localhost:9423/service/rest/convert.json',
+                     500, 'Server Error', HEADERS,
+                     BufferedReader(BytesIO(body)))
+
+
+def log_line(e):
+    return '%s [%s]: %s' % (e, e.errorId, e.pdfreactor_says)
+
+
+def current(body):
+    e = ServerException(http_error(body))
+    log_line(e)
+    log_line(e)
+    return e
+
+
+def legacy(body):
+    # the former properties: read and decode the complete body, and cite
+    # the whole text (for the second access, the body is gone):
+    e = http_error(body)
+    for i in range(2):
+        text = e.read().decode('utf-8')
+        if text.startswith(u'<'):
+            message = '<XML text: %r>' % (text,)
+        else:
+            try:
+                message = json.loads(text).get('error')
+            except ValueError:
+                message = '<no-JSON value %r>' % (text,)
+        '%s [%s]: %s' % (e, e.headers.get('X-RO-Error-ID'), message)
+    return e
+
+
+def timed(func, body, repeat):
+    start = time.time()
+    for i in range(repeat):
+        func(body)
+    return (time.time() - start) / repeat * 1e6
+
+
+def retained(func, body, count=1000):
+    if tracemalloc is None:
+        return None
+    gc.collect()
+    tracemalloc.start()
+    errors = [func(body) for i in range(count)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del errors
+    return size // 1024
+
+
+def main(repeat=2000):
+    print('%-28s %10s %11s %16s'
+          % ('body', 'us/error', 'legacy us', 'KB/1000 errors'))
+    for name, body in BODIES:
+        count = max(repeat * 1000 // max(len(body), 1000), 20)
+        print('%-28s %10.1f %11.1f %16s'
+              % (name, timed(current, body, count),
+                 timed(legacy, body, count),
+                 retained(current, body)))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
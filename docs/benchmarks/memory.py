@@ -0,0 +1,510 @@
+#!/usr/bin/env python
+"""
+Profile the memory usage of the API paths for large documents
+
+Every path (convert, convertAsBinary, getDocument ...) is run against a
+local stub server (in a child process, so its memory isn't counted) for
+documents of each size, recording:
+
+- peak: the peak of memory allocated by Python code during the call
+  (tracemalloc), including the returned result
+- copies: peak / size, i.e. how many copies of the document were held
+  in memory at the same time (0 for streaming paths)
+- blocks: the peak increase of allocated memory blocks
+  (sys.getallocatedblocks, sampled; CPython doesn't count allocations)
+- rss: the peak increase of the resident set size (sampled from
+  /proc/self/statm; only available on Linux)
+- retained: memory still allocated after the result has been dropped
+
+Usage: python docs/benchmarks/memory.py [options]
+
+    --sizes 1K,1M,64M    the document sizes (default: 1K to 1G)
+    --max-size 256M      skip larger sizes
+    --paths a,b          run these paths only (see --list)
+    --baseline FILE      compare with the results of an earlier run
+    --save FILE          save the results (JSON) for later comparisons
+    --tolerance 0.1      allowed relative growth over the baseline
+
+The run fails (exit status 1) if any path exceeds its limit in LIMITS
+(copies of the document, plus a fixed overhead), or grows beyond the
+baseline by more than the tolerance.  Buffering paths need several times
+the document size: for 1 GB documents, make sure there is enough memory
+(or use --max-size).
+
+Sample results (Python 3.11, Linux; 256 MB documents):
+
+    path                             peak MB  copies  blocks  rss MB
+    convert                            682.7    2.67     121   682.7
+    convert (lazy)                     341.5    1.33     107   341.3
+    convertAsBinary                    256.0    1.00      85   256.0
+    convertAsBinary (stream)             0.2    0.00      91     0.0
+    convertAsBinary (spool)              1.2    0.00     100     0.2
+    convertAsBinaryStream                0.2    0.00      92     0.0
+    convertToPath                        0.2    0.00      92   256.0
+    convertAsBinary (binary input)       0.2    0.00     161     0.0
+    getDocument                        682.7    2.67      83   682.7
+    getDocument (lazy)                 341.5    1.33      73   341.3
+    getDocumentAsBinary                256.0    1.00     105   256.0
+    getDocumentAsBinary (stream)         0.2    0.00     103     0.0
+    getDocumentAsBinaryStream            0.2    0.00      91     0.0
+    getDocumentToPath                    0.2    0.00      92   256.0
+
+The JSON paths hold two copies of the base64 text (4/3 of the document
+size each) at a time: bytes and str, then str and parsed value; the lazy
+ones keep the response bytes only, and decode the document from there
+(chunk by chunk, by save_document).  The RSS of the *ToPath paths
+includes the pages of the memory-mapped output file, which belong to the
+page cache.
+"""
+from __future__ import print_function
+
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from base64 import b64encode
+from multiprocessing import get_context
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:  # Python 2 (no tracemalloc, though)
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', '..', 'src'))
+
+from pdfreactor.api import PDFreactor  # noqa: E402
+from pdfreactor.inputs import BinaryDocument  # noqa: E402
+
+KB = 1024
+MB = KB * KB
+GB = KB * MB
+SIZES = [KB, 64 * KB, MB, 16 * MB, 256 * MB, GB]
+SIZE_HEADER = 'X-Stub-Size'
+BLOCK = 48 * KB  # a multiple of 3, to be base64-encoded without padding
+PATTERN = (b'%PDF-1.4\n' + bytes(bytearray(range(256))) * 192)[:BLOCK]
+
+# path --> maximum copies of the document held at the same time;
+# an OVERHEAD (for buffers, modules loaded on first use etc.) is added:
+LIMITS = {
+    'convert':                        2.8,
+    'convert (lazy)':                 1.4,
+    'convertAsBinary':                1.1,
+    'convertAsBinary (stream)':       0.01,
+    'convertAsBinary (spool)':        0.01,
+    'convertAsBinaryStream':          0.01,
+    'convertToPath':                  0.01,
+    'convertAsBinary (binary input)': 0.01,
+    'getDocument':                    2.8,
+    'getDocument (lazy)':             1.4,
+    'getDocumentAsBinary':            1.1,
+    'getDocumentAsBinary (stream)':   0.01,
+    'getDocumentAsBinaryStream':      0.01,
+    'getDocumentToPath':              0.01,
+    }
+OVERHEAD = 2 * MB
+
+
+# ---------------------------------------------------------- stub server ---
+
+def payload(size):
+    """
+    Yield `size` bytes of document data, chunk by chunk
+    """
+    full, rest = divmod(size, BLOCK)
+    for i in range(full):
+        yield PATTERN
+    if rest:
+        yield PATTERN[:rest]
+
+
+def json_payload(size):
+    """
+    Yield a JSON conversion result with a document of `size` bytes,
+    chunk by chunk; the length is returned first
+    """
+    head = b'{"contentType": "application/pdf", "document": "'
+    tail = (b'", "numberOfPages": 1, "numberOfPagesLiteral": 1,'
+            b' "log": {"records": []}}')
+    yield len(head) + -(-size // 3) * 4 + len(tail)
+    yield head
+    encoded = b64encode(PATTERN)
+    for chunk in payload(size):
+        yield encoded if chunk is PATTERN else b64encode(chunk)
+    yield tail
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _consume(self):
+        """
+        Read (and discard) the request body
+        """
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            while True:
+                length = int(self.rfile.readline().split(b';')[0], 16)
+                if not length:
+                    self.rfile.readline()
+                    return
+                self.rfile.read(length + 2)
+        length = int(self.headers.get('Content-Length') or 0)
+        while length > 0:
+            length -= len(self.rfile.read(min(length, 1 * MB)))
+
+    def _send(self, content_type, length, chunks, status=200, **headers):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(length))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        for chunk in chunks:
+            self.wfile.write(chunk)
+
+    def _document(self, kind):
+        size = int(self.headers.get(SIZE_HEADER) or KB)
+        if kind == 'json':
+            chunks = json_payload(size)
+            length = next(chunks)
+            self._send('application/json', length, chunks)
+        else:
+            self._send('application/pdf', size, payload(size),
+                       **{'Accept-Ranges': 'bytes'})
+
+    def do_POST(self):
+        self._consume()
+        path = self.path.split('?')[0]
+        if path.endswith('/convert.json'):
+            self._document('json')
+        elif path.endswith('/convert.bin'):
+            self._document('bin')
+        elif path.endswith('/convert/async.json'):
+            self._send('application/json', 0, (), status=202,
+                       Location=self.path.replace('/convert/async.json',
+                                                  '/progress/stub.json'))
+        else:
+            self._send('text/plain', 0, (), status=404)
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if '/document/' in path and path.endswith('.json'):
+            self._document('json')
+        elif '/document/' in path and path.endswith('.bin'):
+            self._document('bin')
+        else:
+            self._send('text/plain', 0, (), status=404)
+
+    # the UrllibTransport sends lowercase method names:
+    do_get = do_GET
+    do_post = do_POST
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def serve(conn):
+    server = StubServer(('127.0.0.1', 0), StubHandler)
+    conn.send(server.server_address[1])
+    server.serve_forever()
+
+
+def start_server():
+    """
+    Start the stub server in a child process; return (process, URL)
+    """
+    ctx = get_context('fork' if sys.platform.startswith('linux')
+                      else 'spawn')
+    parent, child = ctx.Pipe()
+    process = ctx.Process(target=serve, args=(child,))
+    process.daemon = True
+    process.start()
+    port = parent.recv()
+    return process, 'http://127.0.0.1:%d/service/rest' % (port,)
+
+
+# ---------------------------------------------------------------- paths ---
+
+class NullSink(object):
+    CHUNK = 64 * KB
+
+    def write(self, data):
+        pass
+
+    def close(self):
+        pass
+
+
+def _settings(size):
+    return {'headers': {SIZE_HEADER: str(size)}}
+
+
+CONFIG = {'document': '<html><body>Stub</body></html>'}
+
+
+def path_functions(url, tmpdir):
+    """
+    Return a list of (name, function); each function takes the document
+    size, and returns the result (which is measured, then dropped)
+    """
+    plain = PDFreactor(url)
+    lazy = PDFreactor(url, lazy=True)
+    spool = PDFreactor(url, spool=MB, spooldir=tmpdir)
+    output = os.path.join(tmpdir, 'output.pdf')
+
+    def lazy_document(result):
+        result.save_document(NullSink())
+        return result
+
+    def spooled(result):
+        result.close()
+        return result
+
+    def binary_input(size):
+        source = os.path.join(tmpdir, 'input.html')
+        with open(source, 'wb') as f:
+            f.truncate(size)
+        with open(source, 'rb') as f:
+            config = dict(CONFIG, document=BinaryDocument(f))
+            return plain.convertAsBinary(config,
+                                         connectionSettings=_settings(KB))
+
+    return [
+        ('convert', lambda size:
+            plain.convert(CONFIG, _settings(size))),
+        ('convert (lazy)', lambda size:
+            lazy_document(lazy.convert(CONFIG, _settings(size)))),
+        ('convertAsBinary', lambda size:
+            plain.convertAsBinary(CONFIG, connectionSettings=_settings(size))),
+        ('convertAsBinary (stream)', lambda size:
+            plain.convertAsBinary(CONFIG, NullSink(), _settings(size))),
+        ('convertAsBinary (spool)', lambda size:
+            spooled(spool.convertAsBinary(CONFIG,
+                                          connectionSettings=_settings(size)))),
+        ('convertAsBinaryStream', lambda size:
+            sum(len(chunk) for chunk in
+                plain.convertAsBinaryStream(CONFIG, _settings(size)))),
+        ('convertToPath', lambda size:
+            plain.convertToPath(CONFIG, output, _settings(size))),
+        ('convertAsBinary (binary input)', binary_input),
+        ('getDocument', lambda size:
+            plain.getDocument('stub', _settings(size))),
+        ('getDocument (lazy)', lambda size:
+            lazy_document(lazy.getDocument('stub', _settings(size)))),
+        ('getDocumentAsBinary', lambda size:
+            plain.getDocumentAsBinary('stub',
+                                      connectionSettings=_settings(size))),
+        ('getDocumentAsBinary (stream)', lambda size:
+            plain.getDocumentAsBinary('stub', NullSink(), _settings(size))),
+        ('getDocumentAsBinaryStream', lambda size:
+            sum(len(chunk) for chunk in
+                plain.getDocumentAsBinaryStream('stub', _settings(size)))),
+        ('getDocumentToPath', lambda size:
+            plain.getDocumentToPath('stub', output, _settings(size))),
+        ]
+
+
+# ------------------------------------------------------------ measuring ---
+
+def rss():
+    """
+    The resident set size in bytes, or None (if not available)
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError):
+        return None
+
+
+class Sampler(threading.Thread):
+    """
+    Sample the RSS and the number of allocated blocks until stopped
+    """
+
+    def __init__(self, interval=0.005):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.interval = interval
+        self.rss = self.rss_base = rss()
+        self.blocks = self.blocks_base = sys.getallocatedblocks()
+        self._stop_event = threading.Event()
+
+    def sample(self):
+        current = rss()
+        if current is not None and current > self.rss:
+            self.rss = current
+        self.blocks = max(self.blocks, sys.getallocatedblocks())
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.sample()
+
+
+def reset_peak():
+    if hasattr(tracemalloc, 'reset_peak'):  # Python 3.9+
+        tracemalloc.reset_peak()
+    else:
+        tracemalloc.stop()
+        tracemalloc.start()
+
+
+def measure(func, size):
+    gc.collect()
+    reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    sampler = Sampler()
+    sampler.start()
+    start = time.time()
+    result = func(size)
+    seconds = time.time() - start
+    sampler.stop()
+    peak = tracemalloc.get_traced_memory()[1] - base
+    del result
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - base
+    return {
+        'peak': peak,
+        'copies': float(peak) / size,
+        'blocks': sampler.blocks - sampler.blocks_base,
+        'rss': (None if sampler.rss is None
+                else sampler.rss - sampler.rss_base),
+        'retained': retained,
+        'seconds': seconds,
+        }
+
+
+def check(name, size, record, baseline, tolerance):
+    """
+    Return a list of failure messages
+    """
+    failures = []
+    limit = LIMITS.get(name)
+    if limit is not None and record['peak'] > limit * size + OVERHEAD:
+        failures.append('%s, %s: peak %s exceeds %.2f copies'
+                        % (name, format_size(size), format_size(
+                                record['peak']), limit))
+    if record['retained'] > OVERHEAD:
+        failures.append('%s, %s: %s retained after the call'
+                        % (name, format_size(size),
+                           format_size(record['retained'])))
+    if baseline:
+        before = baseline.get(name, {}).get(str(size))
+        if before is not None:
+            allowed = before['peak'] * (1 + tolerance) + OVERHEAD
+            if record['peak'] > allowed:
+                failures.append('%s, %s: peak %s, was %s'
+                                % (name, format_size(size),
+                                   format_size(record['peak']),
+                                   format_size(before['peak'])))
+    return failures
+
+
+# ----------------------------------------------------------------- main ---
+
+def parse_size(text):
+    """
+    >>> parse_size('64K'), parse_size('1G'), parse_size('100')
+    (65536, 1073741824, 100)
+    """
+    text = text.strip().upper()
+    factor = {'K': KB, 'M': MB, 'G': GB}.get(text[-1:])
+    if factor is None:
+        return int(text)
+    return int(float(text[:-1]) * factor)
+
+
+def format_size(size):
+    for factor, unit in ((GB, 'G'), (MB, 'M'), (KB, 'K')):
+        if size >= factor:
+            return '%g%s' % (round(float(size) / factor, 1), unit)
+    return str(size)
+
+
+def parse_args(argv):
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default=','.join(map(format_size, SIZES)))
+    parser.add_argument('--max-size', default=None)
+    parser.add_argument('--paths', default=None)
+    parser.add_argument('--list', action='store_true')
+    parser.add_argument('--baseline', default=None)
+    parser.add_argument('--save', default=None)
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = [parse_size(size) for size in args.sizes.split(',')]
+    if args.max_size:
+        sizes = [size for size in sizes if size <= parse_size(args.max_size)]
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    process, url = start_server()
+    tmpdir = tempfile.mkdtemp(prefix='pdfreactor-memory-')
+    results = {}
+    failures = []
+    try:
+        paths = path_functions(url, tmpdir)
+        if args.list:
+            for name, func in paths:
+                print(name)
+            return 0
+        if args.paths:
+            wanted = set(name.strip() for name in args.paths.split(','))
+            paths = [(name, func) for (name, func) in paths
+                     if name in wanted]
+        tracemalloc.start()
+        for name, func in paths:
+            func(KB)  # warm up (imports, connection handling)
+        for size in sizes:
+            print('\n%s documents:' % format_size(size))
+            print('%-32s %9s %7s %7s %9s %7s'
+                  % ('path', 'peak MB', 'copies', 'blocks', 'rss MB', 's'))
+            for name, func in paths:
+                record = measure(func, size)
+                results.setdefault(name, {})[str(size)] = record
+                print('%-32s %9.1f %7.2f %7d %9s %7.2f'
+                      % (name, float(record['peak']) / MB, record['copies'],
+                         record['blocks'],
+                         '-' if record['rss'] is None
+                         else '%.1f' % (float(record['rss']) / MB),
+                         record['seconds']))
+                failures.extend(check(name, size, record, baseline,
+                                      args.tolerance))
+    finally:
+        tracemalloc.stop()
+        process.terminate()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    if failures:
+        print('\nFAILED:')
+        for failure in failures:
+            print('  ' + failure)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,42 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+A sample WSGI application which streams the converted PDF to the browser
+while it arrives from the PDFreactor service (conserving memory, and
+delivering the first bytes early)
+"""
+from __future__ import print_function
+
+import os
+from wsgiref.simple_server import make_server
+
+from pdfreactor.api import PDFreactor, ServerException
+from pdfreactor.web import wsgi_response
+
+# The content to render
+fileHandle = open(os.path.abspath(os.path.join(os.path.dirname(__file__), '../resources/contentPython.html')))
+content = fileHandle.read()
+
+# Create new PDFreactor instance
+# pdfReactor = PDFreactor("http://yourServer:9423/service/rest")
+pdfReactor = PDFreactor()
+
+
+def application(environ, start_response):
+    config = {
+        # Specify the input document
+        'document': content,
+        # Set the title of the created PDF
+        'title': "Demonstration of the PDFreactor Python API",
+    }
+    try:
+        binary = pdfReactor.convertAsBinaryStream(config)
+    except ServerException as e:
+        start_response('502 Bad Gateway', [('Content-Type', 'text/plain')])
+        return [e.pdfreactor_says.encode('utf-8')]
+    return wsgi_response(start_response, binary, filename='sample.pdf')
+
+
+if __name__ == '__main__':
+    print("Serving on http://localhost:8000/ ...")
+    make_server('', 8000, application).serve_forever()
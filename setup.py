@@ -170,6 +170,11 @@ setup_kwargs = dict(
     install_requires=[
         'setuptools',
     ],
+    entry_points={
+        'console_scripts': [
+            'pdfreactor-batch = pdfreactor.batch:main',
+        ],
+    },
 )
 if 0:
     from pprint import pprint
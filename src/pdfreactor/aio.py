@@ -0,0 +1,214 @@
+"""
+pdfreactor.aio: asyncio support (Python 3 only)
+
+The PDFreactor client is a blocking one; the coroutines of this module
+run its methods in an executor (by default, the event loop's default one),
+and translate the cancellation of the awaiting task into the cancellation
+of the asynchronous conversion on the server:
+
+    documentId = await run_blocking(client.convertAsync, config)
+    try:
+        await wait_for_document(client, documentId, timeout=300)
+    except asyncio.CancelledError:
+        ...  # the document has been deleted on the server
+        raise
+"""
+
+import asyncio
+import threading
+from functools import partial
+
+from .raster import rasterize
+from .tee import new_digests
+from .timeouts import CancellationToken
+from .web import response_headers
+
+__all__ = [
+    'run_blocking',
+    'wait_for_document',
+    'asgi_response',
+    'tee_binary',
+    'iterate_blocking',
+    'rasterize_async',
+    ]
+
+_END = object()
+
+
+async def run_blocking(func, *args, executor=None, **kwargs):
+    """
+    Run a blocking function (e.g. a PDFreactor method) in an executor
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor,
+                                      partial(func, *args, **kwargs))
+
+
+async def wait_for_document(client, documentId, connectionSettings=None,
+                            timeout=None, interval=0.5, executor=None):
+    """
+    Wait for an asynchronous conversion to finish; see
+    PDFreactor.waitForDocument.
+
+    If the awaiting task is cancelled, the polling thread is stopped
+    and deletes the document on the server.
+    """
+    token = CancellationToken()
+    try:
+        return await run_blocking(client.waitForDocument, documentId,
+                                  connectionSettings,
+                                  timeout=timeout, cancel=token,
+                                  interval=interval, executor=executor)
+    except asyncio.CancelledError:
+        token.cancel()
+        raise
+
+
+async def asgi_response(send, binary, receive=None, filename=None,
+                        content_type=None, inline=False, status=200,
+                        chunksize=None, executor=None):
+    """
+    Send the given BinaryResponse as the body of an ASGI HTTP response
+
+    Every chunk is read from the PDFreactor service (in an executor) only
+    after the previous one has been sent, so a slow HTTP client slows down
+    the transfer rather than filling the memory.
+    If the receive callable is given, an http.disconnect message stops the
+    transfer; in any case, the BinaryResponse is closed.
+
+        async def app(scope, receive, send):
+            binary = await run_blocking(client.convertAsBinaryStream, config)
+            await asgi_response(send, binary, receive, filename='report.pdf')
+    """
+    headers = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+               for (name, value) in response_headers(binary, filename,
+                                                      content_type, inline)]
+    size = chunksize or binary.CHUNK
+    disconnected = asyncio.Event()
+
+    async def watch():
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                disconnected.set()
+                return
+
+    watcher = None
+    if receive is not None:
+        watcher = asyncio.ensure_future(watch())
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': headers,
+            })
+        while not disconnected.is_set():
+            chunk = await run_blocking(binary.read, size, executor=executor)
+            if not chunk:
+                break
+            await send({
+                'type': 'http.response.body',
+                'body': chunk,
+                'more_body': True,
+                })
+        if not disconnected.is_set():
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+        binary.close()
+
+
+async def _feed(sink, chunk):
+    result = sink.write(chunk)
+    if asyncio.iscoroutine(result) or isinstance(result, asyncio.Future):
+        await result
+    else:
+        drain = getattr(sink, 'drain', None)  # e.g. asyncio.StreamWriter
+        if drain is not None:
+            await drain()
+
+
+async def tee_binary(binary, *sinks, digests=('sha256', 'md5'),
+                     chunksize=None, executor=None):
+    """
+    Write the given BinaryResponse to all sinks, and return a dict
+    {name: hexdigest} of the given digests (and 'size': the number of bytes)
+
+    The sinks may have a plain write method (e.g. files), a coroutine
+    write method, or a write and a drain method (like asyncio.StreamWriter).
+    Every chunk is written to all sinks concurrently, and the next one read
+    (in an executor) only after the slowest sink has accepted it.
+    The BinaryResponse is closed in any case; the sinks are not.
+
+        binary = await run_blocking(client.getDocumentAsBinaryStream, docId)
+        sums = await tee_binary(binary, writer, upload)
+    """
+    hashes = new_digests(digests)
+    size = 0
+    chunksize = chunksize or binary.CHUNK
+    try:
+        while True:
+            chunk = await run_blocking(binary.read, chunksize,
+                                       executor=executor)
+            if not chunk:
+                break
+            size += len(chunk)
+            for digest in hashes.values():
+                digest.update(chunk)
+            await asyncio.gather(*[_feed(sink, chunk) for sink in sinks])
+    finally:
+        binary.close()
+    res = dict((name, digest.hexdigest())
+               for (name, digest) in hashes.items())
+    res['size'] = size
+    return res
+
+
+async def iterate_blocking(iterator, executor=None):
+    """
+    Turn a blocking iterator (e.g. a generator) into an async iterator;
+    every item is fetched in an executor.  The iterator is closed
+    (if possible) when the async iteration ends.
+
+    If the iteration is cancelled while an item is being fetched, the
+    iterator is closed (in the executor) when that is done; a generator
+    can't be closed while running.
+    """
+    loop = asyncio.get_running_loop()
+    lock = threading.Lock()  # held while the iterator runs
+
+    def fetch():
+        with lock:
+            return next(iterator, _END)
+
+    def close():
+        with lock:
+            iterator.close()
+
+    try:
+        while True:
+            item = await loop.run_in_executor(executor, fetch)
+            if item is _END:
+                return
+            yield item
+    finally:
+        if getattr(iterator, 'close', None) is not None:
+            if lock.acquire(False):
+                try:
+                    iterator.close()
+                finally:
+                    lock.release()
+            else:
+                loop.run_in_executor(executor, close)
+
+
+def rasterize_async(clients, config, pages, executor=None, **kwargs):
+    """
+    Like pdfreactor.raster.rasterize, but return an async iterator:
+
+        async for page, png in rasterize_async([client], config, [1, 2, 3]):
+            await send_preview(page, png)
+    """
+    return iterate_blocking(rasterize(clients, config, pages, **kwargs),
+                            executor)
@@ -50,6 +50,8 @@
 #     result)
 #   - New property ServerException.pdfreactor_says
 #     (after some strings used before when creating exceptions)
+#   - ServerException reads the body once (up to a size limit), and keeps
+#     a compact ErrorRecord (new property error_record)
 #   - UnreachableServiceException:
 #     - Arguments are now (Exception, URL) instead of the message text;
 #     - Instead of computing the message for creation, we do this work
@@ -58,34 +60,101 @@
 #       which occur after the urlopen call (try ... except ... else)
 # - other changes:
 #   - instead of monkey-patching the get_method method, use {Get,Delete}Request
-#     classes
+#     classes (now in the .transport module)
 #   - moved the (somewhat hidden) VERSION attribute up
 #   - removed unnecessary assignments to result and req variables
 #   - for missing subdicts (headers, cookies), use the dict.setdefault method
+#   - request processing (URL and apiKey, urlopen call, exception wrapping)
+#     deduplicated by the _service_url and _open methods
+# - new features:
+#   - optional gzip compression of request bodies (compress, compresslevel)
+#     and transparent decompression of gzip-encoded responses (decompress);
+#     the byte counts are collected in the stats attribute
+#   - pluggable transports (see the .transport module), e.g. for kept-alive
+#     connections or Unix domain sockets
+#   - thread-safe mode (threadsafe option): don't modify config and
+#     connectionSettings
+#   - session cookies of asynchronous conversions are kept by documentId
+#     (with expiry, domain and path) and applied automatically
+#   - timeouts (timeout option, connectionSettings['timeout']), and the
+#     waitForDocument method, which supports deadlines and cancellation
+#   - the submit method, which returns an AsyncJob (see the .jobs module)
+#   - convertAsBinaryStream and getDocumentAsBinaryStream methods, which
+#     return a BinaryResponse (see the .streams and .web modules)
+#   - spool option: return binary results as SpooledResult objects
+#   - convertToPath and getDocumentToPath methods (see the .download module);
+#     the latter can resume downloads using range requests
+#   - lazy option: JSON results as objects which decode on demand
+#   - binary document input (bytes or files), streamed as a base64 data URI
+#     (see the .inputs module)
+#   - capabilities option: version-dependent fast paths, and the supports
+#     method (see the .capabilities module)
+#   - the stream argument of convertAsBinary and getDocumentAsBinary
+#     can be a Tee, which writes to several sinks (see the .tee module)
+#   - the getProgresses method, which queries many documents at once
 
 import json
 import sys
+from threading import Thread
+from time import sleep
 
 if sys.version_info[0] == 2:
     from urllib2 import HTTPError
-    from urllib2 import Request, urlopen
     from Cookie import SimpleCookie
+    from Queue import Empty, Queue
 
 
     def _encoded(s):
         return s
 else:
     from urllib.error import HTTPError
-    from urllib.request import Request, urlopen
     from http.cookies import SimpleCookie
+    from queue import Empty, Queue
 
 
     def _encoded(s):
         # we reproduce the original behaviour here ...
         return s.encode()
 
+if sys.version_info[:2] < (3, 6):
+    # no chunked transfer encoding for iterable request bodies:
+    def _gzip_body(chunks):
+        return b''.join(chunks)
+else:
+    def _gzip_body(chunks):
+        return chunks
+
 from ._args import _sacs
-from .exceptions import ServerException, UnreachableServiceException
+from .capabilities import CapabilityCache
+from .compression import (
+    decoded_error_args,
+    decoded_response,
+    gzip_chunks,
+    is_gzip_encoded,
+    )
+from .defaults import default_compression, default_spool
+from .download import download_document, write_to_path
+from .exceptions import (
+    AbortedException,
+    PDFreactorWebserviceException,
+    ServerException,
+    UnreachableServiceException,
+    )
+from .inputs import streamed_body
+from .jobs import AsyncJob
+from .results import (
+    ConversionResult,
+    DocumentMetadata,
+    ProgressResult,
+    ProgressState,
+    SpooledResult,
+    _read_all,
+    )
+from .sessions import SessionStore
+from .stats import Counters
+from .streams import BinaryResponse
+from .timeouts import Deadline, Timeout
+from .transport import DeleteRequest, GetRequest, UrllibTransport
 
 __all__ = [
     'PDFreactor',  # the API object
@@ -95,14 +164,24 @@ __all__ = [
     ]
 
 
-class GetRequest(Request):
-    def get_method(self):
-        return 'get'
+def _has_header(headers, lkey):
+    for key in headers:
+        if key.lower() == lkey:
+            return True
+    return False
+
+
+def _header_values(info, name):
+    get_all = getattr(info, 'get_all', None)
+    if get_all is not None:
+        return get_all(name) or []
+    return info.getheaders(name)  # Python 2
 
 
-class DeleteRequest(Request):
-    def get_method(self):
-        return 'delete'
+def _total_deadline(timeout):
+    if timeout is None or timeout.total is None:
+        return None
+    return Deadline(timeout.total)
 
 
 class PDFreactor:
@@ -126,23 +205,113 @@ class PDFreactor:
             val = val.rstrip('/')
         self.__url = val
 
-    def __init__(self, url=None):
-        """Constructor"""
+    def __init__(self, url=None, compress=None, compresslevel=None,
+                 decompress=False, transport=None, threadsafe=False,
+                 timeout=None, spool=None, spooldir=None, lazy=False,
+                 capabilities=None):
+        """
+        Constructor
+
+        url -- the service URL (default: http://localhost:9423/service/rest)
+        compress -- gzip-compress request bodies of at least this many bytes;
+                    True for the default threshold, None or False to disable
+        compresslevel -- the zlib compression level (1..9) for request bodies
+        decompress -- send an "Accept-Encoding: gzip" header; compressed
+                      responses are decompressed transparently in any case
+        transport -- a pdfreactor.transport.Transport instance
+                     (default: a new UrllibTransport)
+        threadsafe -- if True, the given config and connectionSettings
+                      dicts are never modified, and the session cookies of
+                      asynchronous conversions are kept by the client
+                      (see below)
+        timeout -- the default timeout for all calls: a number of seconds,
+                   or a pdfreactor.timeouts.Timeout object; can be
+                   overridden per call by connectionSettings['timeout']
+        spool -- if given, convertAsBinary and getDocumentAsBinary return
+                 a pdfreactor.results.SpooledResult (unless given a stream)
+                 which is spilled to a temporary file above this size;
+                 True for the default threshold
+        spooldir -- the directory for these temporary files
+        lazy -- if True, convert, getDocument, getProgress and
+                getDocumentMetadata return result objects (see the
+                pdfreactor.results module) which parse the response,
+                and decode the document, on demand
+        capabilities -- a pdfreactor.capabilities.CapabilityCache (which
+                        may be shared by many clients), or True for a new
+                        one; enables the supports method, and fast paths
+                        depending on the service version (which is
+                        requested before the first request)
+
+        Thread-safe mode:
+
+        A client which is created with threadsafe=True can be shared
+        by many threads; so can the config and connectionSettings dicts
+        which are given to its methods:
+
+        - The config is overlaid by a shallow copy (which shares the
+          - possibly large - values) to add the client information.
+        - The request headers are built in a new dict.
+        - convertAsync doesn't store the session cookies in the given
+          connectionSettings; they are kept by documentId only
+          (in the `sessions` attribute; see the pdfreactor.sessions
+          module), and sent automatically with all requests concerning
+          that document, until deleteDocument is called for it.
+          This happens in any mode, but without thread-safe mode the
+          cookies are written to the given connectionSettings as well.
+
+        The transports of the pdfreactor.transport module, and the `stats`
+        counters, are safe to share between threads anyway.
+        """
         self.url = url  # the setter takes care of the default value
         self.__apiKey = None
+        self.compress = compress
+        if compresslevel is None:
+            compresslevel = default_compression['level']
+        self.compresslevel = compresslevel
+        self.decompress = decompress
+        self.stats = Counters()
+        if transport is None:
+            transport = UrllibTransport()
+        self.transport = transport
+        self.threadsafe = threadsafe
+        self.sessions = SessionStore()
+        self.timeout = Timeout.coerce(timeout)
+        if spool is True:
+            spool = default_spool['threshold']
+        self.spool = spool
+        self.spooldir = spooldir
+        self.lazy = lazy
+        if capabilities is True:
+            capabilities = CapabilityCache()
+        self.capabilities = capabilities
+
+    @property
+    def compress(self):
+        return self.__compress
+
+    @compress.setter
+    def compress(self, val):
+        if val is True:
+            val = default_compression['threshold']
+        elif val is False:
+            val = None
+        self.__compress = val
 
     VERSION = 8
 
     def _spiced_config(self, config):
         if config is None:
             config = {}
+        elif self.threadsafe:
+            config = dict(config)
         config.update({
             'clientName': "PYTHON",
             'clientVersion': PDFreactor.VERSION,
             })
         return config
 
-    def _spiced_headers(self, connectionSettings):
+    def _spiced_headers(self, connectionSettings, documentId=None,
+                        url=None):
         # In HTTP/1.x, header fields names are case-insensitive:
         # https://datatracker.ietf.org/doc/html/rfc7230#section-3.2 
         # In HTTP/2.0, they must be converted to lowercase:
@@ -156,7 +325,10 @@ class PDFreactor:
             }
         PRETTY_KEY = {key.lower(): key for key in API_HEADERS.keys()}
         missing = set(PRETTY_KEY)
-        headers = connectionSettings.setdefault('headers', {})
+        if self.threadsafe:
+            headers = dict(connectionSettings.get('headers') or ())
+        else:
+            headers = connectionSettings.setdefault('headers', {})
         for key, val in headers.items():
             lkey = key.lower()
             if lkey in missing:
@@ -169,223 +341,502 @@ class PDFreactor:
         # your client; for this to happen (e.g to make exports of restricted
         # contents of your server), specify config['cookies']
         # (a list of {'key': ..., 'value': ...} dictionaries) 
-        if 'cookies' in connectionSettings:
+        cookies = connectionSettings.get('cookies')
+        if documentId is not None:
+            # (the cookies which match the request URL)
+            session = self.sessions.cookies(documentId, url or self.url)
+            if session:
+                # explicitly given cookies take precedence:
+                cookies = dict(session, **(cookies or {}))
+                # (for this request only; not written to connectionSettings,
+                # where they would be sent for other documents as well)
+                headers = dict(headers)
+        if cookies is not None:
             headers['Cookie'] = '; '.join([
                     '%s=%s' % (key, value)
-                    for (key, value) in connectionSettings['cookies'].items()
+                    for (key, value) in cookies.items()
                     ])
         return headers
 
-    def convert(self, config, connectionSettings=None):
-        config = self._spiced_config(config)
-        headers = self._spiced_headers(connectionSettings)
-
-        url = self.url + "/convert.json"
-        if self.apiKey != None:
+    def _service_url(self, path):
+        url = self.url + path
+        if self.apiKey is not None:
             url += '?apiKey=' + self.apiKey
+        return url
+
+    def _timeout(self, connectionSettings):
+        """
+        Return the effective Timeout (or None) for a call
+        """
+        timeout = None
+        if connectionSettings is not None:
+            timeout = connectionSettings.get('timeout')
+        if timeout is None:
+            return self.timeout
+        return Timeout.coerce(timeout)
+
+    def _open(self, url, headers, config=None, method='POST',
+              timeout=None, deadline=None):
+        """
+        Send the request and return the (possibly decompressing) response
+
+        HTTP errors are raised as ServerExceptions; all other errors
+        which occur while talking to the service are wrapped as
+        UnreachableServiceExceptions.
+        The given headers dict is not modified.
+
+        The timeout values are limited by the given Deadline, if any.
+        """
+        caps = self._capabilities()
+        if timeout is not None:
+            timeout = timeout.limited(deadline)
+        stats = self.stats
+        extra = {}
+        threshold = self.compress
+        if caps is not None and caps.supports('gzip_requests') is False:
+            threshold = None
+        if (self.decompress and not _has_header(headers, 'accept-encoding')
+                and (caps is None
+                     or caps.supports('gzip_responses') is not False)):
+            extra['Accept-Encoding'] = 'gzip'
         try:
-            options = json.dumps(config)
-            req = Request(url, _encoded(options), headers)
-            response = urlopen(req)
+            body = streamed_body(config)
+            if body is not None:
+                # a binary document, streamed as a base64 data URI:
+                data = body
+                if threshold is not None and (body.length is None
+                                              or body.length >= threshold):
+                    extra['Content-Encoding'] = 'gzip'
+                    data = _gzip_body(gzip_chunks(body, self.compresslevel,
+                                                  counters=stats))
+                elif body.length is not None:
+                    extra['Content-Length'] = str(body.length)
+                    data = _gzip_body(body)
+                else:
+                    data = _gzip_body(iter(body))
+            elif config is None:
+                data = None
+            else:
+                data = _encoded(json.dumps(config))
+                if threshold is not None and len(data) >= threshold:
+                    extra['Content-Encoding'] = 'gzip'
+                    data = _gzip_body(gzip_chunks(data, self.compresslevel,
+                                                  counters=stats))
+            if extra:
+                headers = dict(headers, **extra)
+            response = self.transport.open(method, url, data, headers,
+                                           timeout)
         except HTTPError as e:
-            raise ServerException(e)
+            if e.code >= 500 and self.capabilities is not None:
+                self.capabilities.invalidate(self.url)
+            elif (e.code == 415 and caps is not None
+                  and 'Content-Encoding' in extra):
+                # (the request is not repeated; the next one isn't gzipped)
+                caps.learn('gzip_requests', False)
+            raise ServerException(*decoded_error_args(e, stats))
         except Exception as e:
+            if self.capabilities is not None:
+                self.capabilities.invalidate(self.url)
             raise UnreachableServiceException(e, url)
         else:
-            result = response.read().decode('utf-8')
-            return json.loads(result)
+            if caps is not None:
+                info = response.info()
+                accept = info.get('Accept-Ranges')
+                if accept is not None:
+                    caps.learn('ranges', accept.lower() == 'bytes')
+                if 'Accept-Encoding' in extra and is_gzip_encoded(info):
+                    caps.learn('gzip_responses', True)
+                if 'Content-Encoding' in extra:
+                    caps.learn('gzip_requests', True)
+            return decoded_response(response, stats)
+
+    def _capabilities(self):
+        """
+        Return the Capabilities of the service (requesting its version
+        before the first request), or None
+        """
+        if self.capabilities is None:
+            return None
+        return self.capabilities.discover(self)
+
+    def _json(self, response, lazy_class=None, deadline=None):
+        if lazy_class is not None and self.lazy:
+            return lazy_class.from_response(response, deadline)
+        result = _read_all(response, deadline).decode('utf-8')
+        return json.loads(result)
+
+    def _binary(self, response, stream, deadline=None):
+        if stream:
+            # the stream may prefer larger chunks (e.g. a pdfreactor.tee.Tee):
+            CHUNK = getattr(stream, 'CHUNK', 2 * 1024)
+            # (read1: the data received so far, to check the deadline)
+            read = getattr(response, 'read1', None) or response.read
+            try:
+                while True:
+                    chunk = read(CHUNK)
+                    if not chunk:
+                        break
+                    stream.write(chunk)
+                    if deadline is not None and deadline.expired():
+                        deadline.check()
+            except BaseException:
+                # e.g. stop the threads of a pdfreactor.tee.Tee:
+                abort = getattr(stream, 'abort', None)
+                if abort is not None:
+                    abort()
+                raise
+            finally:
+                response.close()
+            stream.close()
+            return None
+        elif self.spool is not None:
+            return SpooledResult.from_response(response, self.spool,
+                                               self.spooldir, deadline)
+        else:
+            return _read_all(response, deadline)
+
+    def _discard(self, documentId, connectionSettings=None):
+        """
+        Delete the given document on the server, ignoring errors
+        """
+        try:
+            self.deleteDocument(documentId, connectionSettings)
+        except PDFreactorWebserviceException:
+            pass
+
+    def convert(self, config, connectionSettings=None):
+        config = self._spiced_config(config)
+        headers = self._spiced_headers(connectionSettings)
+
+        url = self._service_url("/convert.json")
+        timeout = self._timeout(connectionSettings)
+        deadline = _total_deadline(timeout)
+        response = self._open(url, headers, config,
+                              timeout=timeout, deadline=deadline)
+        return self._json(response, ConversionResult, deadline)
 
     def convertAsBinary(self, config, *args, **kwargs):
         config = self._spiced_config(config)
         stream, connectionSettings = _sacs(*args, **kwargs)
         headers = self._spiced_headers(connectionSettings)
 
-        url = self.url + "/convert.bin"
-        if self.apiKey != None:
-            url += '?apiKey=' + self.apiKey
-        try:
-            options = json.dumps(config)
-            req = Request(url, _encoded(options), headers)
-            response = urlopen(req)
-        except HTTPError as e:
-            raise ServerException(e)
-        except Exception as e:
-            raise UnreachableServiceException(e, url)
-        else:
-            if stream:
-                CHUNK = 2 * 1024
-                while True:
-                    chunk = response.read(CHUNK)
-                    if not chunk:
-                        break
-                    stream.write(chunk)
-                stream.close()
-                return None
-            else:
-                result = response.read()
-                return result
+        url = self._service_url("/convert.bin")
+        timeout = self._timeout(connectionSettings)
+        deadline = _total_deadline(timeout)
+        response = self._open(url, headers, config,
+                              timeout=timeout, deadline=deadline)
+        return self._binary(response, stream, deadline)
+
+    def convertAsBinaryStream(self, config, connectionSettings=None):
+        """
+        Like convertAsBinary, but return a BinaryResponse
+        which yields the document chunk by chunk, as it arrives
+        (see the pdfreactor.streams module)
+        """
+        config = self._spiced_config(config)
+        headers = self._spiced_headers(connectionSettings)
+
+        url = self._service_url("/convert.bin")
+        timeout = self._timeout(connectionSettings)
+        deadline = _total_deadline(timeout)
+        response = self._open(url, headers, config,
+                              timeout=timeout, deadline=deadline)
+        return BinaryResponse(response, deadline)
+
+    def convertToPath(self, config, path, connectionSettings=None):
+        """
+        Convert, and write the result to the given file (atomically);
+        return a pdfreactor.download.DownloadReport
+        """
+        binary = self.convertAsBinaryStream(config, connectionSettings)
+        return self._write_to_path(binary, path)
+
+    def _write_to_path(self, binary, path, length=None):
+        report = write_to_path(binary, path, length)
+        self.stats.update_many(downloads=1,
+                               download_bytes=report.size)
+        return report
 
     def convertAsync(self, config, connectionSettings=None):
         config = self._spiced_config(config)
-        # w/o *given* connectionSettings, we lack a place to store cookies:
+        # the session cookies are kept in self.sessions; they are written
+        # to *given* connectionSettings as well (unless in thread-safe mode):
         have_cs = connectionSettings is not None
+        threadsafe = self.threadsafe
         headers = self._spiced_headers(connectionSettings)
 
-        url = self.url + "/convert/async.json"
-        if self.apiKey != None:
-            url += '?apiKey=' + self.apiKey
-        try:
-            options = json.dumps(config)
-            req = Request(url, _encoded(options), headers)
-            response = urlopen(req)
-        except HTTPError as e:
-            raise ServerException(e)
-        except Exception as e:
-            raise UnreachableServiceException(e, url)
-        else:
-            result = response.read().decode('utf-8')
+        url = self._service_url("/convert/async.json")
+        timeout = self._timeout(connectionSettings)
+        deadline = _total_deadline(timeout)
+        response = self._open(url, headers, config,
+                              timeout=timeout, deadline=deadline)
+        _read_all(response, deadline)
 
         documentId = None
         if response is not None and response.info() is not None:
             location = response.info().get("Location")
             if location is not None:
                 documentId = location[location.rfind("/") + 1:len(location)]
-            cookieHeader = response.info().get("Set-Cookie")
-            if cookieHeader is not None and have_cs:
+            cookieHeaders = _header_values(response.info(), "Set-Cookie")
+            if cookieHeaders and documentId is not None:
+                # applied automatically to all follow-up requests:
+                self.sessions.remember_set_cookie(documentId, cookieHeaders,
+                                                  self.url)
+            if cookieHeaders and have_cs and not threadsafe:
                 cookies = connectionSettings.setdefault('cookies', {})
                 cookiesObj = SimpleCookie()
-                cookiesObj.load(cookieHeader)
+                for cookieHeader in cookieHeaders:
+                    cookiesObj.load(cookieHeader)
                 for name in cookiesObj:
                     cookies[name] = cookiesObj[name].value
         return documentId
 
-    def getProgress(self, documentId, connectionSettings=None):
-        headers = self._spiced_headers(connectionSettings)
+    def submit(self, config, connectionSettings=None, journal=None):
+        """
+        Start an asynchronous conversion, and return an AsyncJob
 
-        url = self.url + "/progress/" + documentId + ".json"
-        if self.apiKey != None:
-            url += '?apiKey=' + self.apiKey
+        The job deletes the document on the server when closed;
+        use it as a context manager (see the pdfreactor.jobs module).
+        """
+        job = AsyncJob(self, config, connectionSettings, journal)
+        job.start()
+        return job
+
+    def getProgress(self, documentId, connectionSettings=None):
+        url = self._service_url("/progress/" + documentId + ".json")
+        headers = self._spiced_headers(connectionSettings, documentId, url)
+
+        timeout = self._timeout(connectionSettings)
+        deadline = _total_deadline(timeout)
+        response = self._open(url, headers, method='GET',
+                              timeout=timeout, deadline=deadline)
+        return self._json(response, ProgressResult, deadline)
+
+    def getProgresses(self, documentIds, connectionSettings=None,
+                      parallel=8):
+        """
+        Query the progress of many asynchronous conversions at once;
+        return a dict {documentId: ProgressState}
+
+        getProgress is called for each document, by up to `parallel`
+        threads (which share kept-alive connections if the transport is a
+        PooledTransport).
+
+        Errors (e.g. of failed conversions, or of deleted documents) are
+        stored in the `error` field of the respective ProgressState
+        rather than raised.
+        """
+        documentIds = list(documentIds)
+        states = {}
+        if documentIds:
+            states = self._parallel_progress(documentIds, connectionSettings,
+                                             parallel)
+        self.stats.update_many(progress_batches=1,
+                               progress_documents=len(documentIds))
+        return states
+
+    def _parallel_progress(self, documentIds, connectionSettings=None,
+                           parallel=8):
+        todo = Queue()
+        for documentId in documentIds:
+            todo.put(documentId)
+        states = {}
+
+        def work():
+            # the headers dict would be shared by the threads otherwise:
+            settings = dict(connectionSettings or ())
+            settings['headers'] = dict(settings.get('headers') or ())
+            while True:
+                try:
+                    documentId = todo.get_nowait()
+                except Empty:
+                    return
+                try:
+                    state = ProgressState.from_progress(
+                            self.getProgress(documentId, settings))
+                except PDFreactorWebserviceException as e:
+                    state = ProgressState.failed(e)
+                states[documentId] = state
+
+        count = min(parallel, len(documentIds))
+        if count <= 1:
+            work()
+            return states
+        workers = [Thread(target=work) for i in range(count)]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return states
+
+    def waitForDocument(self, documentId, connectionSettings=None,
+                        timeout=None, cancel=None, interval=0.5):
+        """
+        Poll the progress of an asynchronous conversion until it is finished,
+        and return the last progress dict
+
+        timeout -- the maximum time for the conversion, in seconds
+                   (default: the `total` value of the effective Timeout)
+        cancel -- a pdfreactor.timeouts.CancellationToken
+        interval -- the time between two getProgress calls
+
+        When the deadline is exceeded, or the conversion is cancelled,
+        polling stops, the document is deleted on the server (to free its
+        resources), and a TimeoutException or CancelledException is raised.
+        """
+        if timeout is None:
+            default = self._timeout(connectionSettings)
+            if default is not None:
+                timeout = default.total
+        deadline = Deadline(timeout)
+        poll_timeout = self._timeout(connectionSettings) or Timeout()
+        settings = dict(connectionSettings or ())
         try:
-            req = GetRequest(url, None, headers)
-            response = urlopen(req)
-        except HTTPError as e:
-            raise ServerException(e)
-        except Exception as e:
-            raise UnreachableServiceException(e, url)
-        else:
-            result = response.read().decode('utf-8')
-            return json.loads(result)
+            while True:
+                if cancel is not None:
+                    cancel.raise_if_cancelled(documentId)
+                deadline.check(documentId)
+                settings['timeout'] = poll_timeout.limited(deadline)
+                try:
+                    progress = self.getProgress(documentId, settings)
+                except UnreachableServiceException:
+                    deadline.check(documentId)
+                    raise
+                if progress.get('finished'):
+                    return progress
+                delay = interval
+                remaining = deadline.remaining()
+                if remaining is not None:
+                    delay = max(min(delay, remaining), 0)
+                if cancel is not None:
+                    cancel.wait(delay)
+                else:
+                    sleep(delay)
+        except AbortedException:
+            self._discard(documentId, connectionSettings)
+            raise
 
     def getDocument(self, documentId, connectionSettings=None):
-        headers = self._spiced_headers(connectionSettings)
+        url = self._service_url("/document/" + documentId + ".json")
+        headers = self._spiced_headers(connectionSettings, documentId, url)
 
-        url = self.url + "/document/" + documentId + ".json"
-        if self.apiKey != None:
-            url += '?apiKey=' + self.apiKey
-        try:
-            req = GetRequest(url, None, headers)
-            response = urlopen(req)
-        except HTTPError as e:
-            raise ServerException(e)
-        except Exception as e:
-            raise UnreachableServiceException(e, url)
-        else:
-            result = response.read().decode('utf-8')
-            return json.loads(result)
+        timeout = self._timeout(connectionSettings)
+        deadline = _total_deadline(timeout)
+        response = self._open(url, headers, method='GET',
+                              timeout=timeout, deadline=deadline)
+        return self._json(response, ConversionResult, deadline)
 
     def getDocumentAsBinary(self, documentId, *args, **kwargs):
         stream, connectionSettings = _sacs(*args, **kwargs)
-        headers = self._spiced_headers(connectionSettings)
-
-        url = self.url + "/document/" + documentId + ".bin"
-        if self.apiKey != None:
-            url += '?apiKey=' + self.apiKey
-        try:
-            req = GetRequest(url, None, headers)
-            response = urlopen(req)
-        except HTTPError as e:
-            raise ServerException(e)
-        except Exception as e:
-            raise UnreachableServiceException(e, url)
-        else:
-            if stream:
-                CHUNK = 2 * 1024
-                while True:
-                    chunk = response.read(CHUNK)
-                    if not chunk:
-                        break
-                    stream.write(chunk)
-                stream.close()
-                return None
-            else:
-                result = response.read()
-                return result
+        url = self._service_url("/document/" + documentId + ".bin")
+        headers = self._spiced_headers(connectionSettings, documentId, url)
+
+        timeout = self._timeout(connectionSettings)
+        deadline = _total_deadline(timeout)
+        response = self._open(url, headers, method='GET',
+                              timeout=timeout, deadline=deadline)
+        return self._binary(response, stream, deadline)
+
+    def getDocumentAsBinaryStream(self, documentId, connectionSettings=None):
+        """
+        Like getDocumentAsBinary, but return a BinaryResponse
+        (see convertAsBinaryStream)
+        """
+        url = self._service_url("/document/" + documentId + ".bin")
+        headers = self._spiced_headers(connectionSettings, documentId, url)
+
+        timeout = self._timeout(connectionSettings)
+        deadline = _total_deadline(timeout)
+        response = self._open(url, headers, method='GET',
+                              timeout=timeout, deadline=deadline)
+        return BinaryResponse(response, deadline)
+
+    def getDocumentToPath(self, documentId, path, connectionSettings=None,
+                          retries=0, parallel=1):
+        """
+        Write the converted document to the given file (atomically);
+        return a pdfreactor.download.DownloadReport
+
+        If the response doesn't tell the length of the document,
+        it is taken from the document metadata, if possible.
+
+        retries -- if > 0, resume the download (using range requests)
+                   after connection failures, up to that many times
+        parallel -- if > 1, fetch that many ranges concurrently
+                    (see pdfreactor.download.download_document)
+        """
+        if retries or parallel > 1:
+            report = download_document(self, documentId, path,
+                                       connectionSettings,
+                                       retries=retries, parallel=parallel)
+            self.stats.update_many(downloads=1,
+                                   download_bytes=report.size,
+                                   downloads_resumed=report.resumed)
+            return report
+        binary = self.getDocumentAsBinaryStream(documentId,
+                                                connectionSettings)
+        length = None
+        if binary.length is None:
+            try:
+                metadata = self.getDocumentMetadata(documentId,
+                                                    connectionSettings)
+            except PDFreactorWebserviceException:
+                metadata = None
+            if metadata is not None:  # a dict, or a DocumentMetadata
+                length = metadata.get('length')
+        return self._write_to_path(binary, path, length)
 
     def getDocumentMetadata(self, documentId, connectionSettings=None):
-        headers = self._spiced_headers(connectionSettings)
+        url = self._service_url("/document/metadata/" + documentId + ".json")
+        headers = self._spiced_headers(connectionSettings, documentId, url)
 
-        url = self.url + "/document/metadata/" + documentId + ".json"
-        if self.apiKey != None:
-            url += '?apiKey=' + self.apiKey
-        try:
-            req = GetRequest(url, None, headers)
-            response = urlopen(req)
-        except HTTPError as e:
-            raise ServerException(e)
-        except Exception as e:
-            raise UnreachableServiceException(e, url)
-        else:
-            result = response.read().decode('utf-8')
-            return json.loads(result)
+        timeout = self._timeout(connectionSettings)
+        deadline = _total_deadline(timeout)
+        response = self._open(url, headers, method='GET',
+                              timeout=timeout, deadline=deadline)
+        return self._json(response, DocumentMetadata, deadline)
 
     def deleteDocument(self, documentId, connectionSettings=None):
-        headers = self._spiced_headers(connectionSettings)
+        url = self._service_url("/document/" + documentId + ".json")
+        headers = self._spiced_headers(connectionSettings, documentId, url)
 
-        url = self.url + "/document/" + documentId + ".json"
-        if self.apiKey != None:
-            url += '?apiKey=' + self.apiKey
-        try:
-            req = DeleteRequest(url, None, headers)
-            response = urlopen(req)
-        except HTTPError as e:
-            raise ServerException(e)
-        except Exception as e:
-            raise UnreachableServiceException(e, url)
-        else:
-            result = response.read().decode('utf-8')
+        timeout = self._timeout(connectionSettings)
+        deadline = _total_deadline(timeout)
+        response = self._open(url, headers, method='DELETE',
+                              timeout=timeout, deadline=deadline)
+        _read_all(response, deadline)
+        self.sessions.forget(documentId)
 
     def getVersion(self, connectionSettings=None):
         headers = self._spiced_headers(connectionSettings)
 
-        url = self.url + "/version.json"
-        if self.apiKey != None:
-            url += '?apiKey=' + self.apiKey
-        try:
-            req = GetRequest(url, None, headers)
-            response = urlopen(req)
-        except HTTPError as e:
-            raise ServerException(e)
-        except Exception as e:
-            raise UnreachableServiceException(e, url)
-        else:
-            result = response.read().decode('utf-8')
-            return json.loads(result)
+        url = self._service_url("/version.json")
+        response = self._open(url, headers, method='GET',
+                              timeout=self._timeout(connectionSettings))
+        return self._json(response)
+
+    def supports(self, feature, connectionSettings=None):
+        """
+        Tell whether the service supports the given feature (see the
+        pdfreactor.capabilities module): True, False, or None if unknown
+
+        The version of the service is requested once (per cache lifetime);
+        this requires the capabilities option.
+        """
+        if self.capabilities is None:
+            raise ValueError('PDFreactor client created without'
+                             ' the capabilities option')
+        return self.capabilities.get(self, connectionSettings
+                                     ).supports(feature)
 
     def getStatus(self, connectionSettings=None):
         headers = self._spiced_headers(connectionSettings)
 
-        url = self.url + "/status"
-        if self.apiKey != None:
-            url += '?apiKey=' + self.apiKey
-        try:
-            req = GetRequest(url, None, headers)
-            response = urlopen(req)
-        except HTTPError as e:
-            raise ServerException(e)
-        except Exception as e:
-            raise UnreachableServiceException(e, url)
-        else:
-            result = response.read().decode('utf-8')
+        url = self._service_url("/status")
+        response = self._open(url, headers, method='GET',
+                              timeout=self._timeout(connectionSettings))
+        response.read()
 
     def getDocumentUrl(self, documentId):
         return self.url + "/document/" + documentId
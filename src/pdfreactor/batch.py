@@ -0,0 +1,395 @@
+"""
+pdfreactor.batch: the pdfreactor-batch command-line tool
+
+Convert many HTML documents, using one or more PDFreactor services:
+
+    pdfreactor-batch --url http://node1:9423/service/rest \\
+                     --url http://node2:9423/service/rest \\
+                     --config config.json --jobs 8 --output /exports \\
+                     /data/html
+
+The input is a directory (all *.html files below it are converted) or a
+manifest file, containing one input per line (a file name, relative to
+the manifest, or a URL), optionally followed by a tab and the output name;
+output names which occur more than once are numbered (see unique_targets).
+Input files are sent as they are (as base64 data URIs), so their encoding
+is detected by PDFreactor (e.g. from a meta element); --encoding tells it
+for files which don't specify it.
+
+Every output file is written atomically (see pdfreactor.download); every
+completed input is recorded in a checkpoint journal (by absolute path, or
+URL), so an interrupted run can simply be started again, from any working
+directory, and will skip the inputs done before.
+"""
+
+# Python compatibility:
+from __future__ import absolute_import, print_function
+
+import json
+import os
+import sys
+import threading
+from argparse import ArgumentParser
+
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+try:
+    from queue import Empty, Queue
+except ImportError:  # Python 2
+    from Queue import Empty, Queue
+
+from .api import PDFreactor
+from .inputs import BinaryDocument
+from .transport import PooledTransport
+
+__all__ = [
+    'main',
+    'Checkpoint',
+    'find_inputs',
+    'read_manifest',
+    'unique_targets',
+    ]
+
+JOURNAL_NAME = '.pdfreactor-batch.journal'
+
+
+def _is_url(spec):
+    return '://' in spec
+
+
+def output_name(relpath, suffix='.pdf'):
+    """
+    >>> output_name('chapter/intro.html')
+    'chapter/intro.pdf'
+    >>> output_name('http://example.com/report?id=1')
+    'report_id_1.pdf'
+    """
+    if _is_url(relpath):
+        relpath = relpath.split('://', 1)[1].rstrip('/').split('/')[-1]
+        relpath = ''.join(c if c.isalnum() or c in '-.' else '_'
+                          for c in relpath) or 'index'
+        return relpath + suffix
+    return os.path.splitext(relpath)[0] + suffix
+
+
+def find_inputs(directory, extensions=('.html', '.htm', '.xhtml'),
+                suffix='.pdf'):
+    """
+    Yield (input path, output name) tuples for the files below the directory;
+    the input paths are absolute
+    """
+    directory = os.path.abspath(directory)
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if os.path.splitext(name)[1].lower() in extensions:
+                path = os.path.join(dirpath, name)
+                yield path, output_name(os.path.relpath(path, directory),
+                                        suffix)
+
+
+def read_manifest(path, suffix='.pdf'):
+    """
+    Yield (input, output name) tuples from the given manifest file
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path) as fo:
+        for line in fo:
+            line = line.rstrip('\r\n')
+            if not line.strip() or line.lstrip().startswith('#'):
+                continue
+            if '\t' in line:
+                spec, target = line.split('\t', 1)
+            else:
+                spec, target = line, output_name(line, suffix)
+            spec = spec.strip()
+            if not _is_url(spec):
+                spec = os.path.join(base, spec)
+            yield spec, target.strip()
+
+
+def unique_targets(items):
+    """
+    Yield the given (input, output name) tuples, numbering the output
+    names which were used before
+
+    >>> for item in unique_targets([('http://a/x/index', 'index.pdf'),
+    ...                             ('http://b/y/index', 'index.pdf'),
+    ...                             ('a.html', 'a.pdf')]):
+    ...     item
+    ('http://a/x/index', 'index.pdf')
+    ('http://b/y/index', 'index-2.pdf')
+    ('a.html', 'a.pdf')
+
+    The numbers depend on the order of the inputs, which is stable
+    for a directory, and for an unchanged manifest.
+    """
+    seen = set()
+    for spec, target in items:
+        if os.path.normcase(target) in seen:
+            base, ext = os.path.splitext(target)
+            number = 2
+            while os.path.normcase('%s-%d%s' % (base, number, ext)) in seen:
+                number += 1
+            target = '%s-%d%s' % (base, number, ext)
+        seen.add(os.path.normcase(target))
+        yield spec, target
+
+
+class Checkpoint(object):
+    """
+    An append-only journal of completed inputs
+
+    Every line is "ok<TAB>input" or "failed<TAB>input<TAB>message";
+    lines are written with O_APPEND, so a killed run loses at most the
+    inputs in progress.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.done = set()
+        self.failed = {}
+        if os.path.exists(path):
+            with open(path) as fo:
+                for line in fo:
+                    fields = line.rstrip('\n').split('\t')
+                    if len(fields) < 2:  # a truncated last line
+                        continue
+                    if fields[0] == 'ok':
+                        self.done.add(fields[1])
+                        self.failed.pop(fields[1], None)
+                    elif fields[0] == 'failed':
+                        self.failed[fields[1]] = '\t'.join(fields[2:])
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                           0o644)
+
+    def _append(self, *fields):
+        line = '\t'.join(f.replace('\t', ' ').replace('\n', ' ')
+                         for f in fields) + '\n'
+        with self._lock:
+            os.write(self._fd, line.encode('utf-8'))
+
+    def ok(self, spec):
+        self._append('ok', spec)
+
+    def fail(self, spec, message):
+        self._append('failed', spec, message)
+
+    def close(self):
+        os.close(self._fd)
+
+
+class Progress(object):
+    """
+    Count completed items and bytes, and print throughput and ETA
+    (unless quiet)
+    """
+
+    def __init__(self, total, stream=None, interval=1.0, quiet=False):
+        self.total = total
+        self.stream = stream or sys.stderr
+        self.interval = interval
+        self.quiet = quiet
+        self.done = 0
+        self.failed = 0
+        self.bytes = 0
+        self.start = monotonic()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._tty = getattr(self.stream, 'isatty', lambda: False)()
+
+    def add(self, size=None):
+        with self._lock:
+            if size is None:
+                self.failed += 1
+            else:
+                self.done += 1
+                self.bytes += size
+
+    def line(self):
+        elapsed = monotonic() - self.start
+        count = self.done + self.failed
+        rate = count / elapsed if elapsed else 0.0
+        if rate and self.total:
+            eta = '%ds' % ((self.total - count) / rate)
+        else:
+            eta = '?'
+        return ('%d/%d done, %d failed, %.1f docs/s, %.1f MB/s, ETA %s'
+                % (count, self.total, self.failed, rate,
+                   self.bytes / 1e6 / elapsed if elapsed else 0.0, eta))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._print()
+
+    def _print(self, final=False):
+        if self.quiet:
+            return
+        if self._tty:
+            self.stream.write('\r' + self.line() + ('\n' if final else ''))
+        else:
+            self.stream.write(self.line() + '\n')
+        self.stream.flush()
+
+    def __enter__(self):
+        if not self.quiet:
+            thread = threading.Thread(target=self._run)
+            thread.daemon = True
+            thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._print(final=True)
+
+
+def _document(spec, encoding=None):
+    """
+    Return the document for the given input: the URL, or the contents of
+    the file (bytes, whatever their encoding) as a BinaryDocument
+    """
+    if _is_url(spec):
+        return spec
+    content_type = 'text/html'
+    if encoding:
+        content_type += ';charset=' + encoding
+    with open(spec, 'rb') as fo:
+        return BinaryDocument(fo.read(), content_type)
+
+
+def run(items, clients, config, outdir, checkpoint, jobs=4, progress=None,
+        encoding=None):
+    """
+    Convert the given (input, output name) items; return the number of
+    failures
+
+    encoding -- the encoding of the input files (default: detected by
+                PDFreactor)
+    """
+    todo = Queue()
+    for item in items:
+        todo.put(item)
+
+    def work(client):
+        while True:
+            try:
+                spec, target = todo.get_nowait()
+            except Empty:
+                return
+            path = os.path.join(outdir, target)
+            try:
+                cfg = dict(config)
+                cfg['document'] = _document(spec, encoding)
+                directory = os.path.dirname(path)
+                if not os.path.isdir(directory):
+                    try:
+                        os.makedirs(directory)
+                    except OSError:  # created concurrently
+                        pass
+                report = client.convertToPath(cfg, path)
+            except Exception as e:
+                checkpoint.fail(spec, '%s: %s' % (e.__class__.__name__, e))
+                if progress is not None:
+                    progress.add(None)
+            else:
+                checkpoint.ok(spec)
+                if progress is not None:
+                    progress.add(report.size)
+
+    workers = [threading.Thread(target=work,
+                                args=(clients[i % len(clients)],))
+               for i in range(jobs)]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    for worker in workers:
+        worker.join()
+    if progress is None:
+        return None
+    return progress.failed
+
+
+def parse_args(argv=None):
+    parser = ArgumentParser(
+        prog='pdfreactor-batch',
+        description='Convert many HTML documents to PDF, resumably')
+    add = parser.add_argument
+    add('input',
+        help='a directory of HTML files, or a manifest file')
+    add('--url', '-u', action='append', dest='urls', metavar='URL',
+        help='a PDFreactor service URL (may be given more than once;'
+        ' default: %s)' % PDFreactor().url)
+    add('--api-key', metavar='KEY',
+        help='the API key for the PDFreactor service(s)')
+    add('--config', '-c', metavar='FILE',
+        help='a JSON file containing the shared config')
+    add('--output', '-o', default='.', metavar='DIR',
+        help='the output directory (default: %(default)s)')
+    add('--jobs', '-j', type=int, default=4,
+        help='the number of concurrent conversions (default: %(default)s)')
+    add('--timeout', type=float, metavar='SECONDS',
+        help='the timeout of each conversion')
+    add('--encoding', metavar='CHARSET',
+        help="the encoding of input files which don't specify it"
+        ' (e.g. iso-8859-1; default: detected by PDFreactor)')
+    add('--suffix', default='.pdf',
+        help='the suffix of output files (default: %(default)s)')
+    add('--journal', metavar='FILE',
+        help='the checkpoint journal (default: %s in the output'
+        ' directory)' % JOURNAL_NAME)
+    add('--retry-failed', action='store_true',
+        help='convert inputs again which failed in a previous run')
+    add('--quiet', '-q', action='store_true',
+        help="don't print the progress")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = {}
+    if args.config:
+        with open(args.config) as fo:
+            config = json.load(fo)
+    if os.path.isdir(args.input):
+        items = find_inputs(args.input, suffix=args.suffix)
+    else:
+        items = read_manifest(args.input, suffix=args.suffix)
+    if not os.path.isdir(args.output):
+        os.makedirs(args.output)
+    checkpoint = Checkpoint(args.journal
+                            or os.path.join(args.output, JOURNAL_NAME))
+    skipped = 0
+    todo = []
+    for spec, target in unique_targets(items):
+        if spec in checkpoint.done or (spec in checkpoint.failed
+                                       and not args.retry_failed):
+            skipped += 1
+        else:
+            todo.append((spec, target))
+    clients = []
+    for url in args.urls or [None]:
+        client = PDFreactor(url, threadsafe=True, timeout=args.timeout,
+                            transport=PooledTransport(maxsize=args.jobs))
+        if args.api_key:
+            client.apiKey = args.api_key
+        clients.append(client)
+    if skipped and not args.quiet:
+        print('Skipping %d inputs done before' % skipped, file=sys.stderr)
+    progress = Progress(len(todo), quiet=args.quiet)
+    try:
+        with progress:
+            failed = run(todo, clients, config, args.output, checkpoint,
+                         args.jobs, progress, args.encoding)
+    finally:
+        checkpoint.close()
+        for client in clients:
+            client.transport.close()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""
+pdfreactor.capabilities: what the PDFreactor service (node) supports
+
+The client talks to PDFreactor versions 8 to 11, which differ in features.
+A CapabilityCache asks each service URL for its version (getVersion) once,
+keeps the answer for `ttl` seconds, and forgets it when requests to that
+service fail (e.g. because the node has been replaced by another version):
+
+    cache = CapabilityCache(ttl=3600, overrides={'gzip_requests': True})
+    client = PDFreactor(url, compress=True, capabilities=cache)
+    if client.supports('merge_documents'):
+        config['mergeDocuments'] = [...]
+
+A client created with a CapabilityCache requests the version of its
+service before its first request to it (once per cache lifetime; if this
+fails, the request is sent nevertheless, and the version is requested again
+after `retry` seconds), and uses the capabilities to enable or disable
+optional fast paths, e.g. gzip-compressed request bodies only for services
+which accept them.  Features which are unknown (None) don't change
+anything: the client behaves as configured.
+
+The features of the REST API version 8, which this client implements, are
+derived from the version (FEATURES).  The compression of requests and
+responses depends on the configuration of the service (or of a proxy in
+front of it) rather than on its version; so these features are learned
+from the responses (like 'ranges', from the Accept-Ranges header of
+document downloads), unless declared per cache (overrides=...).
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+from threading import Lock, local
+
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+__all__ = [
+    'Capabilities',
+    'CapabilityCache',
+    'FEATURES',
+    ]
+
+# feature --> minimum (major, minor) version, or None if not derived from
+# the version (but learned from responses, or declared by overrides):
+FEATURES = {
+    'async':             (8, 0),
+    'binary_documents':  (8, 0),  # data URIs as documents
+    'merge_documents':   (8, 0),
+    'callbacks':         (8, 0),
+    'document_metadata': (8, 0),
+    'gzip_responses':    None,
+    'gzip_requests':     None,
+    }
+
+
+class Capabilities(object):
+    """
+    The version and features of a PDFreactor service
+
+    >>> caps = Capabilities({'major': 10, 'minor': 2, 'micro': 0,
+    ...                      'label': '10.2.0'})
+    >>> caps
+    <Capabilities 10.2.0>
+    >>> caps.supports('merge_documents'), caps.supports('gzip_requests')
+    (True, None)
+    >>> caps.supports('ranges') is None  # unknown (yet)
+    True
+    >>> caps.learn('ranges', True)
+    >>> sorted(caps.features)  # doctest: +NORMALIZE_WHITESPACE
+    ['async', 'binary_documents', 'callbacks', 'document_metadata',
+     'merge_documents', 'ranges']
+    """
+    __slots__ = ('version', 'major', 'minor', 'label',
+                 '_known', 'created')
+
+    def __init__(self, version, overrides=None):
+        self.version = version
+        self.major = int(version.get('major') or 0)
+        self.minor = int(version.get('minor') or 0)
+        self.label = (version.get('label')
+                      or '%d.%d' % (self.major, self.minor))
+        known = {}
+        for feature, minimum in FEATURES.items():
+            if minimum is not None:
+                known[feature] = (self.major, self.minor) >= minimum
+        if overrides:
+            known.update(overrides)
+        self._known = known
+        self.created = monotonic()
+
+    @property
+    def features(self):
+        """
+        The set of supported features
+        """
+        return frozenset(feature for (feature, value) in self._known.items()
+                         if value)
+
+    def supports(self, feature):
+        """
+        Return True or False, or None if unknown
+        """
+        return self._known.get(feature)
+
+    def learn(self, feature, value):
+        self._known[feature] = value
+
+    def __repr__(self):
+        return '<%s %s>' % (self.__class__.__name__, self.label)
+
+
+class CapabilityCache(object):
+    """
+    Capabilities by service URL, fetched once (per ttl seconds)
+
+    ttl -- the lifetime of cache entries, in seconds (None: unlimited)
+    overrides -- a dict {feature: bool} for all services
+    retry -- the time after which the version of a service is requested
+             again by discover, if the request failed
+
+    >>> class Client(object):
+    ...     url = 'http://node1:9423/service/rest'
+    ...     def getVersion(self, connectionSettings=None):
+    ...         return {'major': 8, 'minor': 1, 'label': '8.1'}
+    >>> cache = CapabilityCache(overrides={'gzip_requests': True})
+    >>> cache.peek(Client.url) is None
+    True
+    >>> caps = cache.discover(Client())
+    >>> caps, caps.supports('gzip_requests')
+    (<Capabilities 8.1>, True)
+    >>> cache.peek(Client.url) is caps
+    True
+    """
+
+    def __init__(self, ttl=3600, overrides=None, retry=60):
+        self.ttl = ttl
+        self.overrides = overrides
+        self.retry = retry
+        self._entries = {}
+        self._lock = Lock()
+        self._fetching = {}
+        self._failed = {}
+        self._local = local()
+
+    def peek(self, url):
+        """
+        Return the cached Capabilities, or None (without any request)
+        """
+        caps = self._entries.get(url)
+        if caps is None:
+            return None
+        if self.ttl is not None and monotonic() - caps.created > self.ttl:
+            self.invalidate(url)
+            return None
+        return caps
+
+    def get(self, client, connectionSettings=None):
+        """
+        Return the Capabilities of the client's service, calling getVersion
+        if not cached; concurrent callers wait for a single request
+        """
+        url = client.url
+        caps = self.peek(url)
+        if caps is not None:
+            return caps
+        with self._lock:
+            lock = self._fetching.setdefault(url, Lock())
+        with lock:
+            caps = self.peek(url)
+            if caps is None:
+                # the version request doesn't discover (see below); it
+                # would wait for the lock held by this thread otherwise:
+                fetching = getattr(self._local, 'fetching', False)
+                self._local.fetching = True
+                try:
+                    version = client.getVersion(connectionSettings)
+                finally:
+                    self._local.fetching = fetching
+                caps = Capabilities(version, self.overrides)
+                with self._lock:
+                    self._entries[url] = caps
+                    self._failed.pop(url, None)
+        return caps
+
+    def discover(self, client):
+        """
+        Return the Capabilities of the client's service, calling getVersion
+        if not cached (once per `retry` seconds, if failing); used by the
+        client before its requests.  Errors are not raised; None is
+        returned if the capabilities are not available (yet).
+        """
+        url = client.url
+        caps = self.peek(url)
+        if caps is not None or getattr(self._local, 'fetching', False):
+            # (the getVersion request itself doesn't wait for them)
+            return caps
+        failed = self._failed.get(url)
+        if failed is not None and monotonic() - failed < self.retry:
+            return None
+        try:
+            return self.get(client)
+        except Exception:
+            self._failed[url] = monotonic()
+            return None
+
+    def learn(self, url, feature, value):
+        """
+        Record a feature learned from a response (if the service is known)
+        """
+        caps = self._entries.get(url)
+        if caps is not None and caps.supports(feature) != value:
+            caps.learn(feature, value)
+
+    def invalidate(self, url=None):
+        """
+        Forget the capabilities of the given service (default: of all)
+        """
+        with self._lock:
+            if url is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(url, None)
@@ -0,0 +1,207 @@
+"""
+pdfreactor.compression: gzip support for request and response bodies
+
+Request bodies (the JSON-encoded configuration) are compressed chunk by chunk
+by the gzip_chunks generator; gzip-encoded responses are wrapped by the
+decoded_response function, which decompresses them while they are read.
+"""
+
+import zlib
+
+from .defaults import default_compression
+
+__all__ = [
+    'gzip_chunks',
+    'decoded_response',
+    'decoded_error_args',
+    'GzipDecodingResponse',
+    ]
+
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+GZIP_ENCODINGS = frozenset(['gzip', 'x-gzip'])
+
+
+def gzip_chunks(data, level=None, chunksize=None, counters=None):
+    """
+    Generate the gzip-compressed form of the given data (bytes, or an
+    iterable of bytes chunks), chunk by chunk
+
+    >>> data = b'<p>Some highly compressible text</p>' * 1000
+    >>> compressed = b''.join(gzip_chunks(data, chunksize=4096))
+    >>> len(compressed) < len(data) // 10
+    True
+    >>> zlib.decompress(compressed, GZIP_WBITS) == data
+    True
+
+    If a Counters object is given, the byte counts are recorded
+    when the data is completely consumed:
+    >>> from pdfreactor.stats import Counters
+    >>> c = Counters()
+    >>> compressed = b''.join(gzip_chunks(data, counters=c))
+    >>> c['request_bytes_raw'], c['requests_compressed']
+    (36000, 1)
+    >>> c['request_bytes_saved'] == 36000 - len(compressed)
+    True
+    """
+    if level is None:
+        level = default_compression['level']
+    if chunksize is None:
+        chunksize = default_compression['chunksize']
+    compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+    sent = 0
+    raw = 0
+    if isinstance(data, bytes):
+        pieces = (data[offset:offset+chunksize]
+                  for offset in range(0, len(data), chunksize))
+    else:  # an iterable of chunks (e.g. a pdfreactor.inputs.JSONBody)
+        pieces = data
+    for piece in pieces:
+        raw += len(piece)
+        chunk = compressor.compress(piece)
+        if chunk:
+            sent += len(chunk)
+            yield chunk
+    chunk = compressor.flush()
+    sent += len(chunk)
+    yield chunk
+    if counters is not None:
+        counters.update_many(requests_compressed=1,
+                             request_bytes_raw=raw,
+                             request_bytes_sent=sent,
+                             request_bytes_saved=raw - sent)
+
+
+def is_gzip_encoded(headers):
+    if headers is None:
+        return False
+    encoding = headers.get('Content-Encoding')
+    return bool(encoding) and encoding.strip().lower() in GZIP_ENCODINGS
+
+
+def decoded_response(response, counters=None):
+    """
+    Return the given response, or a decompressing wrapper if gzip-encoded
+    """
+    if is_gzip_encoded(response.info()):
+        return GzipDecodingResponse(response, counters)
+    return response
+
+
+def decoded_error_args(e, counters=None):
+    """
+    Return the arguments to create a ServerException from the given HTTPError
+
+    For gzip-encoded error responses, the body is decompressed when read.
+    """
+    fp = e.fp
+    if fp is not None and is_gzip_encoded(e.hdrs):
+        # we read through the original HTTPError, which would close its file
+        # when garbage-collected:
+        fp = GzipDecodingResponse(e, counters)
+    return e.url, e.code, e.msg, e.hdrs, fp
+
+
+class GzipDecodingResponse(object):
+    """
+    Wrap a gzip-encoded response and decompress it while reading
+
+    >>> from io import BytesIO
+    >>> data = b'%PDF-1.4 ' + b'0123456789' * 10000
+    >>> raw = BytesIO(b''.join(gzip_chunks(data)))
+    >>> resp = GzipDecodingResponse(raw)
+    >>> resp.read(9)
+    b'%PDF-1.4 '
+    >>> len(resp.read(20000))
+    20000
+    >>> len(resp.read())
+    80000
+    >>> resp.read(1)
+    b''
+    >>> resp = GzipDecodingResponse(BytesIO(b''.join(gzip_chunks(data))))
+    >>> resp.read1(4), len(resp.read())
+    (b'%PDF', 100005)
+    """
+
+    CHUNK = 16 * 1024
+    length = None  # the decoded length is unknown
+
+    def __init__(self, response, counters=None):
+        self._response = response
+        # (returns the data received so far, if possible):
+        self._read = getattr(response, 'read1', None) or response.read
+        self._counters = counters
+        self._decompressor = zlib.decompressobj(GZIP_WBITS)
+        self._buffer = b''
+        self._eof = False
+        self._received = 0
+        self._decoded = 0
+
+    def _fill(self, amt):
+        decompressor = self._decompressor
+        data = decompressor.unconsumed_tail
+        if not data:
+            data = self._read(self.CHUNK)
+            if not data:
+                chunk = decompressor.flush()
+                self._decoded += len(chunk)
+                self._finish()
+                return chunk
+            self._received += len(data)
+        chunk = decompressor.decompress(data, max(amt, self.CHUNK))
+        self._decoded += len(chunk)
+        return chunk
+
+    def _finish(self):
+        if self._eof:
+            return
+        self._eof = True
+        if self._counters is not None:
+            self._counters.update_many(
+                    responses_decompressed=1,
+                    response_bytes_received=self._received,
+                    response_bytes_decoded=self._decoded)
+
+    def read(self, amt=None):
+        if amt is None or amt < 0:
+            parts = [self._buffer]
+            self._buffer = b''
+            while not self._eof:
+                parts.append(self._fill(self.CHUNK))
+            return b''.join(parts)
+        buf = self._buffer
+        while len(buf) < amt and not self._eof:
+            buf += self._fill(amt - len(buf))
+        self._buffer = buf[amt:]
+        return buf[:amt]
+
+    def read1(self, amt=-1):
+        """
+        Read up to amt bytes, without waiting for more than the next
+        decompressed data
+        """
+        if amt is None or amt < 0:
+            amt = self.CHUNK
+        buf = self._buffer
+        while not buf and not self._eof:
+            buf = self._fill(amt)
+        self._buffer = buf[amt:]
+        return buf[:amt]
+
+    def info(self):
+        return self._response.info()
+
+    @property
+    def headers(self):
+        return self._response.info()
+
+    def getcode(self):
+        return self._response.getcode()
+
+    def geturl(self):
+        return self._response.geturl()
+
+    def close(self):
+        self._response.close()
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
@@ -12,3 +12,17 @@ default_config = {
     'disableLinks': False,
     }
 
+default_compression = {
+    'threshold': 8 * 1024,  # compress request bodies of at least this size
+    'level':     6,         # zlib compression level
+    'chunksize': 64 * 1024, # the compressed body is sent in chunks
+    }
+
+default_spool = {
+    'threshold': 8 * 1024 * 1024,  # spill binary results to a file above
+    }
+
+default_errors = {
+    'max_body': 32 * 1024,  # read error response bodies up to this size
+    'excerpt':  200,        # characters of the body kept for messages
+    }
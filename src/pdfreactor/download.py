@@ -0,0 +1,517 @@
+"""
+pdfreactor.download: write binary results to files efficiently
+
+The PDFreactor methods convertToPath and getDocumentToPath write the
+document to a temporary file next to the target, which is renamed
+into place when complete (so readers never see partial files).
+
+If the length is known in advance (from the Content-Length header, or the
+document metadata), the file is preallocated, and written through a memory
+map; otherwise, large sequential writes are used. In both cases the data
+is flushed to disk (fsync) before the rename.
+
+Both methods return a DownloadReport:
+
+    report = client.getDocumentToPath(documentId, '/exports/report.pdf')
+    print('%(size)d bytes, %(throughput).0f bytes/s' % report.as_dict())
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import mmap
+import os
+import re
+from tempfile import mkstemp
+from threading import Thread
+
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+try:
+    from os import replace as _replace
+except ImportError:  # Python 2
+    from os import rename as _replace
+
+try:
+    from http.client import HTTPException
+except ImportError:  # Python 2
+    from httplib import HTTPException
+
+from .exceptions import ServerException, UnreachableServiceException
+from .results import _file_mode
+
+__all__ = [
+    'DownloadReport',
+    'write_to_path',
+    'download_document',
+    'IncompleteDownload',
+    ]
+
+WRITE_SIZE = 1024 * 1024
+
+
+class DownloadReport(object):
+    """
+    Information about a completed download
+
+    >>> r = DownloadReport('/tmp/x.pdf', 2000000, 0.5, True)
+    >>> r.throughput
+    4000000.0
+    >>> r
+    <DownloadReport /tmp/x.pdf: 2000000 bytes in 0.500 s (4.0 MB/s)>
+    """
+    __slots__ = ('path', 'size', 'seconds', 'preallocated', 'resumed')
+
+    def __init__(self, path, size, seconds, preallocated=False, resumed=0):
+        self.path = path
+        self.size = size
+        self.seconds = seconds
+        self.preallocated = preallocated
+        self.resumed = resumed  # the number of resumed (or restarted) reads
+
+    @property
+    def throughput(self):
+        """
+        bytes per second
+        """
+        if not self.seconds:
+            return None
+        return self.size / float(self.seconds)
+
+    def as_dict(self):
+        return {
+            'path': self.path,
+            'size': self.size,
+            'seconds': self.seconds,
+            'preallocated': self.preallocated,
+            'resumed': self.resumed,
+            'throughput': self.throughput,
+            }
+
+    def __repr__(self):
+        throughput = self.throughput
+        rate = ('%.1f MB/s' % (throughput / 1e6) if throughput is not None
+                else 'n/a')
+        return ('<%s %s: %d bytes in %.3f s (%s)>'
+                % (self.__class__.__name__, self.path, self.size,
+                   self.seconds, rate))
+
+
+def _preallocate(fd, length):
+    fallocate = getattr(os, 'posix_fallocate', None)
+    if fallocate is not None:
+        try:
+            fallocate(fd, 0, length)
+            return
+        except OSError:  # e.g. not supported by the file system
+            pass
+    os.ftruncate(fd, length)
+
+
+def _fsync_dir(path):
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:  # e.g. on Windows
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _write_mapped(fd, read, length, chunksize):
+    written = 0
+    if not length:
+        if read(1):
+            raise ValueError('Received more data than announced (0 bytes)')
+        return written
+    mm = mmap.mmap(fd, length)
+    try:
+        while True:
+            chunk = read(chunksize)
+            if not chunk:
+                break
+            end = written + len(chunk)
+            if end > length:
+                raise ValueError('Received more data than announced'
+                                 ' (%d bytes)' % (length,))
+            mm[written:end] = chunk
+            written = end
+        mm.flush()
+    finally:
+        mm.close()
+    return written
+
+
+def _write_sequential(fd, read, chunksize):
+    written = 0
+    pending = []
+    pending_size = 0
+    while True:
+        chunk = read(chunksize)
+        if chunk:
+            pending.append(chunk)
+            pending_size += len(chunk)
+            if pending_size < WRITE_SIZE:
+                continue
+        if pending:
+            data = b''.join(pending)
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+            written += len(data)
+            pending = []
+            pending_size = 0
+        if not chunk:
+            return written
+
+
+def _temporary(path):
+    """
+    Create a temporary file next to the given path; return (fd, name)
+
+    The name is unique, so several threads (or processes) can download
+    to the same target; the last one to finish wins.
+    """
+    dirname, basename = os.path.split(os.path.abspath(path))
+    fd, tmp = mkstemp(prefix=basename + '.', suffix='.part', dir=dirname)
+    try:
+        os.chmod(tmp, _file_mode() & 0o644)
+    except BaseException:
+        os.close(fd)
+        os.unlink(tmp)
+        raise
+    return fd, tmp
+
+
+def write_to_path(binary, path, length=None, chunksize=None, fsync=True):
+    """
+    Write the given BinaryResponse to the given path, atomically
+
+    length -- the expected size; default: binary.length (if known)
+
+    The BinaryResponse is closed in any case.
+    """
+    if length is None:
+        length = binary.length
+    if chunksize is None:
+        chunksize = binary.CHUNK
+    start = monotonic()
+    fd, tmp = _temporary(path)
+    try:
+        try:
+            if length is not None:
+                _preallocate(fd, length)
+                written = _write_mapped(fd, binary.read, length, chunksize)
+                if written != length:
+                    raise ValueError('Received %d bytes instead of %d'
+                                     % (written, length))
+            else:
+                written = _write_sequential(fd, binary.read, chunksize)
+            if fsync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+            binary.close()
+        _replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    if fsync:
+        _fsync_dir(path)
+    return DownloadReport(path, written, monotonic() - start,
+                          length is not None)
+
+
+# ----------------------------------------- [ resumable downloads ... [
+class IncompleteDownload(IOError):
+    """
+    The connection ended before all announced data was received
+    """
+
+
+class _RangesIgnored(Exception):
+    """
+    The server answered a range request by a complete response
+    """
+
+
+# errors which are worth another (range) request:
+RETRYABLE = (UnreachableServiceException, HTTPException, IOError, OSError)
+
+CONTENT_RANGE = re.compile(r'^\s*bytes\s+(\d+)-(\d+)/(\d+|\*)\s*$')
+
+
+def parse_content_range(value):
+    """
+    Return (first, last, total) from a Content-Range header value
+
+    >>> parse_content_range('bytes 100-199/1000')
+    (100, 199, 1000)
+    >>> parse_content_range('bytes 0-9/*')
+    (0, 9, None)
+    >>> parse_content_range('items 1-2/3')
+    """
+    mo = CONTENT_RANGE.match(value or '')
+    if mo is None:
+        return None
+    first, last, total = mo.groups()
+    return int(first), int(last), (None if total == '*' else int(total))
+
+
+def _validator(binary):
+    """
+    The value for If-Range requests: a strong ETag, or the Last-Modified date
+    """
+    etag = binary.headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return binary.headers.get('Last-Modified')
+
+
+class _Downloader(object):
+    """
+    Download a document using range requests to resume after failures
+    """
+
+    def __init__(self, client, documentId, connectionSettings, retries,
+                 chunksize):
+        self.client = client
+        self.documentId = documentId
+        self.settings = dict(connectionSettings or ())
+        self.retries = retries
+        self.chunksize = chunksize
+        self.validator = None
+        self.resumed = 0
+
+    def ranges(self):
+        """
+        Does the service support ranges?  None if unknown
+        (see pdfreactor.capabilities)
+        """
+        cache = getattr(self.client, 'capabilities', None)
+        if cache is None:
+            return None
+        caps = cache.peek(self.client.url)
+        return caps and caps.supports('ranges')
+
+    def open(self, start=0, end=None):
+        """
+        Request the document (from start to end, exclusive)
+        """
+        if (start or end is not None) and self.ranges() is False:
+            raise _RangesIgnored()
+        headers = dict(self.settings.get('headers') or ())
+        # ranges refer to the transferred bytes; we need the identity:
+        headers['Accept-Encoding'] = 'identity'
+        if start or end is not None:
+            headers['Range'] = 'bytes=%d-%s' % (
+                    start, '' if end is None else end - 1)
+            if self.validator:
+                headers['If-Range'] = self.validator
+        settings = dict(self.settings, headers=headers)
+        binary = self.client.getDocumentAsBinaryStream(self.documentId,
+                                                       settings)
+        if start or end is not None:
+            crange = None
+            if binary.status == 206:
+                crange = parse_content_range(
+                        binary.headers.get('Content-Range'))
+            if crange is None or crange[0] != start:
+                binary.close()
+                raise _RangesIgnored()
+        return binary
+
+    def _failed(self, attempts):
+        if attempts > self.retries:
+            return False
+        self.resumed += 1
+        return True
+
+    def single(self, fd, binary):
+        """
+        Write the document sequentially; return the number of bytes
+        """
+        offset = 0
+        attempts = 0
+        length = binary.length
+        self.validator = _validator(binary)
+        while True:
+            try:
+                if binary is None:
+                    try:
+                        binary = self.open(offset)
+                    except _RangesIgnored:
+                        # start over:
+                        offset = 0
+                        os.ftruncate(fd, 0)
+                        binary = self.open()
+                        length = binary.length
+                        self.validator = _validator(binary)
+                os.lseek(fd, offset, os.SEEK_SET)
+                try:
+                    for chunk in _chunks(binary, self.chunksize):
+                        view = memoryview(chunk)
+                        while view:
+                            view = view[os.write(fd, view):]
+                        offset += len(chunk)
+                finally:
+                    binary.close()
+                    binary = None
+                if length is not None and offset < length:
+                    raise IncompleteDownload('Received %d of %d bytes'
+                                             % (offset, length))
+                return offset
+            except ServerException as e:
+                if e.code != 416:  # Range Not Satisfiable
+                    raise
+                attempts += 1
+                if not self._failed(attempts):
+                    raise
+                offset = 0
+                os.ftruncate(fd, 0)
+            except RETRYABLE:
+                attempts += 1
+                if not self._failed(attempts):
+                    raise
+                # a content-encoded first response can't be resumed:
+                if length is None and offset:
+                    offset = 0
+                    os.ftruncate(fd, 0)
+
+    def part(self, mm, start, end, binary=None):
+        """
+        Write the given range of the document into the memory map
+        """
+        pos = start
+        attempts = 0
+        while pos < end:
+            try:
+                if binary is None:
+                    binary = self.open(pos, end)
+                try:
+                    while pos < end:
+                        chunk = binary.read(min(self.chunksize, end - pos))
+                        if not chunk:
+                            raise IncompleteDownload('Range %d-%d incomplete'
+                                                     % (start, end - 1))
+                        mm[pos:pos+len(chunk)] = chunk
+                        pos += len(chunk)
+                finally:
+                    binary.close()
+                    binary = None
+            except ServerException:
+                raise
+            except RETRYABLE:
+                attempts += 1
+                if not self._failed(attempts):
+                    raise
+
+    def parallel(self, fd, binary, parallel):
+        """
+        Fetch `parallel` ranges concurrently into the preallocated file
+        """
+        length = binary.length
+        self.validator = _validator(binary)
+        _preallocate(fd, length)
+        size = -(-length // parallel)
+        bounds = [(start, min(start + size, length))
+                  for start in range(0, length, size)]
+        mm = mmap.mmap(fd, length)
+        errors = []
+
+        def fetch(start, end, binary=None):
+            try:
+                self.part(mm, start, end, binary)
+            except BaseException as e:
+                errors.append(e)
+
+        try:
+            threads = [Thread(target=fetch, args=bound)
+                       for bound in bounds[1:]]
+            for thread in threads:
+                thread.daemon = True
+                thread.start()
+            # the first range is read from the initial response:
+            fetch(bounds[0][0], bounds[0][1], binary)
+            for thread in threads:
+                thread.join()
+            mm.flush()
+        finally:
+            mm.close()
+        if errors:
+            raise errors[0]
+        return length
+
+
+def _chunks(binary, chunksize):
+    read = binary.read
+    while True:
+        chunk = read(chunksize)
+        if not chunk:
+            return
+        yield chunk
+
+
+def download_document(client, documentId, path, connectionSettings=None,
+                      retries=3, parallel=1, chunksize=None, fsync=True):
+    """
+    Download the converted document to the given path, atomically,
+    resuming with HTTP range requests after connection failures
+
+    retries -- the maximum number of resumed requests (per range)
+    parallel -- fetch that many ranges concurrently, if the length of
+                the document is known and the server supports ranges
+
+    If the server ignores range requests (or the document changed, according
+    to its ETag or Last-Modified header), the download starts over.
+    """
+    downloader = _Downloader(client, documentId, connectionSettings,
+                             retries, chunksize or 64 * 1024)
+    start = monotonic()
+    binary = downloader.open()
+    preallocated = False
+    try:
+        fd, tmp = _temporary(path)
+    except BaseException:
+        binary.close()
+        raise
+    try:
+        try:
+            accept = (binary.headers.get('Accept-Ranges') or '').lower()
+            if (parallel > 1 and binary.length and accept == 'bytes'
+                    and _validator(binary)):
+                try:
+                    written = downloader.parallel(fd, binary, parallel)
+                    preallocated = True
+                except _RangesIgnored:
+                    os.ftruncate(fd, 0)
+                    written = downloader.single(fd, downloader.open())
+                    preallocated = False
+            else:
+                written = downloader.single(fd, binary)
+            if fsync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+            binary.close()
+        _replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    if fsync:
+        _fsync_dir(path)
+    return DownloadReport(path, written, monotonic() - start,
+                          preallocated, downloader.resumed)
+# ----------------------------------------- ] ... resumable downloads ]
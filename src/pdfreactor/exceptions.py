@@ -7,20 +7,32 @@ Hierarchy:
    `- PDFreactorWebserviceException     (base for this package)
       |- ClientException
       |  |- InvalidServiceException
-      |  `- UnreachableServiceException
+      |  |- UnreachableServiceException
+      |  |- QuotaExceededException
+      |  `- AbortedException
+      |     |- TimeoutException
+      |     `- CancelledException
       |
       |  .----- urllib.error.HTTPError
       `- ServerException
 
-Currently we use only ServerException and UnreachableServiceException actively.
+Currently we use ServerException and UnreachableServiceException actively,
+TimeoutException and CancelledException for deadlines and cancellation
+(see the pdfreactor.timeouts module), and QuotaExceededException for local
+per-tenant quotas (see the pdfreactor.tenants module).
 The subclasses of ServerException (from the Java API) have been removed;
 instead, we provide read-only properties for ServerExceptions:
 
 - errorId (taken from the X-RO-Error-ID header)
-- result (the complete result text)
+- result (the result text)
 - pdfreactor_error (if result is a JSON object, the 'error' value)
 - pdfreactor_says (to retain information previously injected by the
   PDFreactor._createServerException method)
+- error_record (an ErrorRecord: code, errorId, message, body excerpt)
+
+The response body is read once, when the ServerException is created, up to
+default_errors['max_body'] bytes (which releases the connection); it is
+parsed on first access, and the ErrorRecord is kept for all properties.
 """
 
 
@@ -28,7 +40,12 @@ __all__ = [
     'PDFreactorWebserviceException',
       'ClientException',
         'UnreachableServiceException',
+        'QuotaExceededException',
+        'AbortedException',
+          'TimeoutException',
+          'CancelledException',
       'ServerException',  # an HTTPError
+    'ErrorRecord',
     ]
 
 # Python compatibility:
@@ -41,6 +58,10 @@ else:
     from http.server import BaseHTTPRequestHandler
 
 import json
+from collections import namedtuple
+from io import BytesIO
+
+from .defaults import default_errors
 
 
 class PDFreactorWebserviceException(Exception):
@@ -48,14 +69,40 @@ class PDFreactorWebserviceException(Exception):
         super(PDFreactorWebserviceException, self).__init__(message or "Unknown PDFreactor Web Service error")
 
 
+# the compact, cached information about a ServerException:
+ErrorRecord = namedtuple('ErrorRecord', 'code errorId message body truncated')
+
+
 class ServerException(HTTPError, PDFreactorWebserviceException):
     """
     There was some error while processing an HTTP request to the PDFreactor server
 
     We inherit from PDFreactorWebserviceException mainly for systematic reasons;
     for functionality, we rely on the HTTPError details.
+
+    >>> e = ServerException('http://localhost/x', 422, 'Unprocessable', {},
+    ...                     BytesIO(b'{"error": "Invalid config"}'))
+    >>> e.pdfreactor_says
+    'Invalid config'
+    >>> e.result == e.result == '{"error": "Invalid config"}'
+    True
+    >>> e.error_record
+    ErrorRecord(code=422, errorId=None, message='Invalid config', body='{"error": "Invalid config"}', truncated=False)
+
+    Large bodies are truncated:
+    >>> e = ServerException('http://localhost/x', 502, 'Bad Gateway', {},
+    ...                     BytesIO(b'<html>' + b' ' * 100000 + b'</html>'))
+    >>> e.error_record.truncated, len(e.result), len(e.error_record.body)
+    (True, 32768, 200)
+    >>> e.pdfreactor_error[-7:]
+    "'[...]>"
     """
 
+    # the response body is read up to this size:
+    MAX_BODY = default_errors['max_body']
+    # ... and cited by messages up to this length:
+    EXCERPT = default_errors['excerpt']
+
     def __init__(self, *args, **kwargs):
         """
         We support the same arguments as the HTTPError "constructor"
@@ -72,6 +119,36 @@ class ServerException(HTTPError, PDFreactorWebserviceException):
         else:
             HTTPError.__init__(self, *args, **kwargs)
             # super(HTTPError, self).__init__(**kwargs)
+        self._capture()
+
+    def _capture(self):
+        """
+        Read the response body (up to MAX_BODY bytes), and close the response
+        """
+        fp = getattr(self, 'fp', None)
+        body = b''
+        if fp is not None:
+            try:
+                body = fp.read(self.MAX_BODY + 1) or b''
+            except Exception:  # e.g. a broken connection
+                pass
+            try:
+                fp.close()
+            except Exception:
+                pass
+        self._truncated = len(body) > self.MAX_BODY
+        self._body = body[:self.MAX_BODY]
+        self._stream = None
+        self._text = None
+        self._record = None
+
+    def read(self, amt=None):
+        """
+        Read the (captured) response body
+        """
+        if self._stream is None:
+            self._stream = BytesIO(self._body)
+        return self._stream.read(-1 if amt is None else amt)
 
     @property
     def errorId(self):
@@ -86,27 +163,54 @@ class ServerException(HTTPError, PDFreactorWebserviceException):
 
     @property
     def result(self):
-        return self.read().decode('utf-8')
+        """
+        The response text (truncated to MAX_BODY bytes)
+
+        The text is decoded on first access; the properties which interpret
+        it use the (compact) error_record instead.
+        """
+        text = self._text
+        if text is None:
+            text = self._text = self._body.decode('utf-8', 'replace')
+        return text
 
     @property
-    def pdfreactor_error(self):
-        text = self.result
+    def error_record(self):
+        """
+        An ErrorRecord (code, errorId, message, body, truncated),
+        created on first access; the body is an excerpt of the result
+        """
+        record = self._record
+        if record is None:
+            text = self.result
+            errorId = None
+            if self.hdrs is not None:
+                errorId = self.headers.get('X-RO-Error-ID') or None
+            record = self._record = ErrorRecord(
+                    self.code, errorId, self._message(text),
+                    text[:self.EXCERPT], self._truncated)
+        return record
+
+    def _message(self, text):
         if not text:
             return '<result attribute is empty>'
-        elif text.startswith(u'<'):
-            return '<XML text: %(text)r>' % locals()
+        # limit the amount of text; this is about error processing only:
+        body = text[:self.EXCERPT]
+        tail = (text[self.EXCERPT:] or self._truncated) and '[...]' or ''
+        if text.startswith(u'<'):
+            return '<XML text: %(body)r%(tail)s>' % locals()
         try:
             rslt = json.loads(text)
-            if isinstance(rslt, dict):
-                return rslt.get('error', '<no error key in response text>')
-            else:
-                # limit the amount of text; this is about error processing only:
-                body = txt[:200]
-                tail = txt[200:] and '[...]' or ''
-                return ('<no JSON object in response text: %(body)r%(tail)s>'
-                        % locals())
         except ValueError:
-            return '<no-JSON value %(text)r>' % locals()
+            return '<no-JSON value %(body)r%(tail)s>' % locals()
+        if isinstance(rslt, dict):
+            return rslt.get('error', '<no error key in response text>')
+        return ('<no JSON object in response text: %(body)r%(tail)s>'
+                % locals())
+
+    @property
+    def pdfreactor_error(self):
+        return self.error_record.message
 
     @property
     def pdfreactor_says(self):
@@ -154,9 +258,60 @@ class UnreachableServiceException(ClientException):
                 + '\n('+reason+')')
 
 
+class QuotaExceededException(ClientException):
+    """
+    A request couldn't be sent within the allowed waiting time,
+    because of a (local) concurrency or rate quota
+
+    >>> str(QuotaExceededException('concurrency', 'acme'))
+    'Quota exceeded: concurrency (tenant acme)'
+    """
+    def __init__(self, quota, tenant=None):
+        super(QuotaExceededException, self).__init__(quota)
+        self.quota = quota
+        self.tenant = tenant
+        self.args = (quota, tenant)
+
+    def __str__(self):
+        if self.tenant is None:
+            return 'Quota exceeded: %s' % (self.quota,)
+        return 'Quota exceeded: %s (tenant %s)' % (self.quota, self.tenant)
+
+
 class InvalidServiceException(ClientException):
     def __init__(self, message):
         super(InvalidServiceException, self).__init__(message)
 
 
+class AbortedException(ClientException):
+    """
+    An operation was aborted by the client
+
+    If the operation concerned an asynchronous conversion,
+    the documentId is given (and the document has been deleted).
+    """
+    def __init__(self, message, documentId=None):
+        super(AbortedException, self).__init__(message)
+        self.documentId = documentId
+        self.args = (message, documentId)
+
+    def __str__(self):
+        message = self.args[0]
+        if self.documentId is None:
+            return message
+        return '%s (document %s)' % (message, self.documentId)
+
+
+class TimeoutException(AbortedException):
+    """
+    A deadline was exceeded
+    """
+
+
+class CancelledException(AbortedException):
+    """
+    An operation was cancelled (using a CancellationToken)
+    """
+
+
 Code2Descriptions = BaseHTTPRequestHandler.responses
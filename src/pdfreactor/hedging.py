@@ -0,0 +1,247 @@
+"""
+pdfreactor.hedging: protect asynchronous conversions against stalled nodes
+
+A HedgedConverter submits an asynchronous conversion to one of several
+nodes, and polls its progress.  If the progress value doesn't change within
+the `stall` window, or the conversion takes longer than usual (a percentile
+of the recent conversion times, or a fixed `hedge_after` value), a duplicate
+("hedge") is submitted to another node.  Whichever job finishes first wins;
+the others are deleted on the server.
+
+    hedger = HedgedConverter([client1, client2, client3], stall=20)
+    pdf = hedger.convertAsBinary(config)
+    hedger.stats  # hedges, hedges_stall, hedges_latency, hedge_wins, ...
+
+The stats counters:
+
+- conversions: completed conversions
+- hedges: duplicates submitted (hedges_stall, hedges_latency: by reason)
+- hedge_wins: conversions won by a duplicate
+- primary_wins: conversions won by the original submission
+- losers_deleted: jobs deleted because another one won
+- job_errors: jobs which failed while others were still running
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+from collections import deque
+from threading import Lock
+from time import sleep
+
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+from .exceptions import PDFreactorWebserviceException
+from .jobs import AsyncJob
+from .stats import Counters
+from .timeouts import Deadline
+
+__all__ = [
+    'LatencyTracker',
+    'HedgedConverter',
+    ]
+
+
+class LatencyTracker(object):
+    """
+    Keep the durations of the most recent conversions
+
+    >>> t = LatencyTracker(size=100)
+    >>> for i in range(1, 101):
+    ...     t.add(i / 10.0)
+    >>> t.percentile(95)
+    9.5
+    >>> t.percentile(50)
+    5.0
+    >>> LatencyTracker().percentile(95)
+    """
+
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, p):
+        """
+        Return the p-th percentile (nearest rank), or None without samples
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        rank = max(int(-(-p * len(samples) // 100)), 1)
+        return samples[rank - 1]
+
+
+class _Attempt(object):
+    __slots__ = ('job', 'node', 'started', 'progress', 'changed', 'hedge')
+
+    def __init__(self, job, node, hedge, now):
+        self.job = job
+        self.node = node
+        self.hedge = hedge
+        self.started = now
+        self.progress = None
+        self.changed = now
+
+
+class HedgedConverter(object):
+    """
+    Asynchronous conversions with speculative duplicates on other nodes
+
+    clients -- PDFreactor clients, one per node
+    stall -- the time (seconds) without progress after which a job is
+             considered stuck (None: don't check)
+    hedge_percentile -- hedge when a conversion takes longer than this
+                        percentile of the recent conversion times ...
+    min_samples -- ... once that many conversions have been timed
+    hedge_after -- a fixed latency threshold instead (seconds)
+    max_hedges -- the maximum number of duplicates per conversion
+    interval -- the polling interval
+    """
+
+    def __init__(self, clients, stall=30, hedge_percentile=95,
+                 min_samples=20, hedge_after=None, max_hedges=1,
+                 interval=0.5):
+        self.clients = list(clients)
+        self.stall = stall
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.hedge_after = hedge_after
+        self.max_hedges = max_hedges
+        self.interval = interval
+        self.latency = LatencyTracker()
+        self.stats = Counters()
+        self._next = 0
+        self._lock = Lock()
+
+    def _node(self, exclude=()):
+        with self._lock:
+            count = len(self.clients)
+            for i in range(count):
+                node = (self._next + i) % count
+                if node not in exclude:
+                    self._next = node + 1
+                    return node
+        return None
+
+    def _threshold(self):
+        if self.hedge_after is not None:
+            return self.hedge_after
+        if self.hedge_percentile is None:
+            return None
+        if len(self.latency) < self.min_samples:
+            return None
+        return self.latency.percentile(self.hedge_percentile)
+
+    def _submit(self, config, connectionSettings, node, hedge, now):
+        job = AsyncJob(self.clients[node], config, connectionSettings)
+        job.start()
+        return _Attempt(job, node, hedge, now)
+
+    def run(self, config, connectionSettings=None, timeout=None,
+            cancel=None):
+        """
+        Convert, hedging as necessary; return the finished AsyncJob
+        (which should be closed after downloading, e.g. by a with statement)
+
+        If all jobs fail, the last exception is raised; on timeout or
+        cancellation, all jobs are deleted.
+        """
+        stats = self.stats
+        start = monotonic()
+        deadline = Deadline(timeout)
+        first = self._node()
+        attempts = [self._submit(config, connectionSettings, first,
+                                 False, start)]
+        used = set([first])
+        hedges = 0
+        error = None
+        won = False
+        try:
+            while True:
+                if cancel is not None:
+                    cancel.raise_if_cancelled(attempts[0].job.documentId)
+                deadline.check(attempts[0].job.documentId)
+                now = monotonic()
+                for attempt in list(attempts):
+                    try:
+                        progress = attempt.job.progress()
+                    except PDFreactorWebserviceException as e:
+                        error = e
+                        attempt.job.close()
+                        attempts.remove(attempt)
+                        stats.add('job_errors')
+                        continue
+                    if progress.get('finished'):
+                        attempts.remove(attempt)
+                        won = True
+                        self.latency.add(now - start)
+                        stats.add('conversions')
+                        stats.add(attempt.hedge and 'hedge_wins'
+                                  or 'primary_wins')
+                        return attempt.job
+                    value = progress.get('progress')
+                    if value != attempt.progress:
+                        attempt.progress = value
+                        attempt.changed = now
+                reason = None
+                if hedges < self.max_hedges:
+                    threshold = self._threshold()
+                    if not attempts:
+                        reason = 'error'
+                    elif (self.stall is not None
+                          and all(now - a.changed >= self.stall
+                                  for a in attempts)):
+                        reason = 'stall'
+                    elif (threshold is not None and not hedges
+                          and now - start >= threshold):
+                        reason = 'latency'
+                if reason is not None:
+                    node = self._node(used)
+                    if node is None and reason == 'error':
+                        node = self._node()
+                    if node is not None:
+                        used.add(node)
+                        hedges += 1
+                        stats.add('hedges')
+                        stats.add('hedges_' + reason)
+                        try:
+                            attempts.append(self._submit(
+                                    config, connectionSettings, node,
+                                    True, now))
+                        except PDFreactorWebserviceException as e:
+                            error = e
+                if not attempts:
+                    raise error
+                delay = self.interval
+                remaining = deadline.remaining()
+                if remaining is not None:
+                    delay = max(min(delay, remaining), 0)
+                if cancel is not None:
+                    cancel.wait(delay)
+                else:
+                    sleep(delay)
+        finally:
+            for attempt in attempts:
+                attempt.job.close()
+                if won:
+                    stats.add('losers_deleted')
+
+    def convertAsBinary(self, config, stream=None, connectionSettings=None,
+                        timeout=None, cancel=None):
+        """
+        Convert (see run), and return the document
+        (or write it to the given stream)
+        """
+        with self.run(config, connectionSettings, timeout, cancel) as job:
+            return job.download(stream)
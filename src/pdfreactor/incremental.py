@@ -0,0 +1,261 @@
+"""
+pdfreactor.incremental: rebuild multi-part documents, reusing unchanged parts
+
+The document is given as ordered Part objects (see pdfreactor.parallel)
+which share a config (style sheets etc.); the PDF of every part is stored
+in a PartCache, keyed by a hash of everything which affects its rendering
+(the part document, its counters and config, and the shared config).
+On the next build, only the changed parts are converted (concurrently),
+and the document is assembled by a MergeMode.APPEND merge:
+
+    cache = PartCache('/var/cache/catalogue')
+    pdf, manifest = build([client], parts, config, cache)
+    manifest.reused  # the indexes of the parts taken from the cache
+
+The first part is converted by the merging request (see
+pdfreactor.parallel.split_and_merge), so it is never taken from the cache.
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import hashlib
+import json
+import os
+
+try:
+    from os import replace as _replace
+except ImportError:  # Python 2
+    from os import rename as _replace
+
+from .download import _temporary
+from .inputs import BinaryDocument
+from .parallel import convert_parts, merge_documents
+
+__all__ = [
+    'PartCache',
+    'Manifest',
+    'part_key',
+    'config_key',
+    'build',
+    ]
+
+# config keys which don't affect the rendered PDF:
+IGNORED_KEYS = frozenset(['callbacks', 'debugSettings', 'logLevel'])
+
+
+def _binary_digest(value):
+    """
+    Represent binary config values (bytes, BinaryDocuments) by a digest
+    of their contents; a json.dumps default function
+
+    >>> _binary_digest(BinaryDocument(b'%PDF-1.4', None))['sha256'][:12]
+    'e16fa5d9b519'
+    >>> _binary_digest(b'%PDF-1.4') == _binary_digest(
+    ...     BinaryDocument(b'%PDF-1.4', None))
+    True
+    """
+    if isinstance(value, (bytes, bytearray)):
+        value = BinaryDocument(bytes(value), None)
+    elif not isinstance(value, BinaryDocument):
+        raise TypeError('%r is not JSON serializable' % (value,))
+    elif not value.repeatable:
+        # reading would consume a file which can't be read again:
+        raise TypeError('A BinaryDocument with a file which is not '
+                        'seekable cannot be hashed')
+    digest = hashlib.sha256()
+    for chunk in value._raw_chunks(64 * 1024):
+        digest.update(chunk)
+    res = {'sha256': digest.hexdigest()}
+    if value.content_type is not None:
+        res['content_type'] = value.content_type
+    return res
+
+
+def config_key(config):
+    """
+    Return a hex digest of the given config, ignoring IGNORED_KEYS
+
+    >>> key = config_key({'document': 'x'})
+    >>> key == config_key({'document': 'x', 'logLevel': 'DEBUG'})
+    True
+
+    Binary documents are hashed by their contents:
+
+    >>> key = config_key({'document': BinaryDocument(b'<p>A</p>')})
+    >>> key == config_key({'document': BinaryDocument(b'<p>A</p>')})
+    True
+    >>> key == config_key({'document': BinaryDocument(b'<p>B</p>')})
+    False
+    """
+    cfg = dict(config)
+    for key in IGNORED_KEYS:
+        cfg.pop(key, None)
+    data = json.dumps(cfg, sort_keys=True, separators=(',', ':'),
+                      default=_binary_digest)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def part_key(part, config=None):
+    """
+    Return the cache key (a hex digest) of the given part
+
+    >>> from pdfreactor.parallel import Part
+    >>> a = part_key(Part('<p>A</p>'), {'userStyleSheets': [{'uri': 'x'}]})
+    >>> a == part_key(Part('<p>A</p>'), {'userStyleSheets': [{'uri': 'x'}],
+    ...                                  'logLevel': 'DEBUG'})
+    True
+    >>> a == part_key(Part('<p>A</p>', counters={'page': 3}),
+    ...               {'userStyleSheets': [{'uri': 'x'}]})
+    False
+    """
+    return config_key(part.config_for(config))
+
+
+class PartCache(object):
+    """
+    A directory of rendered parts, stored as <key><suffix>
+    """
+
+    def __init__(self, directory, suffix='.pdf'):
+        self.directory = directory
+        self.suffix = suffix
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, key):
+        """
+        Return the stored PDF, or None
+        """
+        try:
+            with open(self.path(key), 'rb') as fo:
+                return fo.read()
+        except (IOError, OSError):
+            return None
+
+    def put(self, key, pdf):
+        path = self.path(key)
+        fd, tmp = _temporary(path)
+        try:
+            with os.fdopen(fd, 'wb') as fo:
+                fo.write(pdf)
+            _replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+    def prune(self, keep):
+        """
+        Delete all stored parts but those with the given keys;
+        return the number of deleted files
+        """
+        keep = set(keep)
+        count = 0
+        for name in os.listdir(self.directory):
+            key, ext = os.path.splitext(name)
+            if ext == self.suffix and key not in keep:
+                try:
+                    os.unlink(os.path.join(self.directory, name))
+                    count += 1
+                except OSError:
+                    pass
+        return count
+
+
+class Manifest(object):
+    """
+    The record of an incremental build
+
+    entries -- a list of dicts (index, key, reused, size), in part order
+    """
+
+    def __init__(self):
+        self.entries = []
+
+    def add(self, index, key, reused, size):
+        self.entries.append({
+            'index': index,
+            'key': key,
+            'reused': reused,
+            'size': size,
+            })
+
+    @property
+    def reused(self):
+        return [entry['index'] for entry in self.entries if entry['reused']]
+
+    @property
+    def rendered(self):
+        return [entry['index'] for entry in self.entries
+                if not entry['reused']]
+
+    def keys(self):
+        return [entry['key'] for entry in self.entries]
+
+    def as_dict(self):
+        return {
+            'parts': self.entries,
+            'reused': len(self.reused),
+            'rendered': len(self.rendered),
+            }
+
+    def write(self, path):
+        """
+        Write the manifest as a JSON file
+        """
+        with open(path, 'w') as fo:
+            json.dump(self.as_dict(), fo, indent=1, sort_keys=True)
+
+    def __repr__(self):
+        return ('<%s: %d parts, %d reused>'
+                % (self.__class__.__name__, len(self.entries),
+                   len(self.reused)))
+
+
+def build(clients, parts, config, cache, connectionSettings=None, slots=1,
+          stream=None, prune=False):
+    """
+    Build the document from the given parts; return a 2-tuple
+    (result of convertAsBinary, Manifest)
+
+    Only the parts missing in the cache are converted (concurrently, see
+    pdfreactor.parallel.convert_parts), and stored in the cache afterwards.
+    With prune=True, all other parts are deleted from the cache.
+    """
+    clients = list(clients)
+    parts = list(parts)
+    if not parts:
+        raise ValueError('No parts to build')
+    if not clients:
+        raise ValueError('No clients given')
+    manifest = Manifest()
+    first = parts[0]
+    manifest.add(0, part_key(first, config), False, None)
+    pdfs = []
+    missing = []
+    for index, part in enumerate(parts[1:], 1):
+        key = part_key(part, config)
+        pdf = cache.get(key)
+        pdfs.append(pdf)
+        if pdf is None:
+            missing.append(index)
+        manifest.add(index, key, pdf is not None,
+                     None if pdf is None else len(pdf))
+    rendered = convert_parts(clients, [parts[i] for i in missing], config,
+                             connectionSettings, slots)
+    for index, pdf in zip(missing, rendered):
+        entry = manifest.entries[index]
+        cache.put(entry['key'], pdf)
+        entry['size'] = len(pdf)
+        pdfs[index - 1] = pdf
+    if prune:
+        cache.prune(manifest.keys())
+    result = merge_documents(clients[0], first, pdfs, config,
+                             connectionSettings, stream)
+    return result, manifest
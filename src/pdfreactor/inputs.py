@@ -0,0 +1,223 @@
+"""
+pdfreactor.inputs: binary document input
+
+Markup given as config['document'] is embedded in the JSON request body as
+a string, i.e. every quote, backslash and non-ASCII character is escaped
+(a non-ASCII character takes 6 or 12 bytes, e.g. "\\u00e4").  Instead, the
+document can be given as bytes, or a binary file; it is then sent as a
+base64 data URI (4 bytes per 3 input bytes, regardless of the content),
+streamed into the request body without building the complete JSON text:
+
+    config['document'] = BinaryDocument(open('catalogue.html', 'rb'))
+    pdf = client.convertAsBinary(config)
+
+With Python 3, bytes values of config['document'] are wrapped
+automatically (as text/html).  See docs/benchmarks/input_encoding.py for
+a comparison of request sizes and client CPU time.
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import json
+import os
+import re
+from base64 import b64encode
+from uuid import uuid4
+
+__all__ = [
+    'BinaryDocument',
+    'JSONBody',
+    'streamed_body',
+    ]
+
+CHUNK = 48 * 1024  # a multiple of 3, to be encoded without padding
+
+
+class BinaryDocument(object):
+    """
+    A document (bytes, or a binary file) to be sent as a base64 data URI
+
+    >>> doc = BinaryDocument(b'<p>\\xc3\\xa4</p>')
+    >>> doc.size, doc.encoded_size
+    (9, 12)
+    >>> doc.data_uri()
+    'data:text/html;base64,PHA+w6Q8L3A+'
+
+    Files are read from their current position; if seekable, they can
+    be read repeatedly (e.g. when a request is repeated).
+
+    With content_type=None, the plain base64 text is sent (e.g. for the
+    'data' of mergeDocuments).
+    """
+
+    def __init__(self, source, content_type='text/html'):
+        self.source = source
+        self.content_type = content_type
+        self._start = None
+        self.size = None
+        if isinstance(source, bytes):
+            self.size = len(source)
+        else:
+            try:
+                self._start = source.tell()
+                self.size = os.fstat(source.fileno()).st_size - self._start
+            except (AttributeError, IOError, OSError, ValueError):
+                pass
+
+    @property
+    def repeatable(self):
+        """
+        Can the document be read more than once (bytes, a seekable file)?
+        """
+        return isinstance(self.source, bytes) or self._start is not None
+
+    @property
+    def prefix(self):
+        if self.content_type is None:
+            return ''
+        return 'data:%s;base64,' % (self.content_type,)
+
+    @property
+    def encoded_size(self):
+        """
+        The length of the base64 text (without the data URI prefix)
+        """
+        if self.size is None:
+            return None
+        return -(-self.size // 3) * 4
+
+    def _raw_chunks(self, chunksize):
+        source = self.source
+        if isinstance(source, bytes):
+            view = memoryview(source)
+            for offset in range(0, len(view), chunksize):
+                yield view[offset:offset + chunksize]
+            return
+        if self._start is not None:
+            source.seek(self._start)
+        rest = b''
+        while True:
+            chunk = source.read(chunksize)
+            if not chunk:
+                break
+            if rest:
+                chunk = rest + chunk
+            cut = len(chunk) - len(chunk) % 3
+            rest = chunk[cut:]
+            if cut:
+                yield chunk[:cut]
+        if rest:
+            yield rest
+
+    def encoded_chunks(self, chunksize=CHUNK):
+        """
+        Yield the base64-encoded document, chunk by chunk
+        """
+        for chunk in self._raw_chunks(chunksize):
+            yield b64encode(chunk)
+
+    def data_uri(self):
+        return self.prefix + b''.join(self.encoded_chunks()).decode('ascii')
+
+
+class JSONBody(object):
+    """
+    A JSON request body, which contains BinaryDocuments as data URIs
+    (the document, and the 'data' of merged documents)
+
+    The body is generated chunk by chunk; it can be iterated repeatedly
+    if its documents can be read repeatedly (see `repeatable`), and its
+    length is known in advance if the sizes of the documents are.
+
+    >>> body = JSONBody({'document': BinaryDocument(b'<p>"Hi"</p>'),
+    ...                  'title': 'T'})
+    >>> data = b''.join(body)
+    >>> json.loads(data.decode('ascii'))['document']
+    'data:text/html;base64,PHA+IkhpIjwvcD4='
+    >>> body.length == len(data), body.repeatable
+    (True, True)
+    >>> body = JSONBody({'document': '<p/>', 'mergeDocuments': [
+    ...     {'data': BinaryDocument(b'%PDF-1.4', None)}]})
+    >>> json.loads(b''.join(body).decode('ascii'))['mergeDocuments']
+    [{'data': 'JVBERi0xLjQ='}]
+    """
+    def __init__(self, config, chunksize=CHUNK):
+        self.chunksize = chunksize
+        marker = 'pdfreactor-binary-' + uuid4().hex
+        documents = {}
+
+        def replace(value):
+            if isinstance(value, BinaryDocument):
+                name = '%s-%d' % (marker, len(documents))
+                documents[name] = value
+                return name
+            return value
+
+        cfg = {}
+        for key, value in config.items():
+            if isinstance(value, list):
+                value = [dict((k, replace(v)) for (k, v) in item.items())
+                         if isinstance(item, dict) else item
+                         for item in value]
+            cfg[key] = replace(value)
+        # text, name, text, name, ..., text:
+        pieces = re.split('"(%s-\\d+)"' % marker, json.dumps(cfg))
+        self.pieces = pieces = [
+            documents[piece] if index % 2 else piece
+            for (index, piece) in enumerate(pieces)]
+        for index in range(1, len(pieces), 2):
+            pieces[index - 1] += '"' + pieces[index].prefix
+            pieces[index + 1] = '"' + pieces[index + 1]
+        for index in range(0, len(pieces), 2):
+            pieces[index] = pieces[index].encode('utf-8')
+        self.repeatable = all(piece.repeatable
+                              for piece in pieces[1::2])
+        self.length = 0
+        for index, piece in enumerate(pieces):
+            size = piece.encoded_size if index % 2 else len(piece)
+            if size is None:
+                self.length = None
+                break
+            self.length += size
+
+    def __iter__(self):
+        for index, piece in enumerate(self.pieces):
+            if index % 2:
+                for chunk in piece.encoded_chunks(self.chunksize):
+                    yield chunk
+            else:
+                yield piece
+
+
+def _has_binary(config):
+    """
+    Does the given config contain BinaryDocuments as merged documents?
+    """
+    for item in config.get('mergeDocuments') or ():
+        if (isinstance(item, dict)
+                and isinstance(item.get('data'), BinaryDocument)):
+            return True
+    return False
+
+
+def streamed_body(config):
+    """
+    Return a JSONBody if the document of the given config is binary
+    (a BinaryDocument, a binary file, or - with Python 3 - bytes),
+    or if BinaryDocuments are to be merged; None otherwise
+    """
+    if not config:
+        return None
+    document = config.get('document')
+    if document is None or isinstance(document, str):
+        if _has_binary(config):
+            return JSONBody(config)
+        return None
+    if not isinstance(document, BinaryDocument):
+        if isinstance(document, bytes) or hasattr(document, 'read'):
+            document = BinaryDocument(document)
+        else:
+            return None
+        config = dict(config, document=document)
+    return JSONBody(config)
@@ -0,0 +1,339 @@
+"""
+pdfreactor.jobs: lifecycle management of asynchronous conversions
+
+An AsyncJob tracks the documentId (and the session cookies) of an
+asynchronous conversion, and deletes the document on the server when
+closed; used as a context manager, this happens on completion or failure:
+
+    with client.submit(config) as job:
+        job.wait(timeout=300)
+        job.download(stream)
+
+If a DocumentJournal is given, the outstanding documents are recorded in
+a local file; a Reaper deletes documents which were orphaned, e.g. by
+crashed worker processes.
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import json
+import os
+from contextlib import contextmanager
+from threading import Event, Lock, Thread
+from time import time
+
+try:
+    import fcntl
+except ImportError:  # e.g. Windows
+    fcntl = None
+
+from .exceptions import PDFreactorWebserviceException, ServerException
+
+__all__ = [
+    'AsyncJob',
+    'DocumentJournal',
+    'Reaper',
+    ]
+
+
+class AsyncJob(object):
+    """
+    An asynchronous conversion, from submission to deletion
+
+    client -- the PDFreactor client
+    config -- the conversion configuration
+    connectionSettings -- used for all requests of this job (the dict is
+                          not modified; a copy takes the session cookies)
+    journal -- a DocumentJournal (optional)
+    """
+
+    def __init__(self, client, config=None, connectionSettings=None,
+                 journal=None):
+        self.client = client
+        self.config = config
+        self.connectionSettings = settings = dict(connectionSettings or ())
+        for key in ('headers', 'cookies'):
+            if settings.get(key) is not None:
+                settings[key] = dict(settings[key])
+        self.journal = journal
+        self.documentId = None
+        self.deleted = False
+
+    def start(self):
+        if self.documentId is not None:
+            raise ValueError('Job %s has been started already'
+                             % (self.documentId,))
+        client = self.client
+        settings = self.connectionSettings
+        self.documentId = documentId = client.convertAsync(self.config,
+                                                           settings)
+        if self.journal is not None and documentId is not None:
+            cookies = client.sessions.cookies(documentId)
+            if cookies is None:
+                cookies = settings.get('cookies')
+            self.journal.add(documentId, client.url, cookies)
+        return documentId
+
+    def _documentId(self):
+        documentId = self.documentId
+        if documentId is None:
+            raise ValueError('Job has not been started')
+        return documentId
+
+    def progress(self):
+        return self.client.getProgress(self._documentId(),
+                                       self.connectionSettings)
+
+    def wait(self, timeout=None, cancel=None, interval=0.5):
+        """
+        Wait for the conversion to finish; see PDFreactor.waitForDocument
+
+        On timeout or cancellation, the document is deleted.
+        """
+        try:
+            return self.client.waitForDocument(self._documentId(),
+                                               self.connectionSettings,
+                                               timeout=timeout,
+                                               cancel=cancel,
+                                               interval=interval)
+        except PDFreactorWebserviceException:
+            self.close()
+            raise
+
+    def download(self, stream=None):
+        """
+        Return the converted document (or write it to the given stream)
+        """
+        return self.client.getDocumentAsBinary(self._documentId(), stream,
+                                               self.connectionSettings)
+
+    def result(self):
+        """
+        Return the result of the conversion (see PDFreactor.getDocument)
+        """
+        return self.client.getDocument(self._documentId(),
+                                       self.connectionSettings)
+
+    def close(self):
+        """
+        Delete the document on the server (if not done yet)
+
+        Errors are ignored; if the deletion fails, the document remains in
+        the journal (if any), to be deleted by a Reaper later.
+        """
+        documentId = self.documentId
+        if documentId is None or self.deleted:
+            return
+        try:
+            self.client.deleteDocument(documentId, self.connectionSettings)
+        except ServerException as e:
+            if e.code != 404:
+                return
+        except PDFreactorWebserviceException:
+            return
+        self.deleted = True
+        if self.journal is not None:
+            self.journal.remove(documentId)
+
+    def __enter__(self):
+        if self.documentId is None:
+            self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class DocumentJournal(object):
+    """
+    A local record of outstanding server-side documents
+
+    The journal is an append-only text file; every line is a JSON list:
+    ["+", timestamp, documentId, url, cookies] when a document is created,
+    ["-", timestamp, documentId] when it is deleted.
+    Each line is written by a single write call to a file opened in append
+    mode, so several processes can share a journal.  The compact method
+    replaces the file; while it runs, the other processes wait before
+    appending (by a lock of the file path + '.lock'; where the fcntl module
+    is not available, compact should be used only while no other process
+    is writing).
+
+    >>> from tempfile import mkdtemp
+    >>> path = os.path.join(mkdtemp(), 'journal')
+    >>> journal = DocumentJournal(path)
+    >>> journal.add('doc1', 'http://localhost:9423/service/rest',
+    ...             {'JSESSIONID': 'abc'})
+    >>> journal.add('doc2', 'http://localhost:9423/service/rest')
+    >>> journal.remove('doc1')
+    >>> sorted(journal.outstanding())
+    ['doc2']
+    >>> entry = journal.outstanding()['doc2']
+    >>> entry['url'], entry['cookies']
+    ('http://localhost:9423/service/rest', None)
+    >>> journal.compact()
+    1
+    >>> sorted(DocumentJournal(path).outstanding())
+    ['doc2']
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = Lock()
+
+    @contextmanager
+    def _locked(self, exclusive=False):
+        """
+        Lock the journal for appending (shared) or for compacting
+        (exclusive), against other threads and processes
+
+        A separate lock file is used, since compact replaces the journal.
+        """
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            fd = os.open(self.path + '.lock', os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, exclusive and fcntl.LOCK_EX or fcntl.LOCK_SH)
+                yield
+            finally:
+                os.close(fd)  # (releases the lock)
+
+    def _write(self, record):
+        line = (json.dumps(record) + '\n').encode('utf-8')
+        with self._locked():
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                         0o600)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+
+    def add(self, documentId, url, cookies=None):
+        self._write(['+', time(), documentId, url, cookies or None])
+
+    def remove(self, documentId):
+        self._write(['-', time(), documentId])
+
+    def outstanding(self):
+        """
+        Return a dict documentId --> {'created', 'url', 'cookies'}
+        """
+        result = {}
+        if not os.path.exists(self.path):
+            return result
+        with open(self.path, 'rb') as fo:
+            for line in fo:
+                try:
+                    record = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    continue  # e.g. a truncated last line
+                if record[0] == '+':
+                    result[record[2]] = {
+                        'created': record[1],
+                        'url':     record[3],
+                        'cookies': record[4],
+                        }
+                elif record[0] == '-':
+                    result.pop(record[2], None)
+        return result
+
+    def compact(self):
+        """
+        Rewrite the journal, containing the outstanding documents only;
+        return their number
+        """
+        with self._locked(exclusive=True):
+            outstanding = self.outstanding()
+            tmp = self.path + '.tmp'
+            with open(tmp, 'wb') as fo:
+                for documentId, entry in sorted(outstanding.items()):
+                    record = ['+', entry['created'], documentId,
+                              entry['url'], entry['cookies']]
+                    fo.write((json.dumps(record) + '\n').encode('utf-8'))
+            os.rename(tmp, self.path)
+        return len(outstanding)
+
+
+class Reaper(object):
+    """
+    Delete orphaned documents recorded in a DocumentJournal
+
+    client -- a PDFreactor client; for journal entries with another
+              service URL, a client of the same class is created
+              (with the same apiKey and transport)
+    journal -- the DocumentJournal
+    min_age -- only documents older than this (in seconds) are deleted,
+               to spare the ones of running jobs
+    """
+
+    def __init__(self, client, journal, min_age=3600):
+        self.client = client
+        self.journal = journal
+        self.min_age = min_age
+        self._clients = {client.url: client}
+        self._stop = Event()
+        self._thread = None
+
+    def _client_for(self, url):
+        client = self._clients.get(url)
+        if client is None:
+            proto = self.client
+            client = proto.__class__(url, transport=proto.transport)
+            client.apiKey = proto.apiKey
+            self._clients[url] = client
+        return client
+
+    def reap(self):
+        """
+        Delete the orphaned documents; return the list of deleted documentIds
+
+        Documents which are unknown to the server (anymore) count as deleted.
+        """
+        deleted = []
+        limit = time() - self.min_age
+        journal = self.journal
+        for documentId, entry in sorted(journal.outstanding().items()):
+            if entry['created'] > limit:
+                continue
+            client = self._client_for(entry['url'])
+            settings = {}
+            if entry['cookies']:
+                settings['cookies'] = entry['cookies']
+            try:
+                client.deleteDocument(documentId, settings)
+            except ServerException as e:
+                if e.code != 404:
+                    continue
+            except PDFreactorWebserviceException:
+                continue
+            journal.remove(documentId)
+            deleted.append(documentId)
+        return deleted
+
+    def start(self, interval=600, compact=False):
+        """
+        Reap periodically, in a daemon thread
+
+        If compact is True, the journal is compacted after each run which
+        deleted documents (see DocumentJournal.compact).
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval):
+                if self.reap() and compact:
+                    self.journal.compact()
+
+        self._thread = thread = Thread(target=run, name='pdfreactor-reaper')
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
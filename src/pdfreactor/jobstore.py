@@ -0,0 +1,375 @@
+"""
+pdfreactor.jobstore: a durable queue of asynchronous conversions
+
+The JobStore is an SQLite database of conversion jobs; for each job, it
+records the config, the output path, the server node (URL), documentId and
+session cookies, and every state transition:
+
+    queued --> submitted --> finished --> downloaded --> done
+       ^           |            |
+       +-----------+------------+--- (failure; retried) --> dead
+
+A JobRunner processes the jobs concurrently; when restarted (e.g. after a
+crash of the worker process), it resumes every job at its recorded state,
+so conversions which the server has started or finished already are polled
+and downloaded rather than submitted again:
+
+    store = JobStore('/var/lib/exports/jobs.sqlite')
+    store.enqueue('report-4711', config, '/exports/report-4711.pdf')
+    JobRunner(store, [client1, client2], slots=4).run()
+
+Jobs which failed max_attempts times are moved to the dead letter state;
+they can be inspected (store.jobs('dead')) and requeued (store.retry).
+When a job fails after its conversion has been started, the document is
+deleted on the server before the job is requeued; if this fails as well,
+it is left to a Reaper, if the JobRunner was given a DocumentJournal.
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import json
+import sqlite3
+from threading import Lock, Thread
+from time import time
+
+try:
+    from queue import Empty, Queue
+except ImportError:  # Python 2
+    from Queue import Empty, Queue
+
+from .exceptions import ServerException
+from .jobs import AsyncJob
+
+__all__ = [
+    'JobStore',
+    'JobRunner',
+    ]
+
+QUEUED = 'queued'
+SUBMITTED = 'submitted'
+FINISHED = 'finished'
+DOWNLOADED = 'downloaded'
+DONE = 'done'
+DEAD = 'dead'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    name        TEXT PRIMARY KEY,
+    config      TEXT NOT NULL,
+    output      TEXT NOT NULL,
+    state       TEXT NOT NULL,
+    url         TEXT,
+    documentId  TEXT,
+    cookies     TEXT,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    error       TEXT,
+    created     REAL NOT NULL,
+    updated     REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+CREATE TABLE IF NOT EXISTS transitions (
+    name        TEXT NOT NULL,
+    ts          REAL NOT NULL,
+    state       TEXT NOT NULL,
+    detail      TEXT
+);
+CREATE INDEX IF NOT EXISTS transitions_name ON transitions (name);
+"""
+
+COLUMNS = ('name', 'config', 'output', 'state', 'url', 'documentId',
+           'cookies', 'attempts', 'error', 'created', 'updated')
+
+
+class JobStore(object):
+    """
+    An SQLite-backed record of conversion jobs
+
+    >>> store = JobStore(':memory:')
+    >>> store.enqueue('a', {'document': '<p>A</p>'}, '/tmp/a.pdf')
+    True
+    >>> store.enqueue('a', {'document': '<p>A</p>'}, '/tmp/a.pdf')
+    False
+    >>> store.transition('a', 'submitted', url='http://node1/service/rest',
+    ...                  documentId='doc1', cookies={'JSESSIONID': 'x'})
+    >>> job = store.get('a')
+    >>> job['state'], job['documentId'], job['cookies']
+    ('submitted', 'doc1', {'JSESSIONID': 'x'})
+    >>> store.fail('a', 'timeout', max_attempts=1)
+    'dead'
+    >>> [j['name'] for j in store.jobs('dead')]
+    ['a']
+    >>> store.retry('a')
+    True
+    >>> [state for (ts, state, detail) in store.history('a')]
+    ['queued', 'submitted', 'dead', 'queued']
+    >>> store.counts()
+    {'queued': 1}
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = Lock()
+        self._db = db = sqlite3.connect(path, check_same_thread=False,
+                                        isolation_level=None)
+        if path != ':memory:':
+            db.execute('PRAGMA journal_mode=WAL')
+        db.executescript(SCHEMA)
+
+    def _log(self, name, state, detail=None, ts=None):
+        self._db.execute('INSERT INTO transitions VALUES (?, ?, ?, ?)',
+                         (name, ts or time(), state, detail))
+
+    def enqueue(self, name, config, output):
+        """
+        Add a job; return False if a job of this name exists already
+        """
+        now = time()
+        with self._lock:
+            try:
+                self._db.execute('BEGIN')
+                self._db.execute(
+                    'INSERT INTO jobs (name, config, output, state,'
+                    ' created, updated) VALUES (?, ?, ?, ?, ?, ?)',
+                    (name, json.dumps(config), output, QUEUED, now, now))
+            except sqlite3.IntegrityError:
+                self._db.execute('ROLLBACK')
+                return False
+            self._log(name, QUEUED, ts=now)
+            self._db.execute('COMMIT')
+        return True
+
+    def transition(self, name, state, detail=None, **fields):
+        """
+        Change the state of the job, and update the given fields
+        (url, documentId, cookies, error)
+        """
+        now = time()
+        if 'cookies' in fields:
+            fields['cookies'] = json.dumps(fields['cookies'])
+        assignments = ''.join(', %s = ?' % key for key in sorted(fields))
+        values = [fields[key] for key in sorted(fields)]
+        with self._lock:
+            self._db.execute('BEGIN')
+            self._db.execute('UPDATE jobs SET state = ?, updated = ?'
+                             + assignments + ' WHERE name = ?',
+                             [state, now] + values + [name])
+            self._log(name, state, detail, now)
+            self._db.execute('COMMIT')
+
+    def fail(self, name, error, max_attempts=3):
+        """
+        Record a failed attempt; requeue the job, or move it to the dead
+        letters after max_attempts failures.  Return the new state.
+        """
+        with self._lock:
+            row = self._db.execute('SELECT attempts FROM jobs WHERE name = ?',
+                                   (name,)).fetchone()
+        attempts = row[0] + 1
+        state = DEAD if attempts >= max_attempts else QUEUED
+        with self._lock:
+            self._db.execute('UPDATE jobs SET attempts = ? WHERE name = ?',
+                             (attempts, name))
+        self.transition(name, state, error, error=error, url=None,
+                        documentId=None, cookies=None)
+        return state
+
+    def retry(self, name):
+        """
+        Requeue a dead job (resetting its attempts); return False if there
+        is no such dead job
+        """
+        with self._lock:
+            count = self._db.execute(
+                    'UPDATE jobs SET attempts = 0 WHERE name = ?'
+                    ' AND state = ?', (name, DEAD)).rowcount
+        if not count:
+            return False
+        self.transition(name, QUEUED, 'retry')
+        return True
+
+    def _job(self, row):
+        job = dict(zip(COLUMNS, row))
+        job['config'] = json.loads(job['config'])
+        if job['cookies'] is not None:
+            job['cookies'] = json.loads(job['cookies'])
+        return job
+
+    def get(self, name):
+        with self._lock:
+            row = self._db.execute('SELECT %s FROM jobs WHERE name = ?'
+                                   % ', '.join(COLUMNS),
+                                   (name,)).fetchone()
+        return None if row is None else self._job(row)
+
+    def jobs(self, *states):
+        """
+        Return the jobs in the given states (default: all), oldest first
+        """
+        query = 'SELECT %s FROM jobs' % ', '.join(COLUMNS)
+        if states:
+            query += (' WHERE state IN (%s)'
+                      % ', '.join('?' * len(states)))
+        with self._lock:
+            rows = self._db.execute(query + ' ORDER BY created, name',
+                                    states).fetchall()
+        return [self._job(row) for row in rows]
+
+    def history(self, name):
+        """
+        Return the list of (timestamp, state, detail) transitions of a job
+        """
+        with self._lock:
+            return [tuple(row) for row in self._db.execute(
+                    'SELECT ts, state, detail FROM transitions'
+                    ' WHERE name = ? ORDER BY rowid', (name,))]
+
+    def counts(self):
+        """
+        Return a dict {state: number of jobs}
+        """
+        with self._lock:
+            return dict(self._db.execute('SELECT state, count(*) FROM jobs'
+                                         ' GROUP BY state'))
+
+    def close(self):
+        self._db.close()
+
+
+class JobRunner(object):
+    """
+    Process the pending jobs of a JobStore
+
+    clients -- PDFreactor clients (one per server node); new jobs are
+               distributed round-robin.  For jobs recorded with another
+               service URL, a client of the same class is created.
+    slots -- the number of jobs processed concurrently
+    max_attempts -- failures before a job is moved to the dead letters
+    timeout -- the maximum time to wait for each conversion
+    journal -- a pdfreactor.jobs.DocumentJournal, which records the
+               documents not deleted yet (for a Reaper)
+    """
+
+    def __init__(self, store, clients, slots=4, max_attempts=3,
+                 timeout=None, interval=0.5, journal=None):
+        self.store = store
+        self.journal = journal
+        self.clients = list(clients)
+        self.slots = slots
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.interval = interval
+        self._by_url = dict((client.url, client) for client in self.clients)
+        self._next = 0
+        self._lock = Lock()
+
+    def _client_for(self, url=None):
+        with self._lock:
+            if url is None:
+                client = self.clients[self._next % len(self.clients)]
+                self._next += 1
+                return client
+            client = self._by_url.get(url)
+            if client is None:
+                proto = self.clients[0]
+                client = proto.__class__(url, transport=proto.transport)
+                client.apiKey = proto.apiKey
+                self._by_url[url] = client
+            return client
+
+    def process(self, job):
+        """
+        Advance the given job (a dict, as returned by JobStore.jobs)
+        to the done state; return the final state
+        """
+        store = self.store
+        name = job['name']
+        handle = None
+        try:
+            state = job['state']
+            if state == QUEUED:
+                client = self._client_for()
+                handle = AsyncJob(client, job['config'], {'cookies': {}},
+                                  self.journal)
+                documentId = handle.start()
+                cookies = client.sessions.cookies(documentId)
+                if cookies is None:
+                    cookies = handle.connectionSettings.get('cookies')
+                store.transition(name, SUBMITTED, url=client.url,
+                                 documentId=documentId,
+                                 cookies=cookies or None)
+                state = SUBMITTED
+            else:
+                client = self._client_for(job['url'])
+                handle = AsyncJob(client, job['config'],
+                                  {'cookies': job['cookies'] or {}},
+                                  self.journal)
+                handle.documentId = job['documentId']
+            settings = handle.connectionSettings
+            if state == SUBMITTED:
+                handle.wait(timeout=self.timeout, interval=self.interval)
+                store.transition(name, FINISHED)
+                state = FINISHED
+            if state == FINISHED:
+                report = client.getDocumentToPath(handle.documentId,
+                                                  job['output'], settings)
+                store.transition(name, DOWNLOADED, '%d bytes' % report.size)
+                state = DOWNLOADED
+            if state == DOWNLOADED:
+                handle.close()  # errors are left to a Reaper
+                store.transition(name, DONE)
+        except ServerException as e:
+            if e.code == 404 and job['state'] != QUEUED:
+                # the document expired on the server:
+                detail = 'document %s gone' % (job['documentId'],)
+            else:
+                detail = '%s: %s' % (e.__class__.__name__, e)
+                self._abandon(handle)
+            return store.fail(name, detail, self.max_attempts)
+        except Exception as e:
+            self._abandon(handle)
+            return store.fail(name, '%s: %s' % (e.__class__.__name__, e),
+                              self.max_attempts)
+        return DONE
+
+    def _abandon(self, handle):
+        """
+        Delete the document of a failed job, which is forgotten by the
+        store (and submitted again, if requeued); errors are ignored
+        """
+        if handle is None:
+            return
+        try:
+            handle.close()
+        except Exception:
+            pass
+
+    def run(self):
+        """
+        Process all pending jobs, including requeued ones, until none are
+        left; return the JobStore.counts() afterwards
+        """
+        while True:
+            pending = self.store.jobs(QUEUED, SUBMITTED, FINISHED,
+                                      DOWNLOADED)
+            if not pending:
+                return self.store.counts()
+            todo = Queue()
+            for job in pending:
+                todo.put(job)
+
+            def work():
+                while True:
+                    try:
+                        job = todo.get_nowait()
+                    except Empty:
+                        return
+                    self.process(job)
+
+            workers = [Thread(target=work)
+                       for i in range(min(self.slots, len(pending)))]
+            for worker in workers:
+                worker.daemon = True
+                worker.start()
+            for worker in workers:
+                worker.join()
@@ -0,0 +1,214 @@
+"""
+pdfreactor.parallel: convert long documents in parts, concurrently
+
+A long document is split by the caller at suitable boundaries (e.g. chapters)
+into Part objects; the parts are converted concurrently, using all given
+PDFreactor clients (e.g. one per server node) with `slots` conversions each,
+and the resulting PDFs are merged in order (MergeMode.APPEND):
+
+    parts = [Part(title_html),
+             Part(chapter1_html, counters={'page': 2, 'chapter': 0}),
+             Part(chapter2_html, counters={'page': 58, 'chapter': 1}),
+             ]
+    pdf = split_and_merge([client1, client2], parts, config, slots=2)
+
+Since the parts are converted independently, counters (page numbers,
+chapter numbers etc.) can't be carried over by PDFreactor; instead, the
+caller supplies their values at the start of each part (i.e. the values at
+the end of the preceding parts; for the 'page' counter: the number of
+preceding pages), and they are injected by a user style sheet.
+
+The first part is converted by the merging request itself (which needs
+a document to convert), so it should be a short one, e.g. the title pages.
+
+The PDFs of the other parts are kept in memory until they are merged
+(i.e. the total size of the parts is needed once); the merging request,
+which contains them base64-encoded, is streamed (see pdfreactor.inputs)
+rather than built as a whole.  For very large documents, consider
+merging by the PDFreactor service itself, giving the parts as URLs.
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+from threading import Thread
+
+try:
+    from queue import Empty, Queue
+except ImportError:  # Python 2
+    from Queue import Empty, Queue
+
+from .inputs import BinaryDocument
+
+__all__ = [
+    'Part',
+    'counter_css',
+    'convert_parts',
+    'merge_documents',
+    'split_and_merge',
+    ]
+
+
+def counter_css(counters):
+    """
+    Return a style sheet which starts the given counters at the given values
+
+    >>> counter_css({'page': 12, 'chapter': 3})
+    '@page:first { counter-reset: page 13; } :root { counter-reset: chapter 3; }'
+    >>> counter_css({})
+    ''
+    """
+    rules = []
+    counters = dict(counters or ())
+    pages = counters.pop('page', None)
+    if pages is not None:
+        # the page counter is incremented before each page is laid out:
+        rules.append('@page:first { counter-reset: page %d; }' % (pages + 1))
+    if counters:
+        rules.append(':root { counter-reset: %s; }'
+                     % ' '.join('%s %d' % item
+                                for item in sorted(counters.items())))
+    return ' '.join(rules)
+
+
+class Part(object):
+    """
+    A part of a long document
+
+    document -- the value for the 'document' config key (markup, or a URL)
+    counters -- a dict of the counter values at the start of the part
+    config -- config keys specific to this part
+    """
+    __slots__ = ('document', 'counters', 'config')
+
+    def __init__(self, document, counters=None, config=None):
+        self.document = document
+        self.counters = counters
+        self.config = config
+
+    def config_for(self, config=None):
+        """
+        Return the complete config for this part, based on the given one
+        (which is not modified)
+
+        >>> part = Part('<p>Text</p>', counters={'page': 4})
+        >>> cfg = part.config_for({'userStyleSheets': [{'uri': 'a.css'}]})
+        >>> cfg['document']
+        '<p>Text</p>'
+        >>> cfg['userStyleSheets'][1]
+        {'content': '@page:first { counter-reset: page 5; }'}
+        """
+        res = dict(config or ())
+        if self.config:
+            res.update(self.config)
+        res['document'] = self.document
+        css = counter_css(self.counters)
+        if css:
+            res['userStyleSheets'] = (list(res.get('userStyleSheets') or ())
+                                      + [{'content': css}])
+        return res
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, self.counters)
+
+
+def _as_bytes(result):
+    if isinstance(result, bytes):
+        return result
+    try:  # a SpooledResult
+        return result.getvalue()
+    finally:
+        result.close()
+
+
+def _convert_one(client, part, config, connectionSettings):
+    return _as_bytes(client.convertAsBinary(part.config_for(config),
+                                            connectionSettings))
+
+
+def convert_parts(clients, parts, config=None, connectionSettings=None,
+                  slots=1, convert=None):
+    """
+    Convert the given parts concurrently; return the list of PDFs (bytes)
+
+    clients -- a sequence of PDFreactor clients (e.g. one per server node)
+    slots -- the number of concurrent conversions per client
+    convert -- a function (client, part, config, connectionSettings)
+               which returns the PDF of the part (default: convertAsBinary)
+
+    If a conversion fails, no further parts are started, and the first
+    exception is raised when the running conversions have finished.
+    """
+    if convert is None:
+        convert = _convert_one
+    parts = list(parts)
+    results = [None] * len(parts)
+    errors = []
+    todo = Queue()
+    for item in enumerate(parts):
+        todo.put(item)
+
+    def work(client):
+        while not errors:
+            try:
+                index, part = todo.get_nowait()
+            except Empty:
+                return
+            try:
+                results[index] = convert(client, part, config,
+                                         connectionSettings)
+            except BaseException as e:
+                errors.append(e)
+
+    workers = [Thread(target=work, args=(client,))
+               for client in clients
+               for i in range(slots)][:len(parts)]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    for worker in workers:
+        worker.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+def merge_documents(client, part, pdfs, config=None, connectionSettings=None,
+                    stream=None):
+    """
+    Convert the given part, and append the given PDFs (bytes);
+    return the result of convertAsBinary (or write it to the stream)
+
+    The PDFs are base64-encoded chunk by chunk, while the request is sent.
+    """
+    merged = part.config_for(config)
+    merged['mergeDocuments'] = [{'data': BinaryDocument(pdf, None)}
+                                for pdf in pdfs]
+    merged['mergeMode'] = client.MergeMode.APPEND
+    return client.convertAsBinary(merged, stream=stream,
+                                  connectionSettings=connectionSettings)
+
+
+def split_and_merge(clients, parts, config=None, connectionSettings=None,
+                    slots=1, stream=None, convert=None):
+    """
+    Convert the parts (but the first) concurrently, and merge them in order
+    into the conversion of the first part; see the module docstring.
+
+    The merging request is sent by the first client.
+
+    >>> split_and_merge([None], [])
+    Traceback (most recent call last):
+      ...
+    ValueError: No parts to convert
+    """
+    clients = list(clients)
+    parts = list(parts)
+    if not parts:
+        raise ValueError('No parts to convert')
+    if not clients:
+        raise ValueError('No clients given')
+    pdfs = convert_parts(clients, parts[1:], config, connectionSettings,
+                         slots, convert)
+    return merge_documents(clients[0], parts[0], pdfs, config,
+                           connectionSettings, stream)
@@ -0,0 +1,301 @@
+"""
+pdfreactor.pipeline: overlap CPU-heavy pre-processing with conversions
+
+CPU-heavy work on each document (templating, HTML sanitizing, image
+downscaling ...) is limited by the GIL when done in the threads which talk
+to the PDFreactor service.  A Pipeline runs such pre-processing stages in a
+process pool, and feeds the ready configs through a bounded queue to
+concurrent conversion workers (`slots` per client); optional post-processing
+stages are applied to the results, in the process pool as well:
+
+    def render(item):               # module-level functions (picklable)
+        return {'document': template.render(**item)}
+
+    pipeline = Pipeline([client1, client2], slots=2,
+                        pre=[render, sanitize], post=[optimize])
+    for outcome in pipeline.run(items):
+        if outcome.error is not None:
+            log.error('%s: %s', outcome.item, outcome.error)
+        else:
+            store(outcome.item, outcome.result)
+
+The first pre-processing stage is given the item; every stage is given the
+value returned by the preceding one; the last one must return the config.
+Without pre-processing stages, the items are the configs.
+Post-processing stages are given the converted document (bytes).
+
+The queue of ready configs (including those being pre-processed) is limited
+to `queuesize` entries, so the pre-processing doesn't run ahead of the
+conversions by more than that; the items are consumed lazily.
+
+With processes=0, all stages run in the threads of the pipeline
+(e.g. for debugging, or for stage functions which can't be pickled).
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+from threading import Semaphore, Thread
+
+try:
+    from queue import Queue
+except ImportError:  # Python 2
+    from Queue import Queue
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:  # Python 2, without the futures backport
+    ProcessPoolExecutor = None
+
+from .parallel import _as_bytes
+from .stats import Counters
+
+__all__ = [
+    'Pipeline',
+    'Outcome',
+    'run_stages',
+    ]
+
+
+def run_stages(stages, value):
+    """
+    Apply the given functions, one after the other
+
+    >>> run_stages([str.strip, str.upper], '  <p>text</p> ')
+    '<P>TEXT</P>'
+    """
+    for stage in stages:
+        value = stage(value)
+    return value
+
+
+class Outcome(object):
+    """
+    The outcome of a pipeline item: the result, or the error
+    (of the pre-processing, the conversion, or the post-processing)
+    """
+    __slots__ = ('index', 'item', 'result', 'error')
+
+    def __init__(self, index, item, result=None, error=None):
+        self.index = index
+        self.item = item
+        self.result = result
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        return '<%s #%d %s>' % (self.__class__.__name__, self.index,
+                                self.error is None and 'ok'
+                                or self.error.__class__.__name__)
+
+
+def _convert(client, config, connectionSettings):
+    return client.convertAsBinary(config,
+                                  connectionSettings=connectionSettings)
+
+
+class Pipeline(object):
+    """
+    Pre-process, convert and post-process many documents concurrently
+
+    clients -- a sequence of PDFreactor clients (e.g. one per server node)
+    slots -- the number of concurrent conversions per client
+    pre, post -- the pre- and post-processing stages (functions)
+    processes -- the size of the process pool (default: the number of
+                 CPUs); 0 to run the stages in threads
+    queuesize -- the maximum number of configs being pre-processed or
+                 waiting for conversion (default: twice the conversion slots)
+    executor -- a concurrent.futures executor to use instead of a new pool
+    connectionSettings -- passed to every conversion
+    convert -- a function (client, config, connectionSettings) which returns
+               the converted document (default: convertAsBinary)
+
+    >>> class Client(object):
+    ...     def convertAsBinary(self, config, connectionSettings=None):
+    ...         return ('%PDF ' + config['document']).encode('ascii')
+    >>> def add_markup(item):
+    ...     return {'document': '<p>' + item + '</p>'}
+    >>> pipeline = Pipeline([Client()], slots=2, processes=0,
+    ...                     pre=[add_markup], post=[len])
+    >>> [(o.item, o.result) for o in pipeline.run(['a', 'bb'], ordered=True)]
+    [('a', 13), ('bb', 14)]
+    >>> pipeline.stats['conversions']
+    2
+
+    Errors are reported per item:
+    >>> list(pipeline.run([None]))
+    [<Outcome #0 TypeError>]
+    """
+
+    def __init__(self, clients, slots=1, pre=None, post=None,
+                 processes=None, queuesize=None, executor=None,
+                 connectionSettings=None, convert=None):
+        self.clients = list(clients)
+        self.slots = slots
+        self.pre = list(pre or ())
+        self.post = list(post or ())
+        if executor is None and ProcessPoolExecutor is None:
+            processes = 0
+        self.processes = processes
+        if queuesize is None:
+            queuesize = 2 * slots * len(self.clients)
+        self.queuesize = queuesize
+        self.executor = executor
+        self.connectionSettings = connectionSettings
+        if convert is None:
+            convert = _convert
+        self.convert = convert
+        self.stats = Counters()
+
+    def add_pre(self, func):
+        """
+        Append a pre-processing stage; return the function
+        (which allows to use this method as a decorator)
+        """
+        self.pre.append(func)
+        return func
+
+    def add_post(self, func):
+        """
+        Append a post-processing stage; return the function
+        """
+        self.post.append(func)
+        return func
+
+    def _submit(self, pool, stages, value, callback):
+        """
+        Run the stages (in the pool, if any), and call the callback
+        with (result, error)
+        """
+        if pool is None:
+            try:
+                callback(run_stages(stages, value), None)
+            except Exception as e:
+                callback(None, e)
+            return
+
+        def done(future):
+            try:
+                result = future.result()
+            except BaseException as e:
+                callback(None, e)
+            else:
+                callback(result, None)
+
+        pool.submit(run_stages, stages, value).add_done_callback(done)
+
+    def run(self, items, ordered=False):
+        """
+        Process the given items; yield an Outcome for each of them
+        (in the given order, if `ordered`; otherwise, as they complete)
+
+        When the generator is closed early, no further items are started.
+        """
+        stats = self.stats
+        pool = own_pool = None
+        if self.executor is not None:
+            pool = self.executor
+        elif self.processes != 0 and (self.pre or self.post):
+            pool = own_pool = ProcessPoolExecutor(self.processes)
+        tokens = Semaphore(self.queuesize)
+        ready = Queue()
+        done = Queue()
+        stop = []
+        pre, post = self.pre, self.post
+        convert = self.convert
+        connectionSettings = self.connectionSettings
+
+        def feed():
+            count = 0
+            try:
+                for index, item in enumerate(items):
+                    tokens.acquire()
+                    if stop:
+                        break
+                    count += 1
+
+                    def ready_cb(config, error, index=index, item=item):
+                        ready.put((index, item, config, error))
+
+                    if pre:
+                        self._submit(pool, pre, item, ready_cb)
+                    else:
+                        ready_cb(item, None)
+            except BaseException as e:
+                done.put(('error', e))
+            done.put(('total', count))
+
+        def work(client):
+            while True:
+                entry = ready.get()
+                if entry is None:
+                    return
+                tokens.release()
+                index, item, config, error = entry
+
+                def done_cb(result, error, index=index, item=item):
+                    if error is not None:
+                        stats.add('errors')
+                    done.put(Outcome(index, item, result, error))
+
+                if error is not None or stop:
+                    done_cb(None, error)
+                    continue
+                try:
+                    result = convert(client, config, connectionSettings)
+                except BaseException as e:
+                    done_cb(None, e)
+                    continue
+                stats.add('conversions')
+                if post:
+                    self._submit(pool, post, _as_bytes(result), done_cb)
+                else:
+                    done_cb(result, None)
+
+        workers = [Thread(target=work, args=(client,))
+                   for client in self.clients
+                   for i in range(self.slots)]
+        feeder = Thread(target=feed)
+        for thread in [feeder] + workers:
+            thread.daemon = True
+            thread.start()
+        finished = False
+        try:
+            total = None
+            received = 0
+            pending = {}
+            following = 0
+            while total is None or received < total:
+                entry = done.get()
+                if isinstance(entry, tuple):
+                    kind, value = entry
+                    if kind == 'error':
+                        raise value
+                    total = value
+                    continue
+                received += 1
+                stats.add('items')
+                if not ordered:
+                    yield entry
+                    continue
+                pending[entry.index] = entry
+                while following in pending:
+                    yield pending.pop(following)
+                    following += 1
+            finished = True
+        finally:
+            stop.append(True)
+            tokens.release()  # a blocked feeder
+            for worker in workers:
+                ready.put(None)
+            if own_pool is not None:
+                if finished:
+                    own_pool.shutdown()
+                else:
+                    try:  # Python 3.9+
+                        own_pool.shutdown(wait=False, cancel_futures=True)
+                    except TypeError:
+                        own_pool.shutdown(wait=False)
@@ -0,0 +1,138 @@
+"""
+pdfreactor.raster: render pages to images, concurrently
+
+For image output types (PNG, JPEG, ...), PDFreactor renders the page(s)
+selected by the pageOrder config key; the rasterize generator sends one
+request per page (or page range, for multi-image formats like TIFF),
+concurrently, and yields every image as soon as it is ready (and all
+preceding ones, unless ordered=False):
+
+    for page, png in rasterize([client], config, range(1, 11), width=400):
+        show_thumbnail(page, png)
+
+Rendered images can be kept in a cache (e.g. a pdfreactor.incremental
+.PartCache with suffix='.png'), keyed by a hash of the complete config.
+For asyncio, see pdfreactor.aio.rasterize_async.
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+from threading import Thread
+
+try:
+    from queue import Empty, Queue
+except ImportError:  # Python 2
+    from Queue import Empty, Queue
+
+from .incremental import config_key
+from .parallel import _as_bytes
+
+__all__ = [
+    'page_order',
+    'page_config',
+    'rasterize',
+    ]
+
+
+def page_order(pages):
+    """
+    Return the pageOrder value for a page number or (first, last) range
+
+    >>> page_order(3)
+    '3'
+    >>> page_order((3, 6))
+    '3..6'
+    """
+    if isinstance(pages, tuple):
+        return '%d..%d' % pages
+    return str(pages)
+
+
+def page_config(config, pages, output_type='PNG', width=None, height=None):
+    """
+    Return a copy of the config which renders the given page(s) as images
+
+    >>> cfg = page_config({'document': 'x'}, 2, width=300)
+    >>> cfg['pageOrder'], sorted(cfg['outputFormat'].items())
+    ('2', [('height', -1), ('type', 'PNG'), ('width', 300)])
+    """
+    res = dict(config or ())
+    fmt = dict(res.get('outputFormat') or ())
+    fmt['type'] = output_type
+    fmt['width'] = -1 if width is None else width
+    fmt['height'] = -1 if height is None else height
+    res['outputFormat'] = fmt
+    res['pageOrder'] = page_order(pages)
+    return res
+
+
+def rasterize(clients, config, pages, output_type='PNG', width=None,
+              height=None, connectionSettings=None, slots=1, cache=None,
+              ordered=True):
+    """
+    Render the given pages concurrently; yield (page, image) tuples
+
+    clients -- a sequence of PDFreactor clients (e.g. one per server node)
+    pages -- page numbers (1-based), or (first, last) tuples for
+             multi-image output types
+    slots -- the number of concurrent requests per client
+    cache -- an object with get(key) and put(key, data) methods
+    ordered -- yield the images in the given order; otherwise, as they come
+
+    When the generator is closed early, no further requests are started.
+    """
+    pages = list(pages)
+    todo = Queue()
+    done = Queue()
+    stop = []
+    for item in enumerate(pages):
+        todo.put(item)
+
+    def render(client, page):
+        cfg = page_config(config, page, output_type, width, height)
+        key = None
+        if cache is not None:
+            key = config_key(cfg)
+            image = cache.get(key)
+            if image is not None:
+                return image
+        image = _as_bytes(client.convertAsBinary(cfg, connectionSettings))
+        if key is not None:
+            cache.put(key, image)
+        return image
+
+    def work(client):
+        while not stop:
+            try:
+                index, page = todo.get_nowait()
+            except Empty:
+                return
+            try:
+                done.put((index, render(client, page), None))
+            except BaseException as e:
+                done.put((index, None, e))
+                return
+
+    workers = [Thread(target=work, args=(client,))
+               for client in clients
+               for i in range(slots)][:len(pages)]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    try:
+        pending = {}
+        following = 0
+        for i in range(len(pages)):
+            index, image, error = done.get()
+            if error is not None:
+                raise error
+            if not ordered:
+                yield pages[index], image
+                continue
+            pending[index] = image
+            while following in pending:
+                yield pages[following], pending.pop(following)
+                following += 1
+    finally:
+        stop.append(True)
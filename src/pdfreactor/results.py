@@ -0,0 +1,627 @@
+"""
+pdfreactor.results: result objects
+
+SpooledResult
+    a binary result (e.g. a PDF) which is kept in memory up to a threshold
+    size, and spilled to a temporary file if larger; returned by
+    convertAsBinary and getDocumentAsBinary (when called without a stream)
+    if the PDFreactor client was created with the `spool` option:
+
+        client = PDFreactor(spool=8 * 1024 * 1024)
+        with client.convertAsBinary(config) as result:
+            result.save_to('/var/exports/report.pdf')
+
+ConversionResult, ProgressResult, DocumentMetadata
+    the results of convert / getDocument, getProgress and
+    getDocumentMetadata, if the PDFreactor client was created with the
+    `lazy` option: the JSON text is parsed on first access, the log records
+    are turned into LogRecord objects on demand.  The base64 text of the
+    document (the bulk of the response) is not parsed at all: it is located
+    in the response bytes and cut out before parsing the other fields, and
+    decoded directly from the response bytes when the `document` attribute
+    is read, or chunk by chunk when written to a file by save_document.
+    Item access (result['numberOfPages'], result.get('log')) gives the
+    values of the JSON response, as without the `lazy` option.
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import errno
+import json
+import mmap
+import os
+import re
+import shutil
+from base64 import b64decode, b64encode
+from binascii import a2b_base64
+from collections import namedtuple
+from io import BytesIO
+from tempfile import mkstemp
+
+from .defaults import default_spool
+
+__all__ = [
+    'SpooledResult',
+    'ConversionResult',
+    'ProgressResult',
+    'DocumentMetadata',
+    'LogRecord',
+    'ProgressState',
+    ]
+
+
+def _file_mode():
+    """
+    The permissions of newly created files: 0o666, less the umask
+
+    (mkstemp creates files with mode 0o600; renamed into place, they are
+    given the mode a plain open would have given them)
+    """
+    try:
+        # doesn't change the umask, unlike os.umask (Linux only):
+        with open('/proc/self/status') as fo:
+            for line in fo:
+                if line.startswith('Umask:'):
+                    return 0o666 & ~int(line.split()[1], 8)
+    except (IOError, OSError, ValueError):
+        pass
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+class SpooledResult(object):
+    """
+    Binary data, in memory or (if exceeding the threshold) in a temporary file
+
+    >>> result = SpooledResult(threshold=10)
+    >>> result.write(b'%PDF-1.4')
+    >>> result.spilled
+    False
+    >>> result.write(b' 0123456789')
+    >>> result.spilled, len(result)
+    (True, 19)
+    >>> result.read(8)
+    b'%PDF-1.4'
+    >>> bytes(result.getbuffer()[9:])
+    b'0123456789'
+    >>> b''.join(result)
+    b'%PDF-1.4 0123456789'
+    >>> result.close()
+    """
+
+    CHUNK = 64 * 1024
+
+    def __init__(self, threshold=None, dir=None):
+        if threshold is None:
+            threshold = default_spool['threshold']
+        self.threshold = threshold
+        self.dir = dir
+        self._file = BytesIO()
+        self._path = None   # the temporary file, if spilled
+        self._temporary = False
+        self._size = 0
+        self._reading = False
+        self._mmap = None
+
+    @classmethod
+    def from_response(cls, response, threshold=None, dir=None,
+                      deadline=None):
+        """
+        Read the given response completely
+        """
+        result = cls(threshold, dir)
+        try:
+            read = getattr(response, 'read1', None) or response.read
+            size = cls.CHUNK
+            while True:
+                chunk = read(size)
+                if not chunk:
+                    break
+                result.write(chunk)
+                if deadline is not None and deadline.expired():
+                    response.close()
+                    deadline.check()
+        except BaseException:
+            result.close()
+            raise
+        return result
+
+    @property
+    def spilled(self):
+        return self._path is not None
+
+    @property
+    def name(self):
+        """
+        The path of the (temporary or saved) file, or None if in memory
+        """
+        return self._path
+
+    def write(self, data):
+        if self._reading:
+            raise ValueError('SpooledResult is complete already')
+        self._size += len(data)
+        if self._path is None and self._size > self.threshold:
+            self._spill()
+        self._file.write(data)
+
+    def _spill(self):
+        fd, path = mkstemp(prefix='pdfreactor-', suffix='.tmp',
+                           dir=self.dir)
+        fo = os.fdopen(fd, 'w+b')
+        fo.write(self._file.getvalue())
+        self._file = fo
+        self._path = path
+        self._temporary = True
+
+    def _rewind(self):
+        if not self._reading:
+            self._reading = True
+            self._file.flush()
+            self._file.seek(0)
+
+    def __len__(self):
+        return self._size
+
+    def read(self, amt=None):
+        self._rewind()
+        if amt is None or amt < 0:
+            return self._file.read()
+        return self._file.read(amt)
+
+    def __iter__(self):
+        self._rewind()
+        self._file.seek(0)
+        read = self._file.read
+        size = self.CHUNK
+        while True:
+            chunk = read(size)
+            if not chunk:
+                break
+            yield chunk
+
+    def getbuffer(self):
+        """
+        Return a (read-only, if spilled) memoryview of the complete data;
+        file contents are memory-mapped rather than read
+        """
+        self._rewind()
+        if self._path is None:
+            return self._file.getbuffer()
+        if not self._size:
+            return memoryview(b'')
+        if self._mmap is None:
+            self._mmap = mmap.mmap(self._file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        return memoryview(self._mmap)
+
+    def getvalue(self):
+        """
+        Return the complete data as a bytes object
+        """
+        return self.getbuffer().tobytes()
+
+    def save_to(self, path):
+        """
+        Store the data in the given file
+
+        If spilled, the temporary file is renamed (no data is copied,
+        unless the target is on another file system); the result object
+        then refers to the new file, which is not deleted by close.
+        Either way, the file permissions honour the umask.
+        """
+        self._rewind()
+        if self._path is None:
+            with open(path, 'wb') as fo:
+                fo.write(self._file.getbuffer())
+            return path
+        self._release_mmap()
+        self._file.close()
+        try:
+            os.rename(self._path, path)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            shutil.copyfile(self._path, path)
+            os.unlink(self._path)
+        os.chmod(path, _file_mode())
+        self._path = path
+        self._temporary = False
+        self._file = open(path, 'rb')
+        return path
+
+    def _release_mmap(self):
+        mm, self._mmap = self._mmap, None
+        if mm is not None:
+            try:
+                mm.close()
+            except BufferError:  # memoryviews still exist
+                pass
+
+    def close(self):
+        """
+        Release the memory, and delete the temporary file (if any)
+        """
+        self._release_mmap()
+        fo, self._file = self._file, None
+        if fo is not None:
+            try:
+                fo.close()
+            except BufferError:  # memoryviews still exist
+                pass
+        if self._temporary:
+            self._temporary = False
+            try:
+                os.unlink(self._path)
+            except OSError:
+                pass
+            self._path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        if self._temporary:
+            try:
+                self.close()
+            except Exception:
+                pass
+
+
+# ------------------------------------------ [ lazy JSON results ... [
+def _read_all(response, deadline=None, chunksize=64 * 1024):
+    """
+    Read the given response completely; if a Deadline is given, read it
+    chunk by chunk, and raise a TimeoutException when it has expired
+
+    The chunks are read by read1, if available, which returns the data
+    received so far rather than waiting for a full chunk; otherwise, a
+    response which trickles in would not be stopped by the deadline.
+
+    >>> from io import BytesIO
+    >>> from pdfreactor.timeouts import Deadline
+    >>> _read_all(BytesIO(b'{"finished": true}'), Deadline(10), chunksize=4)
+    b'{"finished": true}'
+    """
+    if deadline is None:
+        return response.read()
+    chunks = []
+    read = getattr(response, 'read1', None) or response.read
+    try:
+        while True:
+            chunk = read(chunksize)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            if deadline.expired():
+                deadline.check()
+    except BaseException:
+        response.close()
+        raise
+    return b''.join(chunks)
+
+
+def _field(name, doc=None):
+    def get(self):
+        return self._fields().get(name)
+    return property(get, doc=doc)
+
+
+class JSONResult(object):
+    """
+    A JSON response of the PDFreactor service, parsed on first access
+
+    >>> res = JSONResult(b'{"a": 1, "b": [2, 3]}')
+    >>> res
+    <JSONResult (unparsed, 21 bytes)>
+    >>> res['a'], res.get('c'), 'b' in res
+    (1, None, True)
+    >>> res
+    <JSONResult a, b>
+    """
+    __slots__ = ('_raw', '_data')
+
+    def __init__(self, raw):
+        self._raw = raw
+        self._data = None
+
+    @classmethod
+    def from_response(cls, response, deadline=None):
+        return cls(_read_all(response, deadline))
+
+    def _fields(self):
+        data = self._data
+        if data is None:
+            raw, self._raw = self._raw, None
+            self._data = data = self._parse(raw)
+        return data
+
+    def _parse(self, raw):
+        # release the bytes before parsing, so that at most two copies
+        # of the (possibly large) text are held at the same time:
+        text = raw.decode('utf-8')
+        del raw
+        return json.loads(text)
+
+    def __getitem__(self, key):
+        return self._fields()[key]
+
+    def get(self, key, default=None):
+        return self._fields().get(key, default)
+
+    def __contains__(self, key):
+        return key in self._fields()
+
+    def keys(self):
+        return self._fields().keys()
+
+    def as_dict(self):
+        """
+        Return the (shallow copied) dict of the JSON response
+        """
+        return dict(self._fields())
+
+    def __repr__(self):
+        if self._data is None:
+            return ('<%s (unparsed, %d bytes)>'
+                    % (self.__class__.__name__, len(self._raw)))
+        return '<%s %s>' % (self.__class__.__name__,
+                            ', '.join(sorted(self._data)))
+
+
+class LogRecord(object):
+    """
+    An entry of the conversion log
+    """
+    __slots__ = ('level', 'message', 'timestamp')
+
+    def __init__(self, level=None, message=None, timestamp=None):
+        self.level = level
+        self.message = message
+        self.timestamp = timestamp
+
+    def __repr__(self):
+        return '<%s %s: %s>' % (self.__class__.__name__, self.level,
+                                self.message)
+
+
+# the key of the document; not preceded by a backslash (i.e. not within
+# a string), and followed by the opening quote of the value:
+DOCUMENT_KEY = re.compile(br'(?<!\\)"document"\s*:\s*"')
+
+
+def _document_span(raw):
+    """
+    Locate the base64 text of the document in a raw JSON conversion result;
+    return (start, end), or None if not found (or containing escapes)
+
+    >>> raw = b'{"numberOfPages": 1, "document": "JVBERi0xLjQ="}'
+    >>> start, end = _document_span(raw)
+    >>> raw[start:end]
+    b'JVBERi0xLjQ='
+    >>> _document_span(b'{"document": null}')
+    """
+    match = DOCUMENT_KEY.search(raw)
+    if match is None:
+        return None
+    start = match.end()
+    end = raw.find(b'"', start)
+    if end == -1 or raw.find(b'\\', start, end) != -1:
+        # e.g. escaped slashes ("\/"); the value must be parsed
+        return None
+    return start, end
+
+
+def _b64decode(view):
+    try:
+        return a2b_base64(view)
+    except TypeError:  # Python 2: no buffers
+        return a2b_base64(view.tobytes())
+
+
+class ConversionResult(JSONResult):
+    """
+    The result of PDFreactor.convert or getDocument
+
+    >>> res = ConversionResult(b'{"document": "JVBERi0xLjQ=", '
+    ...     b'"numberOfPages": 1, "log": {"records": '
+    ...     b'[{"level": "INFO", "message": "Done"}]}}')
+    >>> res.numberOfPages
+    1
+    >>> res.document
+    b'%PDF-1.4'
+    >>> res['document']
+    'JVBERi0xLjQ='
+    >>> list(res.log_records())
+    [<LogRecord INFO: Done>]
+
+    The document isn't part of the parsed JSON (which is all that is needed
+    for the other fields); it is kept as a memoryview of the response bytes
+    until decoded:
+
+    >>> res = ConversionResult(b'{"document": "JVBERi0xLjQ=", '
+    ...     b'"numberOfPages": 1}')
+    >>> res.numberOfPages, res._span.nbytes
+    (1, 12)
+    >>> res.as_dict()
+    {'document': 'JVBERi0xLjQ=', 'numberOfPages': 1}
+    """
+    __slots__ = ('_document', '_span')
+
+    contentType = _field('contentType')
+    numberOfPages = _field('numberOfPages')
+    numberOfPagesLiteral = _field('numberOfPagesLiteral')
+    documentUrl = _field('documentUrl')
+    conversionName = _field('conversionName')
+    error = _field('error')
+    log = _field('log', 'the log, as contained in the JSON response')
+
+    def __init__(self, raw):
+        JSONResult.__init__(self, raw)
+        self._document = None
+        self._span = None
+
+    def _parse(self, raw):
+        span = _document_span(raw)
+        if span is not None:
+            start, end = span
+            # the other fields, with a null document:
+            data = json.loads((raw[:start - 1] + b'null' + raw[end + 1:]
+                               ).decode('utf-8'))
+            if isinstance(data, dict) and data.get('document', 0) is None:
+                self._span = memoryview(raw)[start:end]
+                return data
+            # the key found wasn't the one of the conversion result
+        return JSONResult._parse(self, raw)
+
+    @property
+    def document(self):
+        """
+        The converted document (bytes), decoded on first access; the
+        base64-encoded value (i.e. the response) is released then
+        """
+        if self._document is None:
+            fields = self._fields()
+            span = self._span
+            if span is not None:
+                self._document = _b64decode(span)
+                self._span = None
+            else:
+                encoded = fields.get('document')
+                if encoded is None:
+                    return None
+                self._document = b64decode(encoded)
+                fields['document'] = None
+        return self._document
+
+    def _encoded(self):
+        """
+        The base64 text of the document, or None
+        """
+        if self._document is not None:
+            return b64encode(self._document).decode('ascii')
+        fields = self._fields()
+        if self._span is not None:
+            return self._span.tobytes().decode('ascii')
+        return fields.get('document')
+
+    def __getitem__(self, key):
+        if key == 'document':
+            if 'document' not in self._fields():
+                raise KeyError(key)
+            return self._encoded()
+        return JSONResult.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        if key == 'document':
+            if 'document' not in self._fields():
+                return default
+            return self._encoded()
+        return JSONResult.get(self, key, default)
+
+    def as_dict(self):
+        res = JSONResult.as_dict(self)
+        if 'document' in res:
+            res['document'] = self._encoded()
+        return res
+
+    def save_document(self, stream, chunksize=64 * 1024):
+        """
+        Decode the document to the given stream, chunk by chunk
+        (without creating the complete bytes object); return the size
+        """
+        if self._document is not None:
+            stream.write(self._document)
+            return len(self._document)
+        fields = self._fields()
+        encoded = self._span
+        if encoded is None:
+            encoded = fields.get('document') or ''
+            decode = b64decode
+        else:
+            decode = _b64decode
+        step = (chunksize // 3) * 4
+        size = 0
+        for start in range(0, len(encoded), step):
+            chunk = decode(encoded[start:start + step])
+            stream.write(chunk)
+            size += len(chunk)
+        return size
+
+    def log_records(self):
+        """
+        Yield the log records as LogRecord objects
+        """
+        log = self._fields().get('log') or {}
+        for record in log.get('records') or ():
+            yield LogRecord(record.get('level'), record.get('message'),
+                            record.get('timestamp'))
+
+
+class ProgressResult(JSONResult):
+    """
+    The result of PDFreactor.getProgress
+
+    >>> ProgressResult(b'{"finished": false, "progress": 42}').progress
+    42
+    """
+    __slots__ = ()
+
+    documentId = _field('documentId')
+    finished = _field('finished')
+    progress = _field('progress')
+    conversionName = _field('conversionName')
+    startDate = _field('startDate')
+    callbackUrl = _field('callbackUrl')
+
+
+class DocumentMetadata(JSONResult):
+    """
+    The result of PDFreactor.getDocumentMetadata
+    """
+    __slots__ = ()
+
+    documentId = _field('documentId')
+    conversionName = _field('conversionName')
+    contentType = _field('contentType')
+    finished = _field('finished')
+    length = _field('length')
+    numberOfPages = _field('numberOfPages')
+    numberOfPagesLiteral = _field('numberOfPagesLiteral')
+    startDate = _field('startDate')
+    endDate = _field('endDate')
+# ------------------------------------------ ] ... lazy JSON results ]
+
+
+class ProgressState(namedtuple('ProgressState', 'finished progress error')):
+    """
+    The progress of an asynchronous conversion, as a compact tuple
+    (returned by PDFreactor.getProgresses)
+
+    >>> ProgressState.from_progress({'finished': False, 'progress': 42})
+    ProgressState(finished=False, progress=42, error=None)
+    >>> ProgressState.failed(KeyError('x')).finished is None
+    True
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_progress(cls, progress):
+        """
+        Create from a getProgress result (a dict, or a ProgressResult)
+        """
+        return cls(bool(progress.get('finished')), progress.get('progress'),
+                   None)
+
+    @classmethod
+    def failed(cls, error):
+        """
+        The progress couldn't be determined (e.g. for a failed conversion,
+        or a deleted document); the error is the exception
+        """
+        return cls(None, None, error)
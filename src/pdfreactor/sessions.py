@@ -0,0 +1,297 @@
+"""
+pdfreactor.sessions: client-side session state of asynchronous conversions
+
+Behind a load balancer, the follow-up requests of an asynchronous conversion
+(getProgress, getDocument...) must reach the node which runs it; this is
+usually ensured by a session cookie (e.g. JSESSIONID, or a route cookie).
+The PDFreactor client keeps the cookies returned by convertAsync in a
+SessionStore, by documentId, and sends them automatically with all
+follow-up requests for that document, as long as their domain and path
+match the service URL and they haven't expired; deleteDocument forgets them.
+
+In thread-safe mode, the cookies are not written back to the given
+connectionSettings (which might be shared by several threads).
+
+The cookies are stored compactly (a tuple per document, with interned
+names, domains and paths), so the store scales to many outstanding jobs.
+Since documents are not always deleted by the client (which may merely
+poll or download them), the entries of a document are dropped when all
+of its cookies have expired, where cookies without an expiry (e.g. for
+load balancer stickiness) are kept for `ttl` seconds; expired entries are
+purged from time to time.  The store can be limited to `maxsize`
+documents as well; beyond that, the oldest entries are dropped even if
+still valid (after the expired ones), and the follow-up requests of their
+documents may reach the wrong node - so it is unlimited by default.
+"""
+
+# Python compatibility:
+import sys
+from collections import OrderedDict
+from email.utils import mktime_tz, parsedate_tz
+from time import time
+
+try:
+    from threading import Lock
+except ImportError:
+    from dummy_threading import Lock
+
+try:
+    from http.cookies import CookieError, SimpleCookie
+    from urllib.parse import urlsplit
+except ImportError:  # Python 2
+    from Cookie import CookieError, SimpleCookie
+    from urlparse import urlsplit
+
+try:
+    _intern = sys.intern
+except AttributeError:  # Python 2
+    _intern = intern  # noqa: F821
+
+__all__ = [
+    'SessionStore',
+    'parse_set_cookie',
+    ]
+
+# the fields of the stored cookie tuples:
+NAME, VALUE, EXPIRES, DOMAIN, PATH = range(5)
+
+
+def _expiry(morsel, now):
+    max_age = morsel['max-age']
+    if max_age:
+        try:
+            return now + int(max_age)
+        except ValueError:
+            pass
+    expires = morsel['expires']
+    if expires:
+        parsed = parsedate_tz(expires)
+        if parsed is not None:
+            return mktime_tz(parsed)
+    return None
+
+
+def parse_set_cookie(values, url, now=None):
+    """
+    Return a tuple of cookie tuples (name, value, expires, domain, path)
+    from the given Set-Cookie header values, received from the given URL
+
+    Without a Domain attribute, the cookie is restricted to the host of
+    the URL; without a Path attribute, to the path of the service URL.
+
+    >>> parse_set_cookie(['JSESSIONID=abc; Path=/; HttpOnly',
+    ...                   'ROUTE=.node2; Domain=.example.com; Max-Age=60'],
+    ...                  'http://pdf.example.com/service/rest', now=1000)
+    (('JSESSIONID', 'abc', None, 'pdf.example.com', '/'), ('ROUTE', '.node2', 1060, '.example.com', '/service/rest'))
+    """
+    if now is None:
+        now = time()
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    base = parts.path.rstrip('/') or '/'
+    res = []
+    for value in values:
+        jar = SimpleCookie()
+        try:
+            jar.load(value)
+        except CookieError:
+            continue
+        for name, morsel in jar.items():
+            domain = (morsel['domain'] or host).lower()
+            path = morsel['path'] or base
+            res.append((_intern(str(name)), _intern(str(morsel.value)),
+                        _expiry(morsel, now),
+                        _intern(str(domain)), _intern(str(path))))
+    return tuple(res)
+
+
+def domain_matches(host, domain):
+    """
+    >>> domain_matches('pdf.example.com', '.example.com')
+    True
+    >>> domain_matches('pdf.example.com', 'example.com')
+    True
+    >>> domain_matches('badexample.com', 'example.com')
+    False
+    """
+    domain = domain.lstrip('.')
+    return host == domain or host.endswith('.' + domain)
+
+
+def path_matches(path, cookie_path):
+    """
+    >>> path_matches('/service/rest/progress/x.json', '/service/rest')
+    True
+    >>> path_matches('/service/restless', '/service/rest')
+    False
+    """
+    if path == cookie_path or cookie_path == '/':
+        return True
+    return (path.startswith(cookie_path)
+            and (cookie_path.endswith('/') or path[len(cookie_path)] == '/'))
+
+
+class SessionStore(object):
+    """
+    The cookies of asynchronous conversions, by documentId
+
+    >>> store = SessionStore()
+    >>> store.remember('doc1', {'JSESSIONID': 'abc'})
+    >>> store.cookies('doc1')
+    {'JSESSIONID': 'abc'}
+    >>> store.cookies('doc2')
+    >>> store.remember_set_cookie('doc2', ['ROUTE=n1; Path=/service',
+    ...                                    'OLD=x; Max-Age=0'],
+    ...                           'http://localhost:9423/service/rest')
+    >>> store.header('doc2', 'http://localhost:9423/service/rest/progress')
+    'ROUTE=n1'
+    >>> store.header('doc2', 'http://otherhost:9423/service/rest/progress')
+    >>> len(store)
+    2
+    >>> store.forget('doc1')
+    >>> store.forget('doc1')
+    >>> len(store)
+    1
+
+    ttl -- the lifetime of cookies without an expiry, in seconds
+           (None: until forgotten, or dropped to keep the maxsize)
+    maxsize -- the maximum number of documents (None: unlimited);
+               expired entries are dropped first, then the oldest ones
+
+    >>> store = SessionStore(maxsize=2)
+    >>> for documentId in ('doc1', 'doc2', 'doc3'):
+    ...     store.remember(documentId, {'JSESSIONID': documentId})
+    >>> store.cookies('doc1'), len(store)
+    (None, 2)
+    """
+
+    # purge expired entries after that many additions (at least; or after
+    # half as many as stored, lest purging a big store take quadratic time):
+    PURGE_INTERVAL = 1000
+
+    def __init__(self, ttl=24 * 3600, maxsize=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        # documentId --> (expiry of the last cookie, or None; cookies),
+        # oldest first:
+        self._cookies = OrderedDict()
+        self._lock = Lock()
+        self._added = 0
+
+    def _store(self, documentId, entries, now=None):
+        if not entries:
+            return
+        if now is None:
+            now = time()
+        ttl = self.ttl
+        expires = 0
+        for entry in entries:
+            expiry = entry[EXPIRES]
+            if expiry is None:
+                if ttl is None:
+                    expires = None
+                    break
+                expiry = now + ttl
+            expires = max(expires, expiry)
+        maxsize = self.maxsize
+        with self._lock:
+            cookies = self._cookies
+            cookies.pop(documentId, None)
+            cookies[documentId] = (expires, entries)
+            if maxsize is not None and len(cookies) > maxsize:
+                self._purge(now)
+                while len(cookies) > maxsize:
+                    cookies.popitem(last=False)
+            self._added += 1
+            purge = self._added >= max(self.PURGE_INTERVAL,
+                                       len(cookies) // 2)
+            if purge:
+                self._added = 0
+        if purge:
+            self.purge()
+
+    def remember(self, documentId, cookies):
+        """
+        Store the given {name: value} cookies (valid for all hosts and
+        paths, without expiry)
+        """
+        if not cookies:
+            return
+        self._store(documentId, tuple(
+                (_intern(str(name)), value, None, '', '/')
+                for (name, value) in cookies.items()))
+
+    def remember_set_cookie(self, documentId, values, url):
+        """
+        Store the cookies of the given Set-Cookie header values,
+        received from the given (service) URL
+        """
+        now = time()
+        self._store(documentId, tuple(
+                entry for entry in parse_set_cookie(values, url, now)
+                if entry[EXPIRES] is None or entry[EXPIRES] > now), now)
+
+    def _valid(self, documentId, url=None):
+        stored = self._cookies.get(documentId)
+        if not stored:
+            return ()
+        expires, entries = stored
+        now = time()
+        if expires is not None and expires <= now:
+            return ()
+        if url is not None:
+            parts = urlsplit(url)
+            host = (parts.hostname or '').lower()
+            path = parts.path or '/'
+        return [entry for entry in entries
+                if (entry[EXPIRES] is None or entry[EXPIRES] > now)
+                and (url is None
+                     or ((not entry[DOMAIN]
+                          or domain_matches(host, entry[DOMAIN]))
+                         and path_matches(path, entry[PATH])))]
+
+    def cookies(self, documentId, url=None):
+        """
+        Return the cookies dict for the given document (and URL, if given),
+        or None
+        """
+        valid = self._valid(documentId, url)
+        if not valid:
+            return None
+        return dict((entry[NAME], entry[VALUE]) for entry in valid)
+
+    def header(self, documentId, url):
+        """
+        Return the Cookie header value for a request to the given URL
+        concerning the given document, or None
+        """
+        valid = self._valid(documentId, url)
+        if not valid:
+            return None
+        return '; '.join('%s=%s' % (entry[NAME], entry[VALUE])
+                         for entry in valid)
+
+    def forget(self, documentId):
+        with self._lock:
+            self._cookies.pop(documentId, None)
+
+    def purge(self):
+        """
+        Remove the documents whose cookies have all expired (including
+        those without an expiry, after `ttl` seconds); return their number
+        """
+        with self._lock:
+            return self._purge(time())
+
+    def _purge(self, now):
+        # (with the lock held)
+        expired = [documentId
+                   for (documentId, (expires, entries))
+                   in self._cookies.items()
+                   if expires is not None and expires <= now]
+        for documentId in expired:
+            del self._cookies[documentId]
+        return len(expired)
+
+    def __len__(self):
+        return len(self._cookies)
@@ -0,0 +1,69 @@
+"""
+pdfreactor.stats: simple counters for client statistics
+
+The PDFreactor client objects have a `stats` attribute, which is a Counters
+instance; the keys are created on first use:
+
+- requests_compressed, request_bytes_raw, request_bytes_sent,
+  request_bytes_saved:
+  for request bodies which were gzip-compressed
+- responses_decompressed, response_bytes_received, response_bytes_decoded:
+  for gzip-encoded response bodies
+"""
+
+# Python compatibility:
+try:
+    from threading import Lock
+except ImportError:
+    from dummy_threading import Lock
+
+__all__ = [
+    'Counters',
+    ]
+
+
+class Counters(dict):
+    """
+    A dict of numeric counters which may be shared by several threads
+
+    >>> c = Counters()
+    >>> c.add('requests')
+    1
+    >>> c.add('bytes', 1000)
+    1000
+    >>> c.add('bytes', 24)
+    1024
+    >>> sorted(c.items())
+    [('bytes', 1024), ('requests', 1)]
+
+    Missing counters are 0:
+    >>> c['other']
+    0
+    """
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self._lock = Lock()
+
+    def __missing__(self, key):
+        return 0
+
+    def add(self, key, value=1):
+        with self._lock:
+            value += dict.get(self, key, 0)
+            self[key] = value
+        return value
+
+    def update_many(self, **kwargs):
+        """
+        Increase several counters at once
+
+        >>> c = Counters(a=1)
+        >>> c.update_many(a=2, b=3)
+        >>> sorted(c.items())
+        [('a', 3), ('b', 3)]
+        """
+        with self._lock:
+            get = dict.get
+            for key, value in kwargs.items():
+                self[key] = get(self, key, 0) + value
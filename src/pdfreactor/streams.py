@@ -0,0 +1,83 @@
+"""
+pdfreactor.streams: binary responses which are read chunk by chunk
+
+The PDFreactor methods convertAsBinaryStream and getDocumentAsBinaryStream
+return a BinaryResponse instead of the complete document; this can be
+iterated, read in parts, and must be closed (or used as a context manager):
+
+    with client.convertAsBinaryStream(config) as binary:
+        for chunk in binary:
+            sink.write(chunk)
+"""
+
+from .compression import is_gzip_encoded
+
+__all__ = [
+    'BinaryResponse',
+    ]
+
+
+class BinaryResponse(object):
+    """
+    The body of a binary response from the PDFreactor service
+
+    length -- the number of bytes, if known from the Content-Length header
+    content_type -- the value of the Content-Type header
+    status -- the HTTP status code (e.g. 206 for a partial response)
+
+    Like a raw file, read(amt) returns up to amt bytes: the data received
+    so far (or waits for some), so the deadline of the call (if any) is
+    checked while a slow response trickles in.
+    """
+
+    CHUNK = 64 * 1024
+
+    def __init__(self, response, deadline=None, chunksize=None):
+        self._response = response
+        self._deadline = deadline
+        self._read1 = getattr(response, 'read1', None) or response.read
+        if chunksize is not None:
+            self.CHUNK = chunksize
+        info = response.info()
+        self.headers = info
+        self.status = response.getcode()
+        self.content_type = info.get('Content-Type')
+        length = None
+        if not is_gzip_encoded(info):
+            value = info.get('Content-Length')
+            if value:
+                try:
+                    length = int(value)
+                except ValueError:
+                    pass
+        self.length = length
+        self.closed = False
+
+    def read(self, amt=None):
+        deadline = self._deadline
+        if deadline is not None and deadline.expired():
+            self.close()
+            deadline.check()
+        if amt is None:
+            return self._response.read()
+        return self._read1(amt)
+
+    def __iter__(self):
+        read = self.read
+        size = self.CHUNK
+        while True:
+            chunk = read(size)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._response.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
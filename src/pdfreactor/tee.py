@@ -0,0 +1,221 @@
+"""
+pdfreactor.tee: write a binary result to several sinks at once
+
+A Tee is a writable stream which passes every chunk on to all of its sinks,
+and computes digests on the way; it can be given as the `stream` argument of
+convertAsBinary or getDocumentAsBinary, so the document is read from the
+wire once and never kept in memory completely:
+
+    with open('/exports/report.pdf', 'wb') as fo:
+        tee = Tee(fo, upload, digests=('sha256', 'md5'))
+        client.convertAsBinary(config, tee)
+    tee.hexdigest('md5')  # e.g. to compare with an S3 ETag
+
+By default, each chunk is written to one sink after the other; with
+threaded=True, every sink is fed by a thread of its own through a bounded
+queue, so the sinks work in parallel while the slowest one still limits
+the reading speed (backpressure).
+
+For asyncio sinks, see pdfreactor.aio.tee_binary.
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import hashlib
+from threading import Thread
+
+try:
+    from queue import Queue
+except ImportError:  # Python 2
+    from Queue import Queue
+
+__all__ = [
+    'Tee',
+    'new_digests',
+    ]
+
+_DONE = object()
+
+
+def new_digests(names):
+    """
+    Return a dict of fresh hash objects for the given algorithm names
+
+    >>> sorted(new_digests(['sha256', 'md5']))
+    ['md5', 'sha256']
+    """
+    res = {}
+    for name in names:
+        try:  # MD5 is used for checksums (e.g. ETags) only:
+            res[name] = hashlib.new(name, usedforsecurity=False)
+        except TypeError:  # Python < 3.9
+            res[name] = hashlib.new(name)
+    return res
+
+
+class _SinkWorker(object):
+    """
+    Feed a sink from a bounded queue, in a thread of its own
+    """
+
+    def __init__(self, sink, maxsize):
+        self.sink = sink
+        self.queue = Queue(maxsize)
+        self.error = None
+        self.aborted = False
+        self.thread = Thread(target=self._run, name='pdfreactor-tee')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        get = self.queue.get
+        write = self.sink.write
+        while True:
+            chunk = get()
+            if chunk is _DONE:
+                return
+            if self.error is None and not self.aborted:
+                try:
+                    write(chunk)
+                except BaseException as e:
+                    # keep consuming, lest the reader block forever:
+                    self.error = e
+
+    def put(self, chunk):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(chunk)
+
+    def finish(self):
+        self.queue.put(_DONE)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def abort(self):
+        """
+        Discard the pending chunks, and stop the thread
+        """
+        self.aborted = True
+        self.queue.put(_DONE)
+        self.thread.join()
+
+
+class Tee(object):
+    """
+    A writable stream which writes everything to all sinks
+
+    >>> from io import BytesIO
+    >>> a, b = BytesIO(), BytesIO()
+    >>> tee = Tee(a, b, close=False)
+    >>> tee.write(b'%PDF-1.4')
+    >>> tee.close()
+    >>> a.getvalue() == b.getvalue() == b'%PDF-1.4'
+    True
+    >>> tee.size
+    8
+    >>> tee.hexdigest('md5')
+    '914240125319291c7cb7e712e419b254'
+
+    sinks -- objects with a write method (e.g. files)
+    digests -- the names of the hash algorithms to compute
+    threaded -- write to each sink in a thread of its own
+    queuesize -- the number of chunks a threaded sink may lag behind
+    close -- close the sinks when the Tee is closed
+    """
+
+    CHUNK = 64 * 1024  # the preferred chunk size
+
+    def __init__(self, *sinks, **kwargs):
+        digests = kwargs.pop('digests', ('sha256', 'md5'))
+        threaded = kwargs.pop('threaded', False)
+        queuesize = kwargs.pop('queuesize', 8)
+        self._close_sinks = kwargs.pop('close', True)
+        if kwargs:
+            raise TypeError('Unexpected keyword argument(s): %s'
+                            % ', '.join(sorted(kwargs)))
+        self.sinks = sinks
+        self.digests = new_digests(digests)
+        self.size = 0
+        self.closed = False
+        self._workers = None
+        if threaded:
+            self._workers = [_SinkWorker(sink, queuesize) for sink in sinks]
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        for digest in self.digests.values():
+            digest.update(chunk)
+        if self._workers is None:
+            for sink in self.sinks:
+                sink.write(chunk)
+        else:
+            try:
+                for worker in self._workers:
+                    worker.put(chunk)
+            except BaseException:
+                self.abort()
+                raise
+
+    def hexdigest(self, name):
+        return self.digests[name].hexdigest()
+
+    def hexdigests(self):
+        """
+        Return a dict {name: hexdigest}
+        """
+        return dict((name, digest.hexdigest())
+                    for (name, digest) in self.digests.items())
+
+    def close(self):
+        """
+        Wait for the sinks to finish, and close them (unless close=False);
+        errors of the sinks are raised here at the latest
+        """
+        if self.closed:
+            return
+        self.closed = True
+        error = None
+        for worker in self._workers or ():
+            try:
+                worker.finish()
+            except BaseException as e:
+                if error is None:
+                    error = e
+        if self._close_sinks:
+            for sink in self.sinks:
+                close = getattr(sink, 'close', None)
+                if close is not None:
+                    close()
+        if error is not None:
+            raise error
+
+    def abort(self):
+        """
+        Stop writing, e.g. after a read error: the threads are stopped,
+        pending chunks are discarded, and the sinks are closed (unless
+        close=False); errors are ignored
+        """
+        if self.closed:
+            return
+        self.closed = True
+        for worker in self._workers or ():
+            worker.abort()
+        if self._close_sinks:
+            for sink in self.sinks:
+                close = getattr(sink, 'close', None)
+                if close is not None:
+                    try:
+                        close()
+                    except Exception:
+                        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
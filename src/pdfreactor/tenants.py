@@ -0,0 +1,395 @@
+"""
+pdfreactor.tenants: many customers (apiKeys), one connection pool
+
+A Tenants object creates a PDFreactor client per tenant (i.e. per apiKey),
+all of which share one transport (by default, a PooledTransport, so
+kept-alive connections are reused across tenants), one CapabilityCache
+(if requested), and a global quota; each tenant can be given quotas of its
+own, which are enforced locally, before the requests are sent:
+
+    tenants = Tenants(url, max_concurrent=16)
+    tenants.add('acme', acme_key, max_concurrent=4, rate=10)
+    tenants.add('globex', globex_key, max_concurrent=8)
+    pdf = tenants['acme'].convertAsBinary(config)
+
+Quotas:
+
+max_concurrent -- the number of requests in progress at the same time
+                  (a synchronous conversion occupies its slot until the
+                  response arrives; a streamed document body is not
+                  counted while it is read)
+rate, burst -- the number of requests per second, and the number of
+               requests which may be sent at once after an idle period
+               (default: rate, at least 1)
+max_documents -- the number of asynchronous conversions not yet deleted
+                 (deleteDocument, e.g. by an AsyncJob when closed)
+
+A request which exceeds a quota waits until it can be sent, but not longer
+than `quota_timeout` seconds (default: indefinitely) or the deadline of
+the call; then a QuotaExceededException (or TimeoutException) is raised.
+
+The clients work in thread-safe mode by default (threadsafe=True), so each
+of them can be shared by many threads.
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+from threading import Lock, Semaphore
+from time import sleep
+
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+from .api import PDFreactor
+from .capabilities import CapabilityCache
+from .exceptions import QuotaExceededException
+from .stats import Counters
+from .transport import PooledTransport
+
+__all__ = [
+    'Tenants',
+    'TenantClient',
+    'Quota',
+    'RateLimit',
+    ]
+
+
+def _acquire(semaphore, timeout):
+    if timeout is None:
+        return semaphore.acquire()
+    try:
+        return semaphore.acquire(True, max(timeout, 0))
+    except TypeError:  # Python 2: no timeout
+        return semaphore.acquire(timeout > 0)
+
+
+def _min_timeout(*values):
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    return min(values)
+
+
+class RateLimit(object):
+    """
+    A token bucket: `rate` requests per second, up to `burst` at once
+
+    reserve returns the time to wait before the request may be sent
+    (the token is reserved, so concurrent callers queue up):
+
+    >>> limit = RateLimit(2, burst=2)
+    >>> limit.reserve(), limit.reserve()
+    (0.0, 0.0)
+    >>> 0.45 < limit.reserve() <= 0.5
+    True
+    >>> limit.cancel()  # the request wasn't sent after all
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        if burst is None:
+            burst = max(rate, 1)
+        self.burst = burst
+        self._tokens = float(burst)
+        self._stamp = monotonic()
+        self._lock = Lock()
+
+    def reserve(self):
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(self._tokens
+                               + (now - self._stamp) * self.rate,
+                               self.burst)
+            self._stamp = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def cancel(self):
+        with self._lock:
+            self._tokens += 1
+
+
+class Quota(object):
+    """
+    Local limits for the requests of a tenant (or of all tenants)
+
+    >>> quota = Quota(max_concurrent=1, timeout=0, name='acme')
+    >>> quota.acquire()
+    >>> quota.acquire()
+    Traceback (most recent call last):
+      ...
+    pdfreactor.exceptions.QuotaExceededException: Quota exceeded: concurrency (tenant acme)
+    >>> quota.release()
+    >>> quota.acquire()
+    >>> quota.release()
+
+    With a parent quota (shared by all tenants), both apply.
+    """
+
+    def __init__(self, max_concurrent=None, rate=None, burst=None,
+                 max_documents=None, timeout=None, parent=None, name=None):
+        self.max_concurrent = max_concurrent
+        self._slots = None
+        if max_concurrent is not None:
+            self._slots = Semaphore(max_concurrent)
+        self.rate = None
+        if rate is not None:
+            self.rate = RateLimit(rate, burst)
+        self.max_documents = max_documents
+        self._documents = None
+        if max_documents is not None:
+            self._documents = Semaphore(max_documents)
+        self.timeout = timeout
+        self.parent = parent
+        self.name = name
+        # waits: requests which had to wait; exceeded: which gave up
+        self.stats = Counters()
+
+    def _limit(self, start, deadline, timeout=None):
+        """
+        The remaining time to wait (None: indefinitely)
+        """
+        limit = None
+        timeout = _min_timeout(self.timeout, timeout)
+        if timeout is not None:
+            limit = timeout - (monotonic() - start)
+        if deadline is not None:
+            limit = _min_timeout(limit, deadline.remaining())
+        return limit
+
+    def _exceeded(self, what, deadline):
+        self.stats.add('exceeded')
+        if deadline is not None:
+            deadline.check()  # raises TimeoutException, if expired
+        raise QuotaExceededException(what, self.name)
+
+    def _wait(self, semaphore, what, start, deadline, timeout=None):
+        if semaphore.acquire(False):
+            return
+        self.stats.add('waits')
+        if not _acquire(semaphore, self._limit(start, deadline, timeout)):
+            self._exceeded(what, deadline)
+
+    def acquire(self, deadline=None, timeout=None):
+        """
+        Wait for a request slot (and, if rate-limited, for its turn)
+
+        timeout -- the time left to wait (if less than our own timeout);
+                   a child quota passes what remains of its timeout to
+                   the parent, so the total wait doesn't exceed it
+        """
+        start = monotonic()
+        if self._slots is not None:
+            self._wait(self._slots, 'concurrency', start, deadline, timeout)
+        try:
+            if self.rate is not None:
+                delay = self.rate.reserve()
+                if delay:
+                    self.stats.add('waits')
+                    limit = self._limit(start, deadline, timeout)
+                    if limit is not None and delay > limit:
+                        self.rate.cancel()
+                        self._exceeded('rate', deadline)
+                    sleep(delay)
+            if self.parent is not None:
+                self.parent.acquire(deadline,
+                                    self._limit(start, deadline, timeout))
+        except BaseException:
+            if self._slots is not None:
+                self._slots.release()
+            raise
+
+    def release(self):
+        if self.parent is not None:
+            self.parent.release()
+        if self._slots is not None:
+            self._slots.release()
+
+    def acquire_document(self, deadline=None):
+        """
+        Wait until another asynchronous conversion may be started
+        """
+        if self._documents is not None:
+            self._wait(self._documents, 'documents', monotonic(), deadline)
+
+    def release_document(self):
+        if self._documents is not None:
+            self._documents.release()
+
+
+class TenantClient(PDFreactor):
+    """
+    A PDFreactor client for one tenant (see Tenants.add)
+
+    The apiKey query string is built once, rather than for each request;
+    every request is subject to the quota of the tenant.
+    """
+
+    def __init__(self, url=None, apiKey=None, quota=None, name=None,
+                 **options):
+        PDFreactor.__init__(self, url, **options)
+        self.apiKey = apiKey
+        self.quota = quota
+        self.name = name
+        self._documents = set()
+        self._documents_lock = Lock()
+
+    @property
+    def apiKey(self):
+        return self._apiKey
+
+    @apiKey.setter
+    def apiKey(self, apiKey):
+        self._apiKey = apiKey
+        self._query = '' if apiKey is None else '?apiKey=' + apiKey
+
+    def _service_url(self, path):
+        return self.url + path + self._query
+
+    def _open(self, url, headers, config=None, method='POST',
+              timeout=None, deadline=None):
+        quota = self.quota
+        if quota is None:
+            return PDFreactor._open(self, url, headers, config, method,
+                                    timeout, deadline)
+        # the version request (if any) waits for a quota slot of its own:
+        self._capabilities()
+        quota.acquire(deadline)
+        try:
+            return PDFreactor._open(self, url, headers, config, method,
+                                    timeout, deadline)
+        finally:
+            quota.release()
+
+    def convertAsync(self, config, connectionSettings=None):
+        quota = self.quota
+        if quota is None or quota.max_documents is None:
+            return PDFreactor.convertAsync(self, config, connectionSettings)
+        quota.acquire_document()
+        try:
+            documentId = PDFreactor.convertAsync(self, config,
+                                                 connectionSettings)
+        except BaseException:
+            quota.release_document()
+            raise
+        if documentId is None:
+            # (no Location header; there is nothing to be deleted later)
+            quota.release_document()
+            return documentId
+        with self._documents_lock:
+            self._documents.add(documentId)
+        return documentId
+
+    def deleteDocument(self, documentId, connectionSettings=None):
+        try:
+            PDFreactor.deleteDocument(self, documentId, connectionSettings)
+        finally:
+            # (if the deletion failed, e.g. because the document has
+            # expired already, the slot is released nevertheless)
+            with self._documents_lock:
+                counted = documentId in self._documents
+                self._documents.discard(documentId)
+            if counted:
+                self.quota.release_document()
+
+
+class Tenants(object):
+    """
+    PDFreactor clients for many tenants, sharing one transport
+
+    url -- the service URL (for all tenants)
+    transport -- the shared transport (default: a new PooledTransport)
+    max_concurrent, rate, burst -- the global quota (for all tenants)
+    quota_timeout -- the maximum time a request waits for its quotas
+    options -- further options for the PDFreactor clients (e.g. compress,
+               timeout, lazy); capabilities=True creates a shared
+               CapabilityCache
+
+    >>> tenants = Tenants('http://localhost:9423/service/rest',
+    ...                   max_concurrent=8)
+    >>> acme = tenants.add('acme', 'KEY1', max_concurrent=2, rate=5)
+    >>> acme._service_url('/convert.json')
+    'http://localhost:9423/service/rest/convert.json?apiKey=KEY1'
+    >>> tenants['acme'] is acme, 'globex' in tenants
+    (True, False)
+    >>> acme.transport is tenants.add('globex', 'KEY2').transport
+    True
+    >>> sorted(tenants)
+    ['acme', 'globex']
+    """
+
+    def __init__(self, url=None, transport=None, max_concurrent=None,
+                 rate=None, burst=None, quota_timeout=None, **options):
+        self.url = url
+        if transport is None:
+            transport = PooledTransport()
+        self.transport = transport
+        options.setdefault('threadsafe', True)
+        if options.get('capabilities') is True:
+            options['capabilities'] = CapabilityCache()
+        self.options = options
+        self.quota_timeout = quota_timeout
+        self.quota = Quota(max_concurrent, rate, burst,
+                           timeout=quota_timeout)
+        self._clients = {}
+        self._lock = Lock()
+
+    def add(self, name, apiKey, max_concurrent=None, rate=None, burst=None,
+            max_documents=None):
+        """
+        Create (or replace) the client of the given tenant, and return it
+        """
+        quota = Quota(max_concurrent, rate, burst, max_documents,
+                      timeout=self.quota_timeout, parent=self.quota,
+                      name=name)
+        client = TenantClient(self.url, apiKey, quota, name,
+                              transport=self.transport, **self.options)
+        with self._lock:
+            self._clients[name] = client
+        return client
+
+    def remove(self, name):
+        with self._lock:
+            self._clients.pop(name, None)
+
+    def __getitem__(self, name):
+        return self._clients[name]
+
+    def get(self, name, default=None):
+        return self._clients.get(name, default)
+
+    def __contains__(self, name):
+        return name in self._clients
+
+    def __iter__(self):
+        return iter(list(self._clients))
+
+    def __len__(self):
+        return len(self._clients)
+
+    def stats(self):
+        """
+        Return a dict {tenant: dict of counters}, including the numbers
+        of requests which had to wait for a quota of the tenant
+        ('quota_waits'), or gave up ('quota_exceeded')
+        """
+        with self._lock:
+            clients = list(self._clients.items())
+        res = {}
+        for name, client in clients:
+            counters = dict(client.stats)
+            for key, value in client.quota.stats.items():
+                counters['quota_' + key] = value
+            res[name] = counters
+        return res
+
+    def close(self):
+        """
+        Close the shared transport (e.g. the kept-alive connections)
+        """
+        self.transport.close()
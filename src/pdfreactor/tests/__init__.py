@@ -0,0 +1,3 @@
+"""
+pdfreactor.tests: behavioural tests, against a stub service (see .stub)
+"""
@@ -0,0 +1,228 @@
+"""
+pdfreactor.tests.stub: a PDFreactor-like HTTP service, for tests
+
+A StubService listens on a free port of the loopback interface, in a
+thread of its own; the tests register handlers for (method, path) pairs,
+where the path is relative to the service URL:
+
+    service = StubService()
+    service.on('GET', '/version.json', lambda request: (200, {}, {...}))
+    client = PDFreactor(service.url)
+    ...
+    service.close()
+
+A handler is given a StubRequest and returns a tuple (status, headers,
+body), where a body which is not bytes is sent as JSON; or it controls
+the connection itself (request.drop(), request.send(..., cut=n)) and
+returns None.  All requests are recorded in service.requests; unknown
+paths are answered with 404.
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import json
+import sys
+import zlib
+from threading import Lock, Thread
+
+if sys.version_info[0] == 2:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlsplit
+else:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlsplit
+
+__all__ = [
+    'StubService',
+    'StubRequest',
+    'PDF',
+    'version',
+    ]
+
+BASE = '/service/rest'
+
+PDF = b'%PDF-1.4\n' + b''.join(b'%% line %d\n' % i for i in range(5000))
+
+
+def version(major=8, minor=1):
+    """
+    The response body of /version.json
+    """
+    return {'major': major, 'minor': minor, 'micro': 0,
+            'label': '%d.%d' % (major, minor)}
+
+
+class StubRequest(object):
+    """
+    A request received by the StubService
+
+    index -- the number of preceding requests on the same connection
+    body -- the request body (de-chunked and decompressed)
+    """
+
+    def __init__(self, handler, method, path, query, headers, raw, body,
+                 index):
+        self._handler = handler
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.raw = raw
+        self.body = body
+        self.index = index
+
+    def json(self):
+        return json.loads(self.body.decode('utf-8'))
+
+    def drop(self):
+        """
+        Close the connection without a response
+        """
+        self._handler.close_connection = True
+
+    def send(self, status, headers=None, body=b'', cut=None, close=False):
+        """
+        Send the response; with `cut`, only that many bytes of the body
+        (but the full Content-Length), and close the connection
+        """
+        handler = self._handler
+        handler.send_response(status)
+        headers = dict(headers or ())
+        headers.setdefault('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            if isinstance(value, (list, tuple)):
+                for item in value:
+                    handler.send_header(name, item)
+            else:
+                handler.send_header(name, value)
+        handler.end_headers()
+        if cut is not None:
+            body = body[:cut]
+            close = True
+        try:
+            handler.wfile.write(body)
+            handler.wfile.flush()
+        except (IOError, OSError):  # the client gave up
+            close = True
+        if close:
+            handler.close_connection = True
+
+    def __repr__(self):
+        return '<StubRequest %s %s>' % (self.method, self.path)
+
+
+def _read_body(handler):
+    headers = handler.headers
+    if (headers.get('Transfer-Encoding') or '').lower() == 'chunked':
+        chunks = []
+        while True:
+            size = int(handler.rfile.readline().split(b';')[0], 16)
+            if not size:
+                handler.rfile.readline()
+                return b''.join(chunks)
+            chunks.append(handler.rfile.read(size))
+            handler.rfile.readline()
+    length = int(headers.get('Content-Length') or 0)
+    return handler.rfile.read(length)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.served = 0
+
+    def _dispatch(self):
+        service = self.server.service
+        parts = urlsplit(self.path)
+        path = parts.path
+        if path.startswith(BASE):
+            path = path[len(BASE):]
+        raw = _read_body(self)
+        body = raw
+        if (self.headers.get('Content-Encoding') or '').lower() == 'gzip':
+            body = zlib.decompress(raw, 16 + zlib.MAX_WBITS)
+        method = self.command.upper()
+        request = StubRequest(self, method, path, parse_qs(parts.query),
+                              self.headers, raw, body, self.served)
+        self.served += 1
+        handler = service.handler(method, path, request)
+        if handler is None:
+            request.send(404, {'Content-Type': 'application/json'},
+                         b'{"error": "not found"}')
+            return
+        res = handler(request)
+        if res is None:
+            return
+        status, headers, body = res
+        headers = dict(headers or ())
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+            headers.setdefault('Content-Type', 'application/json')
+        request.send(status, headers, body)
+
+    # (the UrllibTransport sends lowercase methods)
+    do_GET = do_get = do_POST = do_post = do_DELETE = do_delete = _dispatch
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class StubService(object):
+    """
+    A stub of the PDFreactor REST service (see the module docstring)
+    """
+
+    def __init__(self):
+        self.requests = []
+        self._handlers = {}
+        self._lock = Lock()
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.service = self
+        self.url = 'http://127.0.0.1:%d%s' % (self._server.server_port,
+                                              BASE)
+        self._thread = Thread(target=self._server.serve_forever,
+                              kwargs={'poll_interval': 0.05})
+        self._thread.daemon = True
+        self._thread.start()
+
+    def on(self, method, path, handler):
+        """
+        Answer the requests for the given method and path (a string, or
+        a prefix ending with '*') by the given function
+        """
+        self._handlers[(method.upper(), path)] = handler
+
+    def handler(self, method, path, request):
+        with self._lock:
+            self.requests.append(request)
+        handler = self._handlers.get((method, path))
+        if handler is not None:
+            return handler
+        for (hmethod, hpath), handler in self._handlers.items():
+            if (hmethod == method and hpath.endswith('*')
+                    and path.startswith(hpath[:-1])):
+                return handler
+        return None
+
+    def received(self, method=None, path=None):
+        """
+        Return the recorded requests (for the given method and path)
+        """
+        with self._lock:
+            return [request for request in self.requests
+                    if (method is None or request.method == method)
+                    and (path is None or request.path == path)]
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
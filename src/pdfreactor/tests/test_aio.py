@@ -0,0 +1,78 @@
+"""
+Tests of the asyncio support
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import unittest
+from threading import Event
+
+try:
+    import asyncio
+    from pdfreactor.aio import iterate_blocking
+except (ImportError, SyntaxError):  # Python 2
+    asyncio = None
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+@unittest.skipIf(asyncio is None, 'asyncio is not available')
+class TestIterateBlocking(unittest.TestCase):
+
+    def setUp(self):
+        self.release = Event()
+        self.closed = Event()
+
+    def tearDown(self):
+        self.release.set()
+
+    def generator(self):
+        try:
+            yield 1
+            self.release.wait(5)  # e.g. a slow conversion
+            yield 2
+        finally:
+            self.closed.set()
+
+    def test_items(self):
+        self.release.set()
+
+        async def collect():
+            return [item async for item in iterate_blocking(self.generator())]
+        self.assertEqual(run(collect()), [1, 2])
+        self.assertTrue(self.closed.is_set())
+
+    def test_cancelled_while_fetching(self):
+        # the generator is closed when the pending next() returns:
+        items = []
+
+        async def consume():
+            async for item in iterate_blocking(self.generator()):
+                items.append(item)
+
+        async def main():
+            task = asyncio.ensure_future(consume())
+            while not items:
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.05)  # fetching the second item
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                return 'cancelled'
+        self.assertEqual(run(main()), 'cancelled')
+        self.assertFalse(self.closed.is_set())
+        self.release.set()
+        self.assertTrue(self.closed.wait(5))
+        self.assertEqual(items, [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
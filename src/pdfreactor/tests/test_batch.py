@@ -0,0 +1,96 @@
+"""
+Tests of the batch converter
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+import unittest
+from base64 import b64decode
+
+from pdfreactor.batch import main
+from pdfreactor.tests.stub import PDF, StubService
+
+
+def decoded(data_uri):
+    prefix, data = data_uri.split(',', 1)
+    return prefix, b64decode(data)
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.service = StubService()
+        self.service.on('POST', '/convert.bin', lambda request: (
+                200, {'Content-Type': 'application/pdf'}, PDF))
+        self.directory = tempfile.mkdtemp()
+        self.input = os.path.join(self.directory, 'input')
+        self.output = os.path.join(self.directory, 'output')
+        os.makedirs(os.path.join(self.input, 'sub'))
+        # a file in Latin-1, which is not valid UTF-8:
+        with open(os.path.join(self.input, 'sub', 'a.html'), 'wb') as fo:
+            fo.write(b'<p>\xe4</p>')
+        self.cwd = os.getcwd()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.service.close()
+        shutil.rmtree(self.directory)
+
+    def run_main(self, *options, **kwargs):
+        return main([kwargs.get('input', self.input),
+                     '--url', self.service.url,
+                     '--output', self.output, '--quiet'] + list(options))
+
+    def test_encoding(self):
+        self.assertEqual(self.run_main('--encoding', 'iso-8859-1'), 0)
+        with open(os.path.join(self.output, 'sub', 'a.pdf'), 'rb') as fo:
+            self.assertEqual(fo.read(), PDF)
+        request, = self.service.received('POST')
+        self.assertEqual(decoded(request.json()['document']),
+                         ('data:text/html;charset=iso-8859-1;base64',
+                          b'<p>\xe4</p>'))
+
+    def test_bytes_unchanged(self):
+        self.assertEqual(self.run_main(), 0)
+        request, = self.service.received('POST')
+        self.assertEqual(decoded(request.json()['document']),
+                         ('data:text/html;base64', b'<p>\xe4</p>'))
+
+    def test_resumed(self):
+        self.assertEqual(self.run_main(), 0)
+        self.assertEqual(self.run_main(), 0)
+        self.assertEqual(len(self.service.received('POST')), 1)
+
+    def test_resumed_elsewhere(self):
+        # the checkpoint doesn't depend on the working directory:
+        os.chdir(self.directory)
+        self.assertEqual(self.run_main(input='input'), 0)
+        os.chdir(self.input)
+        self.assertEqual(self.run_main(input='.'), 0)
+        self.assertEqual(len(self.service.received('POST')), 1)
+
+    def test_failed(self):
+        self.service.on('POST', '/convert.bin', lambda request: (
+                500, {}, {'error': 'failed'}))
+        self.assertEqual(self.run_main(), 1)
+        self.assertEqual(self.run_main(), 0)  # not retried
+        self.assertEqual(self.run_main('--retry-failed'), 1)
+        self.assertEqual(len(self.service.received('POST')), 2)
+
+    def test_colliding_names(self):
+        manifest = os.path.join(self.directory, 'manifest.txt')
+        with open(manifest, 'w') as fo:
+            fo.write('http://a.example/x/index\n'
+                     'http://b.example/y/index\n')
+        self.assertEqual(self.run_main(input=manifest), 0)
+        self.assertEqual(sorted(name for name in os.listdir(self.output)
+                                if name.endswith('.pdf')),
+                         ['index-2.pdf', 'index.pdf'])
+
+
+if __name__ == '__main__':
+    unittest.main()
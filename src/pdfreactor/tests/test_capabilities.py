@@ -0,0 +1,115 @@
+"""
+Tests of the capability cache, and of the features learned from responses
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import unittest
+from threading import Thread
+
+from pdfreactor.api import PDFreactor
+from pdfreactor.capabilities import CapabilityCache
+from pdfreactor.exceptions import ServerException
+from pdfreactor.tests.stub import StubService, version
+
+PROGRESS = '/progress/doc1.json'
+
+
+class TestCapabilities(unittest.TestCase):
+
+    def setUp(self):
+        self.service = StubService()
+        self.service.on('GET', '/version.json',
+                        lambda request: (200, {}, version()))
+        self.service.on('GET', PROGRESS, lambda request: (
+                200, {}, {'documentId': 'doc1', 'finished': True,
+                          'progress': 100}))
+
+    def tearDown(self):
+        self.service.close()
+
+    def paths(self):
+        return [request.path for request in self.service.received()]
+
+    def test_supports(self):
+        # the version request of a fresh client doesn't wait for itself:
+        client = PDFreactor(self.service.url, capabilities=True)
+        result = []
+        thread = Thread(target=lambda: result.append(
+                client.supports('document_metadata')))
+        thread.daemon = True
+        thread.start()
+        thread.join(5)
+        self.assertEqual(result, [True])
+        self.assertEqual(client.supports('gzip_requests'), None)
+        self.assertEqual(self.paths(), ['/version.json'])
+
+    def test_discovered_once(self):
+        client = PDFreactor(self.service.url, capabilities=True)
+        for i in range(3):
+            client.getProgress('doc1')
+        self.assertEqual(self.paths(), ['/version.json'] + [PROGRESS] * 3)
+        self.assertEqual(client.supports('callbacks'), True)
+
+    def test_old_version(self):
+        self.service.on('GET', '/version.json',
+                        lambda request: (200, {}, version(7, 3)))
+        client = PDFreactor(self.service.url, capabilities=True)
+        self.assertEqual(client.supports('merge_documents'), False)
+
+    def test_failing_version(self):
+        # the version is unknown; the requests are sent nevertheless:
+        self.service.on('GET', '/version.json',
+                        lambda request: (500, {}, {'error': 'down'}))
+        client = PDFreactor(self.service.url, capabilities=True)
+        client.getProgress('doc1')
+        client.getProgress('doc1')
+        self.assertEqual(len(self.service.received('GET', '/version.json')),
+                         1)
+        with self.assertRaises(ServerException):
+            client.supports('callbacks')
+
+
+class TestLearned(unittest.TestCase):
+    """
+    The compression features are learned from the responses
+    """
+
+    def setUp(self):
+        self.service = StubService()
+        self.service.on('GET', '/version.json',
+                        lambda request: (200, {}, version()))
+        self.service.on('POST', '/convert/async.json', self.accept)
+        self.gzip = True
+        self.client = PDFreactor(self.service.url, capabilities=True,
+                                 compress=10)
+
+    def tearDown(self):
+        self.service.close()
+
+    def accept(self, request):
+        if (request.headers.get('Content-Encoding') == 'gzip'
+                and not self.gzip):
+            return 415, {}, {'error': 'Unsupported Media Type'}
+        return 201, {'Location': 'progress/doc1'}, b''
+
+    def encodings(self):
+        return [request.headers.get('Content-Encoding')
+                for request in self.service.received('POST')]
+
+    def test_gzip_accepted(self):
+        self.client.convertAsync({'document': '<p>' * 10})
+        self.assertEqual(self.client.supports('gzip_requests'), True)
+
+    def test_gzip_rejected(self):
+        self.gzip = False
+        with self.assertRaises(ServerException):
+            self.client.convertAsync({'document': '<p>' * 10})
+        self.assertEqual(self.client.supports('gzip_requests'), False)
+        self.client.convertAsync({'document': '<p>' * 10})
+        self.assertEqual(self.encodings(), ['gzip', None])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+"""
+Tests of the compression of request bodies, and of responses
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import json
+import unittest
+from base64 import b64decode
+
+from pdfreactor.api import PDFreactor
+from pdfreactor.compression import gzip_chunks
+from pdfreactor.inputs import BinaryDocument
+from pdfreactor.tests.stub import PDF, StubService
+from pdfreactor.transport import PooledTransport
+
+
+class TestRequestCompression(unittest.TestCase):
+
+    def setUp(self):
+        self.service = StubService()
+        self.service.on('POST', '/convert.json', self.converted)
+
+    def tearDown(self):
+        self.service.close()
+
+    def converted(self, request):
+        return 200, {}, {'document': 'JVBERg==', 'finished': True}
+
+    def check(self, client, config):
+        client.convert(config)
+        request, = self.service.received('POST', '/convert.json')
+        self.assertEqual(request.headers.get('Content-Encoding'), 'gzip')
+        self.assertTrue(len(request.raw) < len(request.body))
+        return request.json()
+
+    def test_gzip_json(self):
+        transport = PooledTransport()
+        client = PDFreactor(self.service.url, compress=1000,
+                            transport=transport)
+        document = '<p>Lorem ipsum</p>' * 1000
+        self.assertEqual(self.check(client, {'document': document}
+                                    )['document'], document)
+        transport.close()
+        self.assertEqual(client.stats['requests_compressed'], 1)
+
+    def test_gzip_binary_document(self):
+        client = PDFreactor(self.service.url, compress=1000)
+        document = b'<p>\xe4</p>' * 10000
+        config = self.check(client,
+                            {'document': BinaryDocument(document)})
+        prefix, data = config['document'].split(',', 1)
+        self.assertEqual(prefix, 'data:text/html;base64')
+        self.assertEqual(b64decode(data), document)
+        self.assertEqual(config['clientName'], 'PYTHON')
+
+    def test_small_body_uncompressed(self):
+        client = PDFreactor(self.service.url, compress=1000)
+        client.convert({'document': '<p>'})
+        request, = self.service.received('POST', '/convert.json')
+        self.assertIsNone(request.headers.get('Content-Encoding'))
+        self.assertEqual(json.loads(request.raw.decode('utf-8'))['document'],
+                         '<p>')
+
+
+class TestResponseDecompression(unittest.TestCase):
+
+    def setUp(self):
+        self.service = StubService()
+        self.service.on('POST', '/convert.bin', self.converted)
+
+    def tearDown(self):
+        self.service.close()
+
+    def converted(self, request):
+        if 'gzip' in (request.headers.get('Accept-Encoding') or ''):
+            return (200, {'Content-Type': 'application/pdf',
+                          'Content-Encoding': 'gzip'},
+                    b''.join(gzip_chunks(PDF)))
+        return 200, {'Content-Type': 'application/pdf'}, PDF
+
+    def test_negotiated(self):
+        client = PDFreactor(self.service.url, decompress=True,
+                            transport=PooledTransport())
+        self.assertEqual(client.convertAsBinary({'document': '<p>'}), PDF)
+        request, = self.service.received('POST')
+        self.assertEqual(request.headers.get('Accept-Encoding'), 'gzip')
+        self.assertEqual(client.stats['responses_decompressed'], 1)
+
+    def test_not_requested(self):
+        client = PDFreactor(self.service.url)
+        self.assertEqual(client.convertAsBinary({'document': '<p>'}), PDF)
+        request, = self.service.received('POST')
+        self.assertNotEqual(request.headers.get('Accept-Encoding'), 'gzip')
+
+
+if __name__ == '__main__':
+    unittest.main()
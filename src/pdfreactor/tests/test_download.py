@@ -0,0 +1,184 @@
+"""
+Tests of the downloads to files: resuming, ranges, temporary files,
+preallocation, permissions
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import os
+import re
+import shutil
+import stat
+import tempfile
+import unittest
+from threading import Thread
+
+from pdfreactor.api import PDFreactor
+from pdfreactor.download import IncompleteDownload
+from pdfreactor.tests.stub import PDF, StubService
+from pdfreactor.transport import PooledTransport
+
+DOCUMENT = '/document/doc1.bin'
+RANGE = re.compile(r'^bytes=(\d+)-(\d*)$')
+
+
+def document(request):
+    return 200, {'Content-Type': 'application/pdf'}, PDF
+
+
+class Document(object):
+    """
+    Serve PDF, supporting range requests; the first `cut` responses
+    are cut off after half of the requested bytes
+    """
+
+    def __init__(self, cut=1, etag='"v1"'):
+        self.cut = cut
+        self.etag = etag
+
+    def __call__(self, request):
+        headers = {'Content-Type': 'application/pdf',
+                   'Accept-Ranges': 'bytes',
+                   'ETag': self.etag}
+        status = 200
+        body = PDF
+        match = RANGE.match(request.headers.get('Range') or '')
+        if match and request.headers.get('If-Range') in (None, self.etag):
+            start = int(match.group(1))
+            end = int(match.group(2) or len(PDF) - 1)
+            status = 206
+            body = PDF[start:end+1]
+            headers['Content-Range'] = 'bytes %d-%d/%d' % (start, end,
+                                                           len(PDF))
+        cut = None
+        if self.cut:
+            self.cut -= 1
+            cut = len(body) // 2
+        request.send(status, headers, body, cut=cut)
+
+
+class DownloadTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.service = StubService()
+        self.transport = PooledTransport()
+        self.client = PDFreactor(self.service.url, transport=self.transport)
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'doc1.pdf')
+
+    def tearDown(self):
+        self.transport.close()
+        self.service.close()
+        shutil.rmtree(self.directory)
+
+    def content(self):
+        with open(self.path, 'rb') as fo:
+            return fo.read()
+
+    def ranges(self):
+        return [request.headers.get('Range')
+                for request in self.service.received('GET', DOCUMENT)]
+
+
+class TestDownload(DownloadTestCase):
+
+    def test_preallocated(self):
+        self.service.on('GET', DOCUMENT, document)
+        report = self.client.getDocumentToPath('doc1', self.path)
+        self.assertEqual(self.content(), PDF)
+        self.assertEqual((report.path, report.size, report.preallocated),
+                         (self.path, len(PDF), True))
+        self.assertEqual(self.client.stats['download_bytes'], len(PDF))
+
+    def test_convert(self):
+        self.service.on('POST', '/convert.bin', document)
+        report = self.client.convertToPath({'document': '<p>'}, self.path)
+        self.assertEqual(self.content(), PDF)
+        self.assertEqual(report.size, len(PDF))
+
+    def test_incomplete(self):
+        # the target is not created, and the temporary file is removed:
+        self.service.on('GET', DOCUMENT, lambda request: request.send(
+                200, {'Content-Type': 'application/pdf'}, PDF,
+                cut=len(PDF) // 2))
+        with self.assertRaises(ValueError):
+            self.client.getDocumentToPath('doc1', self.path)
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+class TestResume(DownloadTestCase):
+
+    def test_resumed(self):
+        self.service.on('GET', DOCUMENT, Document())
+        report = self.client.getDocumentToPath('doc1', self.path, retries=2)
+        self.assertEqual(self.content(), PDF)
+        self.assertEqual((report.size, report.resumed), (len(PDF), 1))
+        self.assertEqual(self.ranges(),
+                         [None, 'bytes=%d-' % (len(PDF) // 2)])
+        request = self.service.received('GET', DOCUMENT)[1]
+        self.assertEqual(request.headers.get('If-Range'), '"v1"')
+        self.assertEqual(self.client.stats['downloads_resumed'], 1)
+
+    def test_changed_document(self):
+        # the document changed; the range request is answered by all of it:
+        document = Document()
+
+        def changing(request):
+            document(request)
+            document.etag = '"v2"'
+        self.service.on('GET', DOCUMENT, changing)
+        self.client.getDocumentToPath('doc1', self.path, retries=2)
+        self.assertEqual(self.content(), PDF)
+        self.assertEqual(self.ranges(),
+                         [None, 'bytes=%d-' % (len(PDF) // 2), None])
+
+    def test_too_many_failures(self):
+        self.service.on('GET', DOCUMENT, Document(cut=3))
+        with self.assertRaises(IncompleteDownload):
+            self.client.getDocumentToPath('doc1', self.path, retries=2)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_parallel(self):
+        self.service.on('GET', DOCUMENT, Document(cut=0))
+        report = self.client.getDocumentToPath('doc1', self.path, parallel=4)
+        self.assertEqual(self.content(), PDF)
+        self.assertTrue(report.preallocated)
+        self.assertEqual(len(self.ranges()), 4)
+
+
+class TestTemporaryFiles(DownloadTestCase):
+
+    def test_concurrent_downloads(self):
+        # several writers of the same path don't share a temporary file:
+        self.service.on('GET', DOCUMENT, document)
+        errors = []
+
+        def download():
+            client = PDFreactor(self.service.url)
+            try:
+                client.getDocumentToPath('doc1', self.path)
+            except Exception as e:
+                errors.append(e)
+        threads = [Thread(target=download) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.content(), PDF)
+        self.assertEqual(os.listdir(self.directory), ['doc1.pdf'])
+
+    def test_mode(self):
+        # the umask applies, like for files created by open:
+        self.service.on('GET', DOCUMENT, document)
+        umask = os.umask(0o027)
+        try:
+            self.client.getDocumentToPath('doc1', self.path)
+        finally:
+            os.umask(umask)
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o640)
+
+
+if __name__ == '__main__':
+    unittest.main()
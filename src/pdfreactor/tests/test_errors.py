@@ -0,0 +1,75 @@
+"""
+Tests of the ServerException, which captures the error response once
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import json
+import unittest
+
+from pdfreactor.api import PDFreactor
+from pdfreactor.exceptions import ServerException
+from pdfreactor.tests.stub import StubService
+from pdfreactor.transport import PooledTransport
+
+PROGRESS = '/progress/doc1.json'
+
+
+class TestServerException(unittest.TestCase):
+
+    def setUp(self):
+        self.service = StubService()
+        self.transport = PooledTransport()
+        self.client = PDFreactor(self.service.url, transport=self.transport)
+
+    def tearDown(self):
+        self.transport.close()
+        self.service.close()
+
+    def error(self, status, headers, body):
+        self.service.on('GET', PROGRESS,
+                        lambda request: (status, headers, body))
+        with self.assertRaises(ServerException) as cm:
+            self.client.getProgress('doc1')
+        return cm.exception
+
+    def next_index(self):
+        self.service.on('GET', PROGRESS, lambda request: (
+                200, {}, {'documentId': 'doc1', 'finished': True}))
+        self.client.getProgress('doc1')
+        return self.service.received('GET')[-1].index
+
+    def test_json_error(self):
+        e = self.error(404, {'X-RO-Error-ID': 'document'},
+                       {'error': u'Gone – deleted'})
+        self.assertEqual(json.loads(e.result),
+                         {'error': u'Gone – deleted'})
+        # decoded once:
+        self.assertIs(e.result, e.result)
+        self.assertEqual(e.pdfreactor_error, u'Gone – deleted')
+        self.assertEqual(e.pdfreactor_says,
+                         u'Document with the given ID was not found. '
+                         u'Gone – deleted')
+        self.assertEqual(e.error_record.errorId, 'document')
+        # the captured body can still be read:
+        self.assertEqual(json.loads(e.read().decode('utf-8')),
+                         json.loads(e.result))
+        # the body was read completely, so the connection is reused:
+        self.assertEqual(self.next_index(), 1)
+
+    def test_truncated(self):
+        body = b'{"error": "' + b'x' * ServerException.MAX_BODY + b'"}'
+        e = self.error(500, {'Content-Type': 'application/json'}, body)
+        self.assertEqual(len(e.result), ServerException.MAX_BODY)
+        record = e.error_record
+        self.assertTrue(record.truncated)
+        self.assertEqual(len(record.body), ServerException.EXCERPT)
+        self.assertTrue(e.pdfreactor_error.startswith('<no-JSON value'))
+        self.assertTrue(e.pdfreactor_error.endswith('[...]>'))
+        # the rest of the body is not read; the connection is discarded:
+        self.assertEqual(self.next_index(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
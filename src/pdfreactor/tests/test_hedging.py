@@ -0,0 +1,84 @@
+"""
+Tests of hedged asynchronous conversions
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import unittest
+
+from pdfreactor.api import PDFreactor
+from pdfreactor.hedging import HedgedConverter
+from pdfreactor.tests.stub import PDF, StubService
+
+
+def node(documentId, finished):
+    """
+    A stub node which runs the conversions of the given document;
+    unless finished, they don't make progress
+    """
+    service = StubService()
+    service.on('POST', '/convert/async.json', lambda request: (
+            201, {'Location': 'progress/' + documentId}, b''))
+    service.on('GET', '/progress/%s.json' % documentId, lambda request: (
+            200, {}, {'documentId': documentId, 'finished': finished,
+                      'progress': 100 if finished else 10}))
+    service.on('GET', '/document/%s.bin' % documentId, lambda request: (
+            200, {'Content-Type': 'application/pdf'}, PDF))
+    service.on('DELETE', '/document/%s.json' % documentId,
+               lambda request: (204, {}, b''))
+    return service
+
+
+class TestHedging(unittest.TestCase):
+
+    def setUp(self):
+        self.stalled = node('stalled', False)
+        self.healthy = node('healthy', True)
+
+    def tearDown(self):
+        self.stalled.close()
+        self.healthy.close()
+
+    def test_stalled_node(self):
+        hedger = HedgedConverter([PDFreactor(self.stalled.url),
+                                  PDFreactor(self.healthy.url)],
+                                 stall=0.2, hedge_percentile=None,
+                                 interval=0.02)
+        self.assertEqual(hedger.convertAsBinary({'document': '<p>'}), PDF)
+        stats = dict(hedger.stats)
+        self.assertEqual((stats['hedges_stall'], stats['hedge_wins'],
+                          stats['losers_deleted']), (1, 1, 1))
+        # both jobs are deleted, the loser and the (downloaded) winner:
+        for service in (self.stalled, self.healthy):
+            self.assertEqual(len(service.received('DELETE')), 1)
+
+    def test_primary_wins(self):
+        hedger = HedgedConverter([PDFreactor(self.healthy.url),
+                                  PDFreactor(self.stalled.url)],
+                                 stall=0.2, interval=0.02)
+        self.assertEqual(hedger.convertAsBinary({'document': '<p>'}), PDF)
+        self.assertEqual(dict(hedger.stats).get('hedges'), None)
+        self.assertEqual(self.stalled.received(), [])
+
+    def test_slow_node(self):
+        # progressing, but slower than hedge_after allows:
+        progress = []
+
+        def crawling(request):
+            progress.append(len(progress))
+            return 200, {}, {'documentId': 'stalled', 'finished': False,
+                             'progress': progress[-1]}
+        self.stalled.on('GET', '/progress/stalled.json', crawling)
+        hedger = HedgedConverter([PDFreactor(self.stalled.url),
+                                  PDFreactor(self.healthy.url)],
+                                 stall=10, hedge_after=0.1, interval=0.02)
+        self.assertEqual(hedger.convertAsBinary({'document': '<p>'}), PDF)
+        stats = dict(hedger.stats)
+        self.assertEqual((stats['hedges_latency'], stats['hedge_wins']),
+                         (1, 1))
+        self.assertEqual(stats.get('hedges_stall'), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
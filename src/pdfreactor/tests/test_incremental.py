@@ -0,0 +1,100 @@
+"""
+Tests of the incremental builds of multi-part documents
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+import unittest
+from base64 import b64decode
+
+from pdfreactor.api import PDFreactor
+from pdfreactor.incremental import PartCache, build
+from pdfreactor.inputs import BinaryDocument
+from pdfreactor.parallel import Part
+from pdfreactor.tests.stub import StubService
+
+
+class TestBuild(unittest.TestCase):
+
+    def setUp(self):
+        self.service = StubService()
+        self.service.on('POST', '/convert.bin', self.convert)
+        self.client = PDFreactor(self.service.url)
+        self.directory = tempfile.mkdtemp()
+        self.cache = PartCache(self.directory)
+        self.config = {'userStyleSheets': [{'content': 'p {}'}]}
+
+    def tearDown(self):
+        self.service.close()
+        shutil.rmtree(self.directory)
+
+    def convert(self, request):
+        config = request.json()
+        document = config['document']
+        if document.startswith('data:'):
+            document = b64decode(document.split(',', 1)[1]).decode('utf-8')
+        res = b'PDF of ' + document.encode('utf-8')
+        for merged in config.get('mergeDocuments') or ():
+            res += b' + ' + b64decode(merged['data'])
+        return 200, {'Content-Type': 'application/pdf'}, res
+
+    def build(self, parts, **kwargs):
+        return build([self.client], parts, self.config, self.cache,
+                     **kwargs)
+
+    def converted(self):
+        # the documents of the part conversions (not of the merging one):
+        return sorted(request.json()['document']
+                      for request in self.service.received('POST')
+                      if 'mergeDocuments' not in request.json())
+
+    def test_cached(self):
+        parts = [Part('<h1>T</h1>'), Part('<p>1</p>'), Part('<p>2</p>')]
+        pdf, manifest = self.build(parts)
+        self.assertEqual(pdf, b'PDF of <h1>T</h1> + PDF of <p>1</p>'
+                              b' + PDF of <p>2</p>')
+        self.assertEqual((manifest.reused, manifest.rendered),
+                         ([], [0, 1, 2]))
+        self.assertEqual(self.converted(), ['<p>1</p>', '<p>2</p>'])
+
+        # the second part changed:
+        self.service.requests[:] = []
+        parts[2] = Part('<p>2a</p>')
+        pdf, manifest = self.build(parts, prune=True)
+        self.assertEqual(pdf, b'PDF of <h1>T</h1> + PDF of <p>1</p>'
+                              b' + PDF of <p>2a</p>')
+        self.assertEqual((manifest.reused, manifest.rendered),
+                         ([1], [0, 2]))
+        self.assertEqual(self.converted(), ['<p>2a</p>'])
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+    def test_config_changed(self):
+        parts = [Part('<h1>T</h1>'), Part('<p>1</p>')]
+        self.build(parts)
+        self.config = {'userStyleSheets': [{'content': 'p { color: red }'}]}
+        pdf, manifest = self.build(parts)
+        self.assertEqual(manifest.reused, [])
+
+    def test_binary_documents(self):
+        parts = [Part('<h1>T</h1>'), Part(BinaryDocument(b'<p>1</p>'))]
+        self.build(parts)
+        pdf, manifest = self.build([Part('<h1>T</h1>'),
+                                    Part(BinaryDocument(b'<p>1</p>'))])
+        self.assertEqual(pdf, b'PDF of <h1>T</h1> + PDF of <p>1</p>')
+        self.assertEqual(manifest.reused, [1])
+        pdf, manifest = self.build([Part('<h1>T</h1>'),
+                                    Part(BinaryDocument(b'<p>2</p>'))])
+        self.assertEqual(manifest.reused, [])
+
+    def test_empty(self):
+        with self.assertRaises(ValueError):
+            self.build([])
+        self.assertEqual(self.service.received(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
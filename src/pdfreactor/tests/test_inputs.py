@@ -0,0 +1,127 @@
+"""
+Tests of the binary document input
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+import unittest
+from base64 import b64decode
+from threading import Thread
+
+from pdfreactor.api import PDFreactor
+from pdfreactor.inputs import BinaryDocument, JSONBody
+from pdfreactor.tests.stub import PDF, StubService
+from pdfreactor.transport import STALE_CONNECTION_ERRORS, PooledTransport
+
+HTML = u'<p>ä "quoted"</p>'.encode('utf-8') * 1000
+PROGRESS = '/progress/doc1.json'
+
+
+def decoded(request):
+    prefix, data = request.json()['document'].split(',', 1)
+    return prefix, b64decode(data)
+
+
+class InputsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.service = StubService()
+        self.service.on('POST', '/convert.bin', lambda request: (
+                200, {'Content-Type': 'application/pdf'}, PDF))
+        self.transport = PooledTransport()
+        self.client = PDFreactor(self.service.url, transport=self.transport)
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'input.html')
+        with open(self.path, 'wb') as fo:
+            fo.write(HTML)
+
+    def tearDown(self):
+        self.transport.close()
+        self.service.close()
+        shutil.rmtree(self.directory)
+
+
+class TestBinaryDocument(InputsTestCase):
+
+    def test_bytes(self):
+        self.client.convertAsBinary({'document': BinaryDocument(HTML)})
+        request, = self.service.received('POST')
+        self.assertEqual(decoded(request),
+                         ('data:text/html;base64', HTML))
+
+    def test_file(self):
+        # the length of the request is known from the file size:
+        with open(self.path, 'rb') as fo:
+            fo.read(3)  # read from the current position
+            document = BinaryDocument(fo)
+            self.assertEqual((document.size, document.repeatable),
+                             (len(HTML) - 3, True))
+            self.client.convertAsBinary({'document': document})
+        request, = self.service.received('POST')
+        self.assertEqual(int(request.headers['Content-Length']),
+                         len(request.raw))
+        self.assertEqual(decoded(request)[1], HTML[3:])
+
+    def test_pipe(self):
+        # the length is unknown, and the body can be read once only:
+        r, w = os.pipe()
+        writer = Thread(target=lambda: (os.write(w, HTML), os.close(w)))
+        writer.start()
+        with os.fdopen(r, 'rb') as fo:
+            document = BinaryDocument(fo)
+            body = JSONBody({'document': document})
+            self.assertEqual((document.size, body.length, body.repeatable),
+                             (None, None, False))
+            self.client.convertAsBinary({'document': document})
+        writer.join()
+        request, = self.service.received('POST')
+        self.assertEqual(request.headers.get('Transfer-Encoding'), 'chunked')
+        self.assertEqual(decoded(request)[1], HTML)
+
+
+class TestRetries(InputsTestCase):
+    """
+    After a failed kept-alive connection, a request is repeated only if
+    its body can be sent again
+    """
+
+    def setUp(self):
+        InputsTestCase.setUp(self)
+
+        def flaky(request):
+            if request.index == 1:
+                return request.drop()
+            return 200, {}, {'documentId': 'doc1', 'finished': True}
+        self.service.on('GET', PROGRESS, flaky)
+        self.url = self.service.url + PROGRESS
+        self.transport.open('GET', self.url).read()
+
+    def test_file_repeated(self):
+        with open(self.path, 'rb') as fo:
+            body = JSONBody({'document': BinaryDocument(fo)})
+            response = self.transport.open(
+                    'GET', self.url, body,
+                    {'Content-Length': str(body.length)})
+            response.read()
+        first, dropped, repeated = self.service.received('GET')
+        self.assertEqual(repeated.index, 0)
+        self.assertEqual(decoded(repeated)[1], HTML)
+
+    def test_pipe_not_repeated(self):
+        r, w = os.pipe()
+        writer = Thread(target=lambda: (os.write(w, HTML), os.close(w)))
+        writer.start()
+        with os.fdopen(r, 'rb') as fo:
+            body = JSONBody({'document': BinaryDocument(fo)})
+            with self.assertRaises(STALE_CONNECTION_ERRORS):
+                self.transport.open('GET', self.url, body)
+        writer.join()
+        self.assertEqual(len(self.service.received('GET')), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
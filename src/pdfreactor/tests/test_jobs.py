@@ -0,0 +1,139 @@
+"""
+Tests of AsyncJob handles, the document journal and the Reaper
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+import unittest
+from threading import Thread
+
+from pdfreactor.api import PDFreactor
+from pdfreactor.jobs import AsyncJob, DocumentJournal, Reaper
+from pdfreactor.tests.stub import PDF, StubService
+
+
+class JobsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.service = service = StubService()
+        service.on('POST', '/convert/async.json', lambda request: (
+                201, {'Location': 'progress/doc1',
+                      'Set-Cookie': 'ROUTE=n1; Path=/'}, b''))
+        service.on('GET', '/progress/doc1.json', lambda request: (
+                200, {}, {'documentId': 'doc1', 'finished': True}))
+        service.on('GET', '/document/doc1.bin', lambda request: (
+                200, {'Content-Type': 'application/pdf'}, PDF))
+        service.on('DELETE', '/document/*', lambda request: (204, {}, b''))
+        self.client = PDFreactor(service.url)
+        self.directory = tempfile.mkdtemp()
+        self.journal = DocumentJournal(os.path.join(self.directory,
+                                                    'journal'))
+
+    def tearDown(self):
+        self.service.close()
+        shutil.rmtree(self.directory)
+
+    def deleted(self):
+        return [(request.path, request.headers.get('Cookie'))
+                for request in self.service.received('DELETE')]
+
+
+class TestAsyncJob(JobsTestCase):
+
+    def test_lifecycle(self):
+        with AsyncJob(self.client, {'document': '<p>'},
+                      journal=self.journal) as job:
+            self.assertEqual(sorted(self.journal.outstanding()), ['doc1'])
+            job.wait(interval=0.01)
+            self.assertEqual(job.download(), PDF)
+        self.assertEqual(self.deleted(),
+                         [('/document/doc1.json', 'ROUTE=n1')])
+        self.assertEqual(self.journal.outstanding(), {})
+
+    def test_failed_deletion(self):
+        # the document is left to a Reaper:
+        self.service.on('DELETE', '/document/*',
+                        lambda request: (503, {}, {'error': 'busy'}))
+        with AsyncJob(self.client, {'document': '<p>'},
+                      journal=self.journal):
+            pass
+        self.assertEqual(sorted(self.journal.outstanding()), ['doc1'])
+
+
+class TestReaper(JobsTestCase):
+
+    def test_orphaned(self):
+        url = self.service.url
+        self.journal.add('doc1', url, {'ROUTE': 'n1'})
+        self.journal.add('doc2', url)
+        self.journal.remove('doc2')
+        self.assertEqual(Reaper(self.client, self.journal, 0).reap(),
+                         ['doc1'])
+        self.assertEqual(self.deleted(),
+                         [('/document/doc1.json', 'ROUTE=n1')])
+        self.assertEqual(self.journal.outstanding(), {})
+
+    def test_expired(self):
+        # documents which are gone already count as deleted:
+        self.service.on('DELETE', '/document/*',
+                        lambda request: (404, {}, {'error': 'not found'}))
+        self.journal.add('doc1', self.service.url)
+        self.assertEqual(Reaper(self.client, self.journal, 0).reap(),
+                         ['doc1'])
+        self.assertEqual(self.journal.outstanding(), {})
+
+    def test_failing(self):
+        self.service.on('DELETE', '/document/*',
+                        lambda request: (503, {}, {'error': 'busy'}))
+        self.journal.add('doc1', self.service.url)
+        self.assertEqual(Reaper(self.client, self.journal, 0).reap(), [])
+        self.assertEqual(sorted(self.journal.outstanding()), ['doc1'])
+
+    def test_young_documents_spared(self):
+        self.journal.add('doc1', self.service.url)
+        self.assertEqual(Reaper(self.client, self.journal).reap(), [])
+        self.assertEqual(self.service.received(), [])
+
+    def test_other_node(self):
+        # a client for the recorded URL is created:
+        other = StubService()
+        other.on('DELETE', '/document/*', lambda request: (204, {}, b''))
+        try:
+            self.journal.add('doc1', other.url)
+            self.assertEqual(Reaper(self.client, self.journal, 0).reap(),
+                             ['doc1'])
+            self.assertEqual(len(other.received('DELETE')), 1)
+        finally:
+            other.close()
+
+
+class TestJournal(JobsTestCase):
+
+    def test_compact_while_appending(self):
+        # the writers use journals of their own (like other processes):
+        path = self.journal.path
+        count = 200
+
+        def write(prefix):
+            journal = DocumentJournal(path)
+            for i in range(count):
+                journal.add('%s%d' % (prefix, i), 'http://node1')
+        writers = [Thread(target=write, args=(prefix,))
+                   for prefix in 'abcd']
+        for writer in writers:
+            writer.start()
+        compactor = DocumentJournal(path)
+        while any(writer.is_alive() for writer in writers):
+            compactor.compact()
+        for writer in writers:
+            writer.join()
+        self.assertEqual(len(DocumentJournal(path).outstanding()),
+                         4 * count)
+
+
+if __name__ == '__main__':
+    unittest.main()
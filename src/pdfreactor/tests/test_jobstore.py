@@ -0,0 +1,90 @@
+"""
+Tests of the durable job queue
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pdfreactor.api import PDFreactor
+from pdfreactor.jobstore import JobRunner, JobStore
+from pdfreactor.tests.stub import PDF, StubService
+
+
+class TestJobRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.service = service = StubService()
+        service.on('POST', '/convert/async.json', lambda request: (
+                201, {'Location': 'progress/doc1',
+                      'Set-Cookie': 'JSESSIONID=abc; Path=/'}, b''))
+        service.on('GET', '/progress/doc1.json', lambda request: (
+                200, {}, {'documentId': 'doc1', 'finished': True}))
+        service.on('GET', '/document/doc1.bin', lambda request: (
+                200, {'Content-Type': 'application/pdf'}, PDF))
+        service.on('DELETE', '/document/doc1.json',
+                   lambda request: (204, {}, b''))
+        self.directory = tempfile.mkdtemp()
+        self.output = os.path.join(self.directory, 'job1.pdf')
+        self.store = JobStore(os.path.join(self.directory, 'jobs.sqlite'))
+        self.store.enqueue('job1', {'document': '<p>'}, self.output)
+        self.runner = JobRunner(self.store, [PDFreactor(service.url)],
+                                max_attempts=1, interval=0.01)
+
+    def tearDown(self):
+        self.store.close()
+        self.service.close()
+        shutil.rmtree(self.directory)
+
+    def test_done(self):
+        self.assertEqual(self.runner.run(), {'done': 1})
+        with open(self.output, 'rb') as fo:
+            self.assertEqual(fo.read(), PDF)
+        # the session cookie is sent with all follow-up requests:
+        self.assertEqual(
+                [(request.method, request.headers.get('Cookie'))
+                 for request in self.service.received()][1:],
+                [('GET', 'JSESSIONID=abc'), ('GET', 'JSESSIONID=abc'),
+                 ('DELETE', 'JSESSIONID=abc')])
+
+    def test_resumed(self):
+        # e.g. after a crash of the worker process:
+        self.store.transition('job1', 'submitted', url=self.service.url,
+                              documentId='doc1',
+                              cookies={'JSESSIONID': 'abc'})
+        self.assertEqual(self.runner.run(), {'done': 1})
+        self.assertEqual(self.service.received('POST'), [])
+        request = self.service.received('GET', '/progress/doc1.json')[0]
+        self.assertEqual(request.headers.get('Cookie'), 'JSESSIONID=abc')
+
+    def test_failed_download(self):
+        # the document is deleted before the job is given up:
+        self.service.on('GET', '/document/doc1.bin',
+                        lambda request: (500, {}, {'error': 'broken'}))
+        self.assertEqual(self.runner.run(), {'dead': 1})
+        self.assertEqual(len(self.service.received('DELETE')), 1)
+        self.assertFalse(os.path.exists(self.output))
+        self.assertEqual(self.store.get('job1')['documentId'], None)
+
+    def test_retried(self):
+        # a failing conversion is submitted again:
+        calls = []
+
+        def flaky(request):
+            calls.append(request)
+            if len(calls) == 1:
+                return 503, {}, {'error': 'busy'}
+            return 201, {'Location': 'progress/doc1'}, b''
+        self.service.on('POST', '/convert/async.json', flaky)
+        self.runner.max_attempts = 2
+        self.assertEqual(self.runner.run(), {'done': 1})
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.store.get('job1')['attempts'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+"""
+Tests of the lazy result objects of JSON responses
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import unittest
+from base64 import b64encode
+from io import BytesIO
+
+from pdfreactor.api import PDFreactor
+from pdfreactor.results import ConversionResult, ProgressResult
+from pdfreactor.tests.stub import PDF, StubService
+
+
+class TestLazyResults(unittest.TestCase):
+
+    def setUp(self):
+        self.service = StubService()
+        self.service.on('POST', '/convert.json', lambda request: (
+                200, {}, {'document': b64encode(PDF).decode('ascii'),
+                          'finished': True, 'numberOfPages': 3,
+                          'log': {'records': [{'level': 'INFO',
+                                               'message': '"quoted"'}]}}))
+        self.service.on('GET', '/progress/doc1.json', lambda request: (
+                200, {}, {'documentId': 'doc1', 'finished': False,
+                          'progress': 40}))
+        self.client = PDFreactor(self.service.url, lazy=True)
+
+    def tearDown(self):
+        self.service.close()
+
+    def test_fields(self):
+        result = self.client.convert({'document': '<p>'})
+        self.assertIsInstance(result, ConversionResult)
+        self.assertEqual(result['numberOfPages'], 3)
+        self.assertEqual(result.numberOfPages, 3)
+        self.assertEqual(result.get('missing', 42), 42)
+        self.assertEqual(list(result.log_records())[0].message, '"quoted"')
+
+    def test_document(self):
+        result = self.client.convert({'document': '<p>'})
+        self.assertEqual(result.document, PDF)
+        self.assertEqual(result['document'],
+                         b64encode(PDF).decode('ascii'))
+        self.assertEqual(result.as_dict()['numberOfPages'], 3)
+
+    def test_save_document(self):
+        stream = BytesIO()
+        self.client.convert({'document': '<p>'}).save_document(stream)
+        self.assertEqual(stream.getvalue(), PDF)
+
+    def test_progress(self):
+        progress = self.client.getProgress('doc1')
+        self.assertIsInstance(progress, ProgressResult)
+        self.assertEqual((progress.finished, progress['progress']),
+                         (False, 40))
+
+    def test_not_lazy(self):
+        client = PDFreactor(self.service.url)
+        self.assertEqual(type(client.getProgress('doc1')), dict)
+        self.assertEqual(client.convert({'document': '<p>'})['document'],
+                         b64encode(PDF).decode('ascii'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+"""
+Tests of the parallel conversion of parts, and their merging
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import unittest
+from base64 import b64decode
+
+from pdfreactor.api import PDFreactor
+from pdfreactor.exceptions import ServerException
+from pdfreactor.parallel import Part, split_and_merge
+from pdfreactor.tests.stub import StubService
+
+
+class TestSplitAndMerge(unittest.TestCase):
+
+    def setUp(self):
+        self.service = StubService()
+        self.service.on('POST', '/convert.bin', self.convert)
+        self.client = PDFreactor(self.service.url)
+
+    def tearDown(self):
+        self.service.close()
+
+    def convert(self, request):
+        config = request.json()
+        res = b'PDF of ' + config['document'].encode('utf-8')
+        for document in config.get('mergeDocuments') or ():
+            res += b' + ' + b64decode(document['data'])
+        return 200, {'Content-Type': 'application/pdf'}, res
+
+    def test_merged_in_order(self):
+        parts = [Part('<h1>Title</h1>')] + [
+                Part('<p>%d</p>' % i, counters={'page': i * 10})
+                for i in range(1, 5)]
+        self.assertEqual(split_and_merge([self.client], parts, slots=2),
+                         b'PDF of <h1>Title</h1> + PDF of <p>1</p>'
+                         b' + PDF of <p>2</p> + PDF of <p>3</p>'
+                         b' + PDF of <p>4</p>')
+        merge = self.service.received('POST')[-1]
+        self.assertEqual(merge.json()['mergeMode'], 'APPEND')
+        # the streamed body has a known length:
+        self.assertEqual(int(merge.headers['Content-Length']),
+                         len(merge.raw))
+
+    def test_counters(self):
+        split_and_merge([self.client], [Part('<p>0</p>'),
+                                        Part('<p>1</p>',
+                                             counters={'page': 10})])
+        configs = dict((request.json()['document'], request.json())
+                       for request in self.service.received('POST')[:2])
+        self.assertNotIn('userStyleSheets', configs['<p>0</p>'])
+        self.assertEqual(configs['<p>1</p>']['userStyleSheets'], [
+            {'content': '@page:first { counter-reset: page 11; }'}])
+
+    def test_failed_part(self):
+        self.service.on('POST', '/convert.bin', lambda request: (
+                500, {}, {'error': 'failed'}))
+        with self.assertRaises(ServerException):
+            split_and_merge([self.client], [Part('<p>0</p>'),
+                                            Part('<p>1</p>')])
+
+    def test_empty(self):
+        for clients, parts in (([self.client], []),
+                               ([], [Part('<p>')])):
+            with self.assertRaises(ValueError):
+                split_and_merge(clients, parts)
+        self.assertEqual(self.service.received(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
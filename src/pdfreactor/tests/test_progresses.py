@@ -0,0 +1,78 @@
+"""
+Tests of the progress queries of many documents at once
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import time
+import unittest
+from threading import Lock
+
+from pdfreactor.api import PDFreactor
+from pdfreactor.exceptions import ServerException
+from pdfreactor.results import ProgressState
+from pdfreactor.tests.stub import StubService
+from pdfreactor.transport import PooledTransport
+
+
+class TestProgresses(unittest.TestCase):
+
+    def setUp(self):
+        self.service = StubService()
+        self.service.on('GET', '/progress/*', self.progress)
+        self.lock = Lock()
+        self.active = self.most = 0
+        self.transport = PooledTransport()
+        self.client = PDFreactor(self.service.url, transport=self.transport)
+
+    def tearDown(self):
+        self.transport.close()
+        self.service.close()
+
+    def progress(self, request):
+        with self.lock:
+            self.active += 1
+            self.most = max(self.most, self.active)
+        try:
+            time.sleep(0.05)
+            documentId = request.path.split('/')[-1].split('.')[0]
+            if documentId == 'gone':
+                return 404, {}, {'error': 'Document not found'}
+            number = int(documentId[3:])
+            return 200, {}, {'documentId': documentId,
+                             'finished': number % 2 == 0,
+                             'progress': number * 10}
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def test_states(self):
+        states = self.client.getProgresses(['doc1', 'doc2', 'gone'])
+        self.assertEqual(states['doc1'], ProgressState(False, 10, None))
+        self.assertEqual(states['doc2'], ProgressState(True, 20, None))
+        gone = states['gone']
+        self.assertEqual(gone[:2], (None, None))
+        self.assertIsInstance(gone.error, ServerException)
+        self.assertEqual((self.client.stats['progress_batches'],
+                          self.client.stats['progress_documents']), (1, 3))
+
+    def test_parallel(self):
+        documentIds = ['doc%d' % i for i in range(8)]
+        states = self.client.getProgresses(documentIds, parallel=4)
+        self.assertEqual(sorted(states), documentIds)
+        self.assertEqual(self.most, 4)
+        self.assertEqual(len(self.service.received('GET')), 8)
+
+    def test_sequential(self):
+        self.client.getProgresses(['doc1', 'doc2', 'doc3'], parallel=1)
+        self.assertEqual(self.most, 1)
+
+    def test_empty(self):
+        self.assertEqual(self.client.getProgresses(iter([])), {})
+        self.assertEqual(self.service.received(), [])
+        self.assertEqual(self.client.stats['progress_batches'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
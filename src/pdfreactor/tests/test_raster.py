@@ -0,0 +1,61 @@
+"""
+Tests of the concurrent rasterization of pages
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import shutil
+import tempfile
+import unittest
+
+from pdfreactor.api import PDFreactor
+from pdfreactor.incremental import PartCache
+from pdfreactor.inputs import BinaryDocument
+from pdfreactor.raster import rasterize
+from pdfreactor.tests.stub import StubService
+
+
+class TestRasterize(unittest.TestCase):
+
+    def setUp(self):
+        self.service = StubService()
+        self.service.on('POST', '/convert.bin', self.convert)
+        self.client = PDFreactor(self.service.url)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.service.close()
+        shutil.rmtree(self.directory)
+
+    def convert(self, request):
+        config = request.json()
+        image = ('%(type)s of ' % config['outputFormat']
+                 + config['pageOrder']).encode('ascii')
+        return 200, {'Content-Type': 'image/png'}, image
+
+    def test_ordered(self):
+        images = list(rasterize([self.client], {'document': '<p>'},
+                                [3, 1, 2], slots=3))
+        self.assertEqual(images, [(3, b'PNG of 3'), (1, b'PNG of 1'),
+                                  (2, b'PNG of 2')])
+
+    def test_cached(self):
+        # binary documents are hashed by their contents:
+        cache = PartCache(self.directory, suffix='.png')
+
+        def render(document, pages):
+            return list(rasterize([self.client],
+                                  {'document': BinaryDocument(document)},
+                                  pages, cache=cache))
+        self.assertEqual(render(b'<p>A</p>', [1, 2]),
+                         [(1, b'PNG of 1'), (2, b'PNG of 2')])
+        self.assertEqual(render(b'<p>A</p>', [2, 3]),
+                         [(2, b'PNG of 2'), (3, b'PNG of 3')])
+        self.assertEqual(len(self.service.received('POST')), 3)
+        render(b'<p>B</p>', [1])
+        self.assertEqual(len(self.service.received('POST')), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+"""
+Tests of the spooled binary results
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+from pdfreactor.api import PDFreactor
+from pdfreactor.results import SpooledResult
+from pdfreactor.tests.stub import PDF, StubService
+
+
+class TestSpooledResult(unittest.TestCase):
+
+    def setUp(self):
+        self.service = StubService()
+        self.service.on('POST', '/convert.bin', lambda request: (
+                200, {'Content-Type': 'application/pdf'}, PDF))
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.service.close()
+        shutil.rmtree(self.directory)
+
+    def convert(self, spool):
+        client = PDFreactor(self.service.url, spool=spool,
+                            spooldir=self.directory)
+        return client.convertAsBinary({'document': '<p>'})
+
+    def test_in_memory(self):
+        with self.convert(spool=len(PDF)) as result:
+            self.assertFalse(result.spilled)
+            self.assertEqual(result.getvalue(), PDF)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_spilled(self):
+        result = self.convert(spool=1000)
+        self.assertTrue(result.spilled)
+        self.assertEqual(os.path.dirname(result.name), self.directory)
+        self.assertEqual(b''.join(result), PDF)
+        self.assertEqual(bytes(result.getbuffer()[:8]), PDF[:8])
+        result.close()
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_save_to(self):
+        path = os.path.join(self.directory, 'doc1.pdf')
+        with self.convert(spool=1000) as result:
+            self.assertEqual(result.save_to(path), path)
+            self.assertEqual(result.name, path)
+        with open(path, 'rb') as fo:
+            self.assertEqual(fo.read(), PDF)
+        self.assertEqual(os.listdir(self.directory), ['doc1.pdf'])
+
+    def test_mode(self):
+        # the umask applies, like for files created by open:
+        umask = os.umask(0o027)
+        try:
+            for threshold in (10, len(PDF)):
+                result = SpooledResult(threshold=threshold)
+                result.write(PDF)
+                path = os.path.join(self.directory, '%d.pdf' % threshold)
+                result.save_to(path)
+                result.close()
+                self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o640)
+        finally:
+            os.umask(umask)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+"""
+Tests of the session cookies, kept by documentId
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import unittest
+
+from pdfreactor.api import PDFreactor
+from pdfreactor.tests.stub import StubService
+from pdfreactor.transport import PooledTransport
+
+
+class TestSessionCookies(unittest.TestCase):
+
+    def setUp(self):
+        self.service = StubService()
+        self.service.on('POST', '/convert/async.json', lambda request: (
+                201, {'Location': 'progress/doc1',
+                      'Set-Cookie': ['JSESSIONID=abc; Path=/service/rest',
+                                     'ROUTE=n2; Path=/service/rest/document',
+                                     'OTHER=x; Path=/elsewhere']},
+                b''))
+        self.service.on('GET', '/progress/doc1.json',
+                        lambda request: (200, {}, {'finished': True}))
+        self.service.on('GET', '/document/doc1.json',
+                        lambda request: (200, {}, {'finished': True}))
+        self.service.on('DELETE', '/document/doc1.json',
+                        lambda request: (204, {}, b''))
+
+    def tearDown(self):
+        self.service.close()
+
+    def cookies(self, method, path):
+        return [request.headers.get('Cookie')
+                for request in self.service.received(method, path)]
+
+    def test_cookies_by_path(self):
+        client = PDFreactor(self.service.url, threadsafe=True,
+                            transport=PooledTransport())
+        settings = {}
+        self.assertEqual(client.convertAsync({'document': '<p>'}, settings),
+                         'doc1')
+        client.getProgress('doc1')
+        client.getDocument('doc1')
+        self.assertEqual(self.cookies('GET', '/progress/doc1.json'),
+                         ['JSESSIONID=abc'])
+        cookie, = self.cookies('GET', '/document/doc1.json')
+        self.assertEqual(sorted(cookie.split('; ')),
+                         ['JSESSIONID=abc', 'ROUTE=n2'])
+        # thread-safe mode: the connectionSettings are not modified
+        self.assertEqual(settings, {})
+
+    def test_forgotten_after_delete(self):
+        client = PDFreactor(self.service.url)
+        client.convertAsync({'document': '<p>'})
+        client.deleteDocument('doc1')
+        client.getProgress('doc1')
+        self.assertEqual(self.cookies('GET', '/progress/doc1.json'), [None])
+        self.assertEqual(len(client.sessions), 0)
+
+    def test_many_documents(self):
+        # the cookie of an outstanding document is not dropped:
+        client = PDFreactor(self.service.url)
+        client.convertAsync({'document': '<p>'})
+        sessions = client.sessions
+        for i in range(150000):
+            sessions.remember('other%d' % i, {'JSESSIONID': str(i)})
+        client.getProgress('doc1')
+        self.assertEqual(self.cookies('GET', '/progress/doc1.json'),
+                         ['JSESSIONID=abc'])
+
+
+if __name__ == '__main__':
+    unittest.main()
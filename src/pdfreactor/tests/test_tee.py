@@ -0,0 +1,114 @@
+"""
+Tests of the Tee stream: threaded sinks, backpressure, failures
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import hashlib
+import threading
+import unittest
+from io import BytesIO
+from threading import Event, Thread
+
+from pdfreactor.api import PDFreactor
+from pdfreactor.exceptions import TimeoutException
+from pdfreactor.tee import Tee
+from pdfreactor.tests.stub import PDF, StubService
+from pdfreactor.tests.test_timeouts import trickle
+from pdfreactor.timeouts import Timeout
+
+
+class Sink(BytesIO):
+    """
+    A sink which waits for the `go` event before every write
+    """
+
+    def __init__(self, fail=False):
+        BytesIO.__init__(self)
+        self.go = Event()
+        self.go.set()
+        self.fail = fail
+        self.data = None
+
+    def write(self, chunk):
+        self.go.wait(5)
+        if self.fail:
+            raise IOError('disk full')
+        return BytesIO.write(self, chunk)
+
+    def close(self):
+        if self.data is None:
+            self.data = self.getvalue()
+        BytesIO.close(self)
+
+
+def sink_threads():
+    return [thread for thread in threading.enumerate()
+            if thread.name == 'pdfreactor-tee']
+
+
+class TestTee(unittest.TestCase):
+
+    def setUp(self):
+        self.service = StubService()
+        self.service.on('POST', '/convert.bin', lambda request: (
+                200, {'Content-Type': 'application/pdf'}, PDF))
+        self.client = PDFreactor(self.service.url)
+
+    def tearDown(self):
+        self.service.close()
+
+    def test_threaded(self):
+        sinks = [Sink(), Sink()]
+        tee = Tee(*sinks, threaded=True)
+        self.assertIsNone(self.client.convertAsBinary({}, tee))
+        self.assertTrue(tee.closed)
+        self.assertEqual([sink.data for sink in sinks], [PDF, PDF])
+        self.assertEqual(tee.size, len(PDF))
+        self.assertEqual(tee.hexdigest('sha256'),
+                         hashlib.sha256(PDF).hexdigest())
+
+    def test_backpressure(self):
+        # a stalled sink stops the writer after `queuesize` chunks:
+        slow = Sink()
+        slow.go.clear()
+        tee = Tee(slow, BytesIO(), threaded=True, queuesize=2, close=False)
+        writer = Thread(target=lambda: [tee.write(b'x' * 100)
+                                        for i in range(20)])
+        writer.start()
+        writer.join(0.2)
+        self.assertTrue(writer.is_alive())
+        # (one chunk being written, two queued, one waiting to be put)
+        self.assertTrue(tee.size <= 400)
+        slow.go.set()
+        writer.join()
+        tee.close()
+        self.assertEqual(len(slow.getvalue()), 2000)
+
+    def test_failing_sink(self):
+        good, bad = Sink(), Sink(fail=True)
+        tee = Tee(good, bad, threaded=True, queuesize=1)
+        with self.assertRaises(IOError):
+            self.client.convertAsBinary({}, tee)
+        self.assertTrue(tee.closed)
+        self.assertTrue(good.closed and bad.closed)
+        self.assertEqual(sink_threads(), [])
+
+    def test_read_error(self):
+        # the threads are stopped if the response fails:
+        self.service.on('POST', '/convert.bin',
+                        trickle(PDF, 'application/pdf'))
+        client = PDFreactor(self.service.url,
+                            timeout=Timeout(read=5, total=0.2))
+        sinks = [Sink(), Sink()]
+        tee = Tee(*sinks, threaded=True)
+        with self.assertRaises(TimeoutException):
+            client.convertAsBinary({}, tee)
+        self.assertTrue(tee.closed)
+        self.assertTrue(all(sink.closed for sink in sinks))
+        self.assertEqual(sink_threads(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
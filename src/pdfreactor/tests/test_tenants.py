@@ -0,0 +1,171 @@
+"""
+Tests of the tenant quotas
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import unittest
+from threading import Lock, Thread, Timer
+from time import sleep
+
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+from pdfreactor.exceptions import QuotaExceededException
+from pdfreactor.tenants import Quota, Tenants
+from pdfreactor.tests.stub import PDF, StubService, version
+
+
+class Converter(object):
+    """
+    A slow convert.bin handler, which records the maximum concurrency
+    """
+
+    def __init__(self):
+        self.running = 0
+        self.maximum = 0
+        self._lock = Lock()
+
+    def __call__(self, request):
+        with self._lock:
+            self.running += 1
+            self.maximum = max(self.maximum, self.running)
+        sleep(0.1)
+        with self._lock:
+            self.running -= 1
+        return 200, {'Content-Type': 'application/pdf'}, PDF
+
+
+class TestQuotas(unittest.TestCase):
+
+    def setUp(self):
+        self.service = StubService()
+        self.converter = Converter()
+        self.service.on('POST', '/convert.bin', self.converter)
+        self.service.on('GET', '/version.json',
+                        lambda request: (200, {}, version()))
+
+    def tearDown(self):
+        self.service.close()
+
+    def convert(self, client, count):
+        results = []
+        errors = []
+
+        def work():
+            try:
+                results.append(client.convertAsBinary({'document': '<p>'}))
+            except Exception as e:
+                errors.append(e)
+        threads = [Thread(target=work) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, errors
+
+    def test_concurrency(self):
+        tenants = Tenants(self.service.url, capabilities=True)
+        acme = tenants.add('acme', 'KEY1', max_concurrent=2)
+        results, errors = self.convert(acme, 6)
+        tenants.close()
+        self.assertEqual((len(results), errors), (6, []))
+        self.assertEqual(results[0], PDF)
+        self.assertEqual(self.converter.maximum, 2)
+        self.assertEqual(tenants.stats()['acme']['quota_waits'], 4)
+        self.assertEqual(len(self.service.received('GET', '/version.json')),
+                         1)
+        self.assertEqual(set(request.query['apiKey'][0]
+                             for request in self.service.received()),
+                         set(['KEY1']))
+
+    def test_global_quota(self):
+        tenants = Tenants(self.service.url, max_concurrent=3)
+        tenants.add('acme', 'KEY1')
+        tenants.add('globex', 'KEY2')
+        threads = [Thread(target=self.convert, args=(tenants[name], 3))
+                   for name in tenants]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        tenants.close()
+        self.assertEqual(self.converter.maximum, 3)
+        self.assertEqual(len(self.service.received('POST')), 6)
+
+    def test_exceeded(self):
+        tenants = Tenants(self.service.url, quota_timeout=0.02)
+        acme = tenants.add('acme', 'KEY1', max_concurrent=1)
+        results, errors = self.convert(acme, 2)
+        tenants.close()
+        self.assertEqual(len(results), 1)
+        self.assertEqual([type(e) for e in errors],
+                         [QuotaExceededException])
+        self.assertEqual(len(self.service.received('POST')), 1)
+
+
+class TestDocuments(unittest.TestCase):
+    """
+    The outstanding asynchronous conversions of a tenant
+    """
+
+    def setUp(self):
+        self.service = StubService()
+        self.location = 'progress/doc1'
+        self.service.on('POST', '/convert/async.json', self.accept)
+        self.service.on('DELETE', '/document/doc1.json',
+                        lambda request: (204, {}, b''))
+        self.tenants = Tenants(self.service.url, quota_timeout=0)
+        self.acme = self.tenants.add('acme', 'KEY1', max_documents=1)
+
+    def tearDown(self):
+        self.tenants.close()
+        self.service.close()
+
+    def accept(self, request):
+        headers = {}
+        if self.location:
+            headers['Location'] = self.location
+        return 201, headers, b''
+
+    def test_max_documents(self):
+        self.assertEqual(self.acme.convertAsync({'document': '<p>'}), 'doc1')
+        with self.assertRaises(QuotaExceededException):
+            self.acme.convertAsync({'document': '<p>'})
+        self.acme.deleteDocument('doc1')
+        self.assertEqual(self.acme.convertAsync({'document': '<p>'}), 'doc1')
+
+    def test_no_documentId(self):
+        # nothing to be deleted later; the slot is released at once:
+        self.location = None
+        for i in range(2):
+            self.assertEqual(self.acme.convertAsync({'document': '<p>'}),
+                             None)
+        self.assertEqual(self.acme._documents, set())
+
+
+class TestParentQuota(unittest.TestCase):
+
+    def test_total_timeout(self):
+        # the waits for both quotas together are limited by the timeout:
+        parent = Quota(max_concurrent=1, timeout=0.3)
+        child = Quota(max_concurrent=1, timeout=0.3, parent=parent)
+        parent.acquire()
+        child._slots.acquire()
+        timer = Timer(0.2, child._slots.release)
+        timer.start()
+        start = monotonic()
+        with self.assertRaises(QuotaExceededException):
+            child.acquire()
+        elapsed = monotonic() - start
+        timer.join()
+        self.assertTrue(0.25 < elapsed < 0.4, elapsed)
+        # the child slot was given back:
+        self.assertTrue(child._slots.acquire(False))
+
+
+if __name__ == '__main__':
+    unittest.main()
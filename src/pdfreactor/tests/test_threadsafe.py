@@ -0,0 +1,97 @@
+"""
+Tests of the thread-safe mode, and of the session cookies by document
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import unittest
+from copy import deepcopy
+from threading import Lock, Thread
+
+from pdfreactor.api import PDFreactor
+from pdfreactor.tests.stub import StubService
+from pdfreactor.transport import PooledTransport
+
+
+class Sticky(object):
+    """
+    Start conversions whose progress is available with their cookie only
+    """
+
+    def __init__(self, service):
+        self.count = 0
+        self.errors = []
+        self._lock = Lock()
+        service.on('POST', '/convert/async.json', self.start)
+        service.on('GET', '/progress/*', self.progress)
+
+    def start(self, request):
+        with self._lock:
+            self.count += 1
+            documentId = 'doc%d' % self.count
+        return 201, {'Location': 'progress/' + documentId,
+                     'Set-Cookie': 'ROUTE=%s; Path=/' % documentId}, b''
+
+    def progress(self, request):
+        documentId = request.path.split('/')[-1][:-len('.json')]
+        cookie = request.headers.get('Cookie')
+        if cookie != 'ROUTE=' + documentId:
+            self.errors.append((documentId, cookie))
+            return 404, {}, {'error': 'wrong node'}
+        return 200, {}, {'documentId': documentId, 'finished': True}
+
+
+class TestThreadSafe(unittest.TestCase):
+
+    def setUp(self):
+        self.service = StubService()
+        self.sticky = Sticky(self.service)
+
+    def tearDown(self):
+        self.service.close()
+
+    def test_shared_dicts(self):
+        transport = PooledTransport()
+        client = PDFreactor(self.service.url, threadsafe=True,
+                            transport=transport)
+        config = {'document': '<p>', 'userStyleSheets': [{'content': 'p{}'}]}
+        settings = {'headers': {'X-Trace': 'test'}, 'cookies': {}}
+        original = deepcopy((config, settings))
+        errors = []
+
+        def work():
+            try:
+                for i in range(5):
+                    documentId = client.convertAsync(config, settings)
+                    client.getProgress(documentId, settings)
+            except Exception as e:
+                errors.append(e)
+        threads = [Thread(target=work) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        transport.close()
+        self.assertEqual((errors, self.sticky.errors), ([], []))
+        self.assertEqual((config, settings), original)
+        self.assertEqual(len(self.service.received('GET')), 40)
+        self.assertEqual(set(request.headers.get('X-Trace')
+                             for request in self.service.received()),
+                         set(['test']))
+
+    def test_session_cookies_not_shared(self):
+        # without thread-safe mode, the given connectionSettings are
+        # modified; but they don't get the cookies of other documents:
+        client = PDFreactor(self.service.url)
+        doc1 = client.convertAsync({'document': '<p>'})
+        doc2 = client.convertAsync({'document': '<p>'})
+        settings = {}
+        client.getProgress(doc1, settings)
+        self.assertNotIn('Cookie', settings['headers'])
+        client.getProgress(doc2, settings)
+        self.assertEqual(self.sticky.errors, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+"""
+Tests of timeouts, deadlines and cancellation
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import unittest
+from io import BytesIO
+from threading import Timer
+from time import sleep
+
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+from pdfreactor.api import PDFreactor
+from pdfreactor.exceptions import CancelledException, TimeoutException
+from pdfreactor.tests.stub import PDF, StubService
+from pdfreactor.timeouts import CancellationToken, Timeout
+from pdfreactor.transport import PooledTransport
+
+JSON = b'{"finished": true, "log": "' + b'x' * 1000 + b'"}'
+
+
+def trickle(body, content_type):
+    """
+    A handler which sends the body slowly, 10 bytes at a time
+    """
+    def handler(request):
+        request.send(200, {'Content-Type': content_type,
+                           'Content-Length': str(len(body))}, body[:10])
+        wfile = request._handler.wfile
+        for i in range(10, min(len(body), 2000), 10):
+            sleep(0.05)
+            try:
+                wfile.write(body[i:i+10])
+                wfile.flush()
+            except (IOError, OSError):
+                break
+        request.drop()
+    return handler
+
+
+class TestDeadline(unittest.TestCase):
+    """
+    The total timeout applies to responses which trickle in
+    """
+
+    def setUp(self):
+        self.service = StubService()
+        self.service.on('POST', '/convert.json',
+                        trickle(JSON, 'application/json'))
+        self.service.on('GET', '/progress/doc1.json',
+                        trickle(JSON, 'application/json'))
+        self.service.on('POST', '/convert.bin',
+                        trickle(PDF, 'application/pdf'))
+
+    def tearDown(self):
+        self.service.close()
+
+    def check(self, call, transport=None, **options):
+        client = PDFreactor(self.service.url, transport=transport,
+                            timeout=Timeout(read=5, total=0.5), **options)
+        start = monotonic()
+        with self.assertRaises(TimeoutException):
+            call(client)
+        self.assertTrue(monotonic() - start < 2)
+
+    def test_convert(self):
+        self.check(lambda client: client.convert({'document': '<p>'}),
+                   PooledTransport())
+
+    def test_progress(self):
+        self.check(lambda client: client.getProgress('doc1'))
+
+    def test_lazy(self):
+        self.check(lambda client: client.convert({'document': '<p>'}),
+                   PooledTransport(), lazy=True)
+
+    def test_binary(self):
+        self.check(lambda client: client.convertAsBinary({}),
+                   PooledTransport())
+
+    def test_binary_to_stream(self):
+        self.check(lambda client: client.convertAsBinary({}, BytesIO()))
+
+    def test_spooled(self):
+        self.check(lambda client: client.convertAsBinary({}),
+                   PooledTransport(), spool=1000)
+
+    def test_binary_stream(self):
+        def call(client):
+            with client.convertAsBinaryStream({}) as binary:
+                for chunk in binary:
+                    pass
+        self.check(call, PooledTransport())
+
+
+class TestWaitForDocument(unittest.TestCase):
+    """
+    An aborted conversion is deleted on the server
+    """
+
+    def setUp(self):
+        self.service = StubService()
+        self.service.on('GET', '/progress/doc1.json', lambda request: (
+                200, {}, {'documentId': 'doc1', 'finished': False,
+                          'progress': 10}))
+        self.service.on('DELETE', '/document/doc1.json',
+                        lambda request: (204, {}, b''))
+        self.client = PDFreactor(self.service.url)
+
+    def tearDown(self):
+        self.service.close()
+
+    def test_timeout(self):
+        with self.assertRaises(TimeoutException):
+            self.client.waitForDocument('doc1', timeout=0.2, interval=0.05)
+        self.assertEqual(len(self.service.received('DELETE')), 1)
+
+    def test_cancelled(self):
+        token = CancellationToken()
+        Timer(0.1, token.cancel).start()
+        with self.assertRaises(CancelledException):
+            self.client.waitForDocument('doc1', cancel=token, interval=0.05)
+        self.assertEqual(len(self.service.received('DELETE')), 1)
+
+    def test_finished(self):
+        self.service.on('GET', '/progress/doc1.json', lambda request: (
+                200, {}, {'documentId': 'doc1', 'finished': True}))
+        self.assertTrue(self.client.waitForDocument('doc1')['finished'])
+        self.assertEqual(self.service.received('DELETE'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
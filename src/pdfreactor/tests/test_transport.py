@@ -0,0 +1,149 @@
+"""
+Tests of the transports: kept-alive connections, retries
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import unittest
+from time import sleep
+
+from pdfreactor.api import PDFreactor
+from pdfreactor.exceptions import UnreachableServiceException
+from pdfreactor.tests.stub import StubService
+from pdfreactor.transport import (
+    STALE_CONNECTION_ERRORS,
+    PooledTransport,
+    UrllibTransport,
+    )
+
+PROGRESS = '/progress/doc1.json'
+ASYNC = '/convert/async.json'
+
+
+def progress(request):
+    return 200, {}, {'documentId': 'doc1', 'finished': False,
+                     'progress': 10}
+
+
+def accepted(request):
+    return 201, {'Location': 'progress/doc1'}, b''
+
+
+class TestPooledTransport(unittest.TestCase):
+
+    def setUp(self):
+        self.service = StubService()
+        self.transport = PooledTransport()
+        self.client = PDFreactor(self.service.url, transport=self.transport)
+
+    def tearDown(self):
+        self.transport.close()
+        self.service.close()
+
+    def test_connection_reused(self):
+        self.service.on('GET', PROGRESS, progress)
+        for i in range(3):
+            self.client.getProgress('doc1')
+        self.assertEqual([request.index
+                          for request in self.service.received()],
+                         [0, 1, 2])
+
+    def test_get_repeated_on_new_connection(self):
+        # the kept-alive connection fails for the second request:
+        def flaky(request):
+            if request.index == 1:
+                return request.drop()
+            return progress(request)
+        self.service.on('GET', PROGRESS, flaky)
+        self.client.getProgress('doc1')
+        self.assertEqual(self.client.getProgress('doc1')['progress'], 10)
+        self.assertEqual([request.index
+                          for request in self.service.received()],
+                         [0, 1, 0])
+
+    def test_post_not_repeated(self):
+        # the request may have been processed by the server:
+        def lost(request):
+            return request.drop()
+        self.service.on('GET', PROGRESS, progress)
+        self.service.on('POST', ASYNC, lost)
+        self.client.getProgress('doc1')
+        with self.assertRaises(UnreachableServiceException):
+            self.client.convertAsync({'document': '<p>'})
+        self.assertEqual(len(self.service.received('POST', ASYNC)), 1)
+
+    def test_one_shot_body_not_repeated(self):
+        # a gzip-compressed stream can't be sent again, even by a GET:
+        def lost(request):
+            return request.drop()
+        self.service.on('GET', PROGRESS, progress)
+        self.service.on('GET', '/document/doc1.json', lost)
+        self.client.getProgress('doc1')
+        with self.assertRaises(STALE_CONNECTION_ERRORS):
+            self.transport.open('GET', self.service.url
+                                + '/document/doc1.json',
+                                iter([b'{', b'}']))
+        self.assertEqual(len(self.service.received('GET',
+                                                   '/document/doc1.json')),
+                         1)
+
+    def test_stale_connection_discarded(self):
+        # the server closes the idle connection after the response:
+        def closing(request):
+            request.send(200, {'Content-Type': 'application/json'},
+                         b'{"finished": false}', close=True)
+        self.service.on('GET', PROGRESS, closing)
+        self.service.on('POST', ASYNC, accepted)
+        self.client.getProgress('doc1')
+        sleep(0.1)
+        # not repeatable, but sent using a new connection in the first place:
+        self.assertEqual(self.client.convertAsync({'document': '<p>'}),
+                         'doc1')
+        self.assertEqual([request.index
+                          for request in self.service.received()],
+                         [0, 0])
+
+    def test_read1_to_the_end(self):
+        # the connection is released when the body has been received,
+        # and can be used by the next request before the response is closed:
+        self.service.on('GET', PROGRESS, progress)
+        url = self.service.url + PROGRESS
+        response = self.transport.open('GET', url)
+        body = b''
+        while True:
+            chunk = response.read1(10)
+            if not chunk:
+                break
+            body += chunk
+        other = self.transport.open('GET', url)
+        self.assertEqual(other.read(), body)
+        other.close()
+        response.close()
+        self.assertEqual([request.index
+                          for request in self.service.received()],
+                         [0, 1])
+
+
+class TestUrllibTransport(unittest.TestCase):
+
+    def setUp(self):
+        self.service = StubService()
+
+    def tearDown(self):
+        self.service.close()
+
+    def test_methods(self):
+        self.service.on('GET', PROGRESS, progress)
+        self.service.on('DELETE', '/document/doc1.json',
+                        lambda request: (204, {}, b''))
+        client = PDFreactor(self.service.url, transport=UrllibTransport())
+        self.assertEqual(client.getProgress('doc1')['progress'], 10)
+        client.deleteDocument('doc1')
+        self.assertEqual([request.method
+                          for request in self.service.received()],
+                         ['GET', 'DELETE'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+"""
+Tests of the WSGI and ASGI response adapters
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+import unittest
+from threading import Event
+
+from pdfreactor.api import PDFreactor
+from pdfreactor.tests.stub import PDF, StubService
+from pdfreactor.web import wsgi_response
+
+try:
+    import asyncio
+    from pdfreactor.aio import asgi_response
+except (ImportError, SyntaxError):  # Python 2
+    asyncio = None
+
+HALF = len(PDF) // 2
+
+
+class WebTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.service = StubService()
+        self.sent = Event()  # set by the test to release the second half
+        self.service.on('POST', '/convert.bin', self.convert)
+        self.client = PDFreactor(self.service.url)
+
+    def tearDown(self):
+        self.sent.set()
+        self.service.close()
+
+    def convert(self, request):
+        request.send(200, {'Content-Type': 'application/pdf',
+                           'Content-Length': str(len(PDF))}, PDF[:HALF])
+        self.sent.wait(5)
+        wfile = request._handler.wfile
+        try:
+            wfile.write(PDF[HALF:])
+            wfile.flush()
+        except (IOError, OSError):  # the client gave up
+            request.drop()
+
+
+class TestWSGI(WebTestCase):
+
+    def test_streaming(self):
+        started = []
+        binary = self.client.convertAsBinaryStream({'document': '<p>'})
+        body = wsgi_response(lambda *args: started.append(args), binary,
+                             filename='report.pdf', chunksize=1000)
+        self.assertEqual(started, [('200 OK', [
+            ('Content-Type', 'application/pdf'),
+            ('Content-Length', str(len(PDF))),
+            ('Content-Disposition', 'attachment; filename="report.pdf"'),
+            ])])
+        chunks = []
+        for chunk in body:
+            chunks.append(chunk)
+            # the first half arrives before the rest is sent:
+            if sum(map(len, chunks)) >= HALF:
+                self.sent.set()
+        body.close()
+        self.assertEqual(b''.join(chunks), PDF)
+        self.assertTrue(max(map(len, chunks)) <= 1000)
+        self.assertTrue(binary.closed)
+
+    def test_closed_early(self):
+        binary = self.client.convertAsBinaryStream({'document': '<p>'})
+        body = wsgi_response(lambda *args: None, binary)
+        self.assertEqual(next(iter(body))[:8], PDF[:8])
+        body.close()
+        self.assertTrue(binary.closed)
+
+
+@unittest.skipIf(asyncio is None, 'asyncio is not available')
+class TestASGI(WebTestCase):
+
+    def run_app(self, receive=None):
+        messages = []
+        binary = self.client.convertAsBinaryStream({'document': '<p>'})
+        body_sent = []
+
+        async def send(message):
+            messages.append(message)
+            if message['type'] == 'http.response.body':
+                body_sent[0].set()
+                if sum(len(m.get('body', b'')) for m in messages) >= HALF:
+                    self.sent.set()
+
+        async def disconnect():
+            await body_sent[0].wait()
+            return {'type': 'http.disconnect'}
+
+        async def app():
+            body_sent.append(asyncio.Event())
+            await asgi_response(send, binary, receive and disconnect,
+                                chunksize=1000)
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(app())
+        finally:
+            loop.close()
+        return binary, messages
+
+    def test_streaming(self):
+        binary, messages = self.run_app()
+        self.assertEqual(messages[0]['type'], 'http.response.start')
+        self.assertIn((b'content-length', str(len(PDF)).encode('ascii')),
+                      messages[0]['headers'])
+        self.assertEqual(b''.join(m['body'] for m in messages[1:]), PDF)
+        self.assertEqual(messages[-1], {'type': 'http.response.body',
+                                        'body': b''})
+        self.assertTrue(binary.closed)
+
+    def test_disconnect(self):
+        binary, messages = self.run_app(receive=True)
+        self.assertTrue(binary.closed)
+        self.assertTrue(sum(len(m.get('body', b'')) for m in messages)
+                        < len(PDF))
+        self.assertTrue(all(m.get('more_body') for m in messages[1:]))
+
+
+if __name__ == '__main__':
+    unittest.main()
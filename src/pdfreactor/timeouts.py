@@ -0,0 +1,203 @@
+"""
+pdfreactor.timeouts: timeouts, deadlines and cancellation
+
+Timeouts can be specified for a PDFreactor client (timeout option) and per
+call (connectionSettings['timeout']), either as a number of seconds (used
+for connecting and for every read operation) or as a Timeout object:
+
+>>> Timeout(connect=5, read=60, total=300)
+Timeout(connect=5, read=60, total=300)
+
+The `total` value limits the time for the whole call, including the
+transfer of the response body; for PDFreactor.waitForDocument, it limits
+the time for the conversion.
+
+Asynchronous conversions can be cancelled using a CancellationToken;
+see PDFreactor.waitForDocument and the pdfreactor.aio module.
+"""
+
+# Python compatibility:
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+from threading import Event, Lock
+
+from .exceptions import CancelledException, TimeoutException
+
+__all__ = [
+    'Timeout',
+    'Deadline',
+    'CancellationToken',
+    ]
+
+
+class Timeout(object):
+    """
+    Timeout values in seconds (None: no limit)
+
+    connect -- for establishing the connection
+    read -- for every single read operation (including the wait for the
+            response, i.e. the time of a synchronous conversion)
+    total -- for the whole call (or the whole conversion)
+
+    >>> Timeout.coerce(10)
+    Timeout(connect=10, read=10, total=None)
+    >>> Timeout.coerce(None)
+    >>> t = Timeout(read=30)
+    >>> Timeout.coerce(t) is t
+    True
+    """
+    __slots__ = ('connect', 'read', 'total')
+
+    def __init__(self, connect=None, read=None, total=None):
+        self.connect = connect
+        self.read = read
+        self.total = total
+
+    @classmethod
+    def coerce(cls, value):
+        if value is None or isinstance(value, cls):
+            return value
+        return cls(value, value)
+
+    def limited(self, deadline):
+        """
+        Return a Timeout which doesn't exceed the remaining time
+
+        >>> Timeout(5, 60).limited(None)
+        Timeout(connect=5, read=60, total=None)
+        >>> t = Timeout(5, 60).limited(Deadline(2))
+        >>> 0 < t.read <= 2 and 0 < t.connect <= 2
+        True
+        """
+        if deadline is None:
+            return self
+        remaining = deadline.check()
+        return Timeout(_min(self.connect, remaining),
+                       _min(self.read, remaining))
+
+    def socket_timeout(self):
+        """
+        The value for transports which support a single timeout only
+
+        >>> Timeout(5, 60).socket_timeout()
+        60
+        >>> Timeout(connect=5).socket_timeout()
+        5
+        """
+        if self.read is not None:
+            return self.read
+        return self.connect
+
+    def __repr__(self):
+        return ('Timeout(connect=%r, read=%r, total=%r)'
+                % (self.connect, self.read, self.total))
+
+
+def _min(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a, b)
+
+
+class Deadline(object):
+    """
+    A point in time after which an operation must not continue
+
+    >>> Deadline(None).remaining()
+    >>> d = Deadline(60)
+    >>> 59 < d.remaining() <= 60
+    True
+    >>> d.expired()
+    False
+    >>> Deadline(0).check()
+    Traceback (most recent call last):
+      ...
+    pdfreactor.exceptions.TimeoutException: Deadline exceeded
+    """
+    __slots__ = ('expires',)
+
+    def __init__(self, seconds):
+        if seconds is None:
+            self.expires = None
+        else:
+            self.expires = monotonic() + seconds
+
+    def remaining(self):
+        if self.expires is None:
+            return None
+        return self.expires - monotonic()
+
+    def expired(self):
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def check(self, documentId=None):
+        """
+        Return the remaining time; raise TimeoutException if expired
+        """
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise TimeoutException('Deadline exceeded', documentId)
+        return remaining
+
+
+class CancellationToken(object):
+    """
+    Allow a thread (or an asyncio task) to cancel an operation
+
+    >>> token = CancellationToken()
+    >>> token.cancelled
+    False
+    >>> seen = []
+    >>> token.add_callback(seen.append)
+    >>> token.cancel()
+    >>> token.cancelled, seen == [token]
+    (True, True)
+    >>> token.raise_if_cancelled('doc1')
+    Traceback (most recent call last):
+      ...
+    pdfreactor.exceptions.CancelledException: Operation cancelled (document doc1)
+    """
+
+    def __init__(self):
+        self._event = Event()
+        self._callbacks = []
+        self._lock = Lock()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def add_callback(self, callback):
+        """
+        Call the given function (with the token) when cancelled
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def wait(self, timeout=None):
+        """
+        Sleep up to timeout seconds; return True if cancelled
+        """
+        return self._event.wait(timeout)
+
+    def raise_if_cancelled(self, documentId=None):
+        if self._event.is_set():
+            raise CancelledException('Operation cancelled', documentId)
@@ -0,0 +1,389 @@
+"""
+pdfreactor.transport: pluggable HTTP transports for the PDFreactor client
+
+A transport sends one HTTP request and returns a response object which
+provides (at least) the read([amt]), info() and getcode() methods.
+HTTP errors (status >= 400) are raised as urllib HTTPErrors; the PDFreactor
+client turns them into ServerExceptions, and wraps all other exceptions
+as UnreachableServiceExceptions.
+
+Available transports:
+
+UrllibTransport
+    the default; uses urllib's urlopen function, like the original API
+PooledTransport
+    keeps http.client connections alive and reuses them
+    (per scheme, host and port; usable by several threads)
+UnixSocketTransport
+    a PooledTransport which connects to a Unix domain socket,
+    e.g. of a local proxy in front of the PDFreactor service
+
+Usage:
+
+>>> from pdfreactor.api import PDFreactor
+>>> client = PDFreactor(transport=PooledTransport(maxsize=4))
+
+Unlike urllib, the http.client based transports don't follow redirects.
+"""
+
+# Python compatibility:
+import sys
+if sys.version_info[0] == 2:
+    from urllib2 import HTTPError
+    from urllib2 import Request, urlopen
+    from urlparse import urlsplit
+    from httplib import HTTPConnection, HTTPSConnection
+else:
+    from urllib.error import HTTPError
+    from urllib.request import Request, urlopen
+    from urllib.parse import urlsplit
+    from http.client import HTTPConnection, HTTPSConnection
+
+import select
+import socket
+from io import BytesIO
+from threading import Lock
+
+from .defaults import default_errors
+
+__all__ = [
+    'Transport',
+    'UrllibTransport',
+    'PooledTransport',
+    'UnixSocketTransport',
+    ]
+
+# exceptions which indicate that a kept-alive connection was closed by the
+# server while idle; the request is repeated once using a new connection,
+# if this is safe (see PooledTransport.open):
+if sys.version_info[0] == 2:
+    from httplib import BadStatusLine
+    STALE_CONNECTION_ERRORS = (BadStatusLine, socket.error)
+else:
+    from http.client import RemoteDisconnected
+    STALE_CONNECTION_ERRORS = (RemoteDisconnected, BrokenPipeError,
+                               ConnectionResetError)
+
+# methods which can be repeated without side effects:
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'])
+
+
+def _is_repeatable(data):
+    """
+    Can the given request body be sent again?
+
+    >>> _is_repeatable(None), _is_repeatable(b'{}')
+    (True, True)
+    >>> _is_repeatable(iter([b'{', b'}']))
+    False
+    """
+    return (data is None or isinstance(data, bytes)
+            or getattr(data, 'repeatable', False))
+
+
+def _is_stale(conn):
+    """
+    Has the idle connection been closed by the server?
+
+    An idle HTTP connection has nothing to read; if its socket is readable,
+    the server has closed it (or sent garbage).
+    """
+    sock = conn.sock
+    if sock is None:
+        return False
+    try:
+        return bool(select.select([sock], [], [], 0)[0])
+    except Exception:  # e.g. a closed socket
+        return True
+
+
+class GetRequest(Request):
+    def get_method(self):
+        return 'get'
+
+
+class DeleteRequest(Request):
+    def get_method(self):
+        return 'delete'
+
+
+class Transport(object):
+    """
+    Base class for transports
+    """
+
+    def open(self, method, url, data=None, headers=None, timeout=None):
+        """
+        Send the request and return the response
+
+        method -- 'GET', 'POST' or 'DELETE'
+        url -- the complete URL, including the query string
+        data -- the request body (bytes, or an iterable of bytes chunks;
+                if its `repeatable` attribute is true, it can be iterated
+                more than once)
+        headers -- a dict of request headers
+        timeout -- a pdfreactor.timeouts.Timeout object, or None
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Release all resources (e.g. kept-alive connections)
+        """
+        pass
+
+
+class UrllibTransport(Transport):
+    """
+    The default transport, using urllib's urlopen function
+
+    Since urlopen supports a single timeout value only, this is used for
+    connecting as well (see Timeout.socket_timeout).
+    """
+    REQUEST_CLASS = {
+        'GET':    GetRequest,
+        'POST':   Request,
+        'DELETE': DeleteRequest,
+        }
+
+    def open(self, method, url, data=None, headers=None, timeout=None):
+        req = self.REQUEST_CLASS[method](url, data, headers or {})
+        if timeout is not None:
+            seconds = timeout.socket_timeout()
+            if seconds is not None:
+                return urlopen(req, timeout=seconds)
+        return urlopen(req)
+
+
+class PooledTransport(Transport):
+    """
+    Use http.client connections, and keep them alive for reuse
+
+    maxsize -- the maximum number of idle connections kept per host
+    context -- an ssl.SSLContext for https URLs
+
+    Idle connections which have been closed by the server are discarded
+    before a request is sent.  If a kept-alive connection fails
+    nevertheless, the request is repeated once using a new connection,
+    but only if this can't cause a duplicate effect on the server, i.e. for
+    idempotent methods (GET, DELETE ...) with a repeatable body; a POST
+    request (e.g. starting an asynchronous conversion) may have reached the
+    server already, and a one-shot body (e.g. gzip-compressed chunks) is
+    not kept in memory for a second attempt.
+    """
+
+    def __init__(self, maxsize=10, context=None):
+        self.maxsize = maxsize
+        self.context = context
+        self._idle = {}
+        self._lock = Lock()
+
+    def _new_connection(self, scheme, host, port):
+        if scheme == 'https':
+            if self.context is not None:
+                return HTTPSConnection(host, port, context=self.context)
+            return HTTPSConnection(host, port)
+        return HTTPConnection(host, port)
+
+    def _get_connection(self, key):
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                if not idle:
+                    break
+                conn = idle.pop()
+            if not _is_stale(conn):
+                return conn, True
+            conn.close()
+        return self._new_connection(*key), False
+
+    def _release(self, key, conn):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.maxsize:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def open(self, method, url, data=None, headers=None, timeout=None):
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        if headers is None:
+            headers = {}
+        conn, reused = self._get_connection(key)
+        try:
+            self._prepare(conn, timeout)
+            conn.request(method, path, data, headers)
+            response = conn.getresponse()
+        except STALE_CONNECTION_ERRORS:
+            conn.close()
+            if not (reused and method.upper() in IDEMPOTENT_METHODS
+                    and _is_repeatable(data)):
+                raise
+            conn = self._new_connection(*key)
+            try:
+                self._prepare(conn, timeout)
+                conn.request(method, path, data, headers)
+                response = conn.getresponse()
+            except Exception:
+                conn.close()
+                raise
+        except Exception:
+            conn.close()
+            raise
+        if response.status >= 400:
+            # the body is kept by the ServerException, up to a limit:
+            body = response.read(default_errors['max_body'] + 1)
+            if response.isclosed():
+                self._finished(key, conn, response)
+            else:  # not read completely; the connection can't be reused
+                conn.close()
+                response.close()
+            raise HTTPError(url, response.status, response.reason,
+                            response.msg, BytesIO(body))
+        return PooledResponse(response, self, key, conn)
+
+    def _prepare(self, conn, timeout):
+        """
+        Connect (if necessary), and apply the read timeout
+        """
+        if timeout is None:
+            if conn.sock is not None:
+                conn.sock.settimeout(socket.getdefaulttimeout())
+            return
+        if conn.sock is None:
+            if timeout.connect is not None:
+                conn.timeout = timeout.connect
+            conn.connect()
+        if timeout.read is not None:
+            conn.sock.settimeout(timeout.read)
+        else:
+            conn.sock.settimeout(socket.getdefaulttimeout())
+
+    def _finished(self, key, conn, response):
+        if response.will_close:
+            conn.close()
+        else:
+            self._release(key, conn)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
+class PooledResponse(object):
+    """
+    A response which returns its connection to the pool when exhausted
+
+    If closed before the body has been read completely,
+    the connection is closed as well.
+    """
+
+    def __init__(self, response, transport, key, conn):
+        self._response = response
+        self._transport = transport
+        self._key = key
+        self._conn = conn
+
+    def _done(self):
+        conn = self._conn
+        if conn is not None:
+            self._conn = None
+            # (read1 doesn't mark a response read up to its Content-Length
+            # as closed; the connection refuses new requests until it is)
+            self._response.close()
+            self._transport._finished(self._key, conn, self._response)
+
+    def read(self, amt=None):
+        response = self._response
+        if amt is None:
+            data = response.read()
+        else:
+            data = response.read(amt)
+        if not data or response.isclosed():
+            self._done()
+        return data
+
+    def read1(self, amt=-1):
+        """
+        Read up to amt bytes, returning what has been received already
+        (Python 2: like read)
+        """
+        response = self._response
+        read1 = getattr(response, 'read1', None)
+        if read1 is None:
+            return self.read(None if amt < 0 else amt)
+        data = read1(amt)
+        if not data or response.isclosed() or response.length == 0:
+            self._done()
+        return data
+
+    def info(self):
+        return self._response.msg
+
+    @property
+    def headers(self):
+        return self._response.msg
+
+    def getcode(self):
+        return self._response.status
+
+    @property
+    def length(self):
+        return self._response.length
+
+    def close(self):
+        conn = self._conn
+        if conn is not None and not self._response.isclosed():
+            self._conn = None
+            conn.close()
+        else:
+            self._done()
+        self._response.close()
+
+
+class UnixHTTPConnection(HTTPConnection):
+    """
+    An HTTP connection over a Unix domain socket
+
+    The host part of the URL is used for the Host header only.
+    """
+
+    def __init__(self, socket_path, host='localhost', port=None):
+        HTTPConnection.__init__(self, host, port)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            if self.timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+        except Exception:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+class UnixSocketTransport(PooledTransport):
+    """
+    Talk HTTP over a Unix domain socket, e.g. to a local proxy
+
+    >>> from pdfreactor.api import PDFreactor
+    >>> client = PDFreactor('http://localhost/service/rest',
+    ...     transport=UnixSocketTransport('/run/pdfreactor/proxy.sock'))
+    """
+
+    def __init__(self, socket_path, maxsize=10):
+        PooledTransport.__init__(self, maxsize)
+        self.socket_path = socket_path
+
+    def _new_connection(self, scheme, host, port):
+        return UnixHTTPConnection(self.socket_path, host or 'localhost',
+                                  port)
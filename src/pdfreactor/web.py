@@ -0,0 +1,83 @@
+"""
+pdfreactor.web: deliver converted documents from web applications
+
+The converted document is passed on to the HTTP client chunk by chunk,
+while it arrives from the PDFreactor service; it is never buffered
+completely, and the first bytes reach the client early.
+
+WSGI:
+
+    def application(environ, start_response):
+        binary = client.convertAsBinaryStream(config)
+        return wsgi_response(start_response, binary, filename='report.pdf')
+
+The returned iterable closes the connection to the PDFreactor service when
+closed by the WSGI server, including the case of a client disconnect.
+
+For ASGI applications, see pdfreactor.aio.asgi_response.
+"""
+
+__all__ = [
+    'response_headers',
+    'wsgi_response',
+    'WSGIBody',
+    ]
+
+
+def response_headers(binary, filename=None, content_type=None,
+                     inline=False):
+    """
+    Return the list of (name, value) header tuples for the given
+    BinaryResponse
+
+    >>> class Binary:
+    ...     length = 1234
+    ...     content_type = 'application/pdf'
+    >>> response_headers(Binary)
+    [('Content-Type', 'application/pdf'), ('Content-Length', '1234')]
+    >>> response_headers(Binary, filename='report.pdf', inline=True)[2]
+    ('Content-Disposition', 'inline; filename="report.pdf"')
+    """
+    if content_type is None:
+        content_type = binary.content_type or 'application/octet-stream'
+    headers = [('Content-Type', content_type)]
+    if binary.length is not None:
+        headers.append(('Content-Length', str(binary.length)))
+    if filename:
+        disposition = inline and 'inline' or 'attachment'
+        headers.append(('Content-Disposition',
+                        '%s; filename="%s"'
+                        % (disposition, filename.replace('"', ''))))
+    return headers
+
+
+class WSGIBody(object):
+    """
+    A WSGI response iterable which yields the chunks of a BinaryResponse
+    """
+
+    def __init__(self, binary, chunksize=None):
+        self.binary = binary
+        self.chunksize = chunksize or binary.CHUNK
+
+    def __iter__(self):
+        read = self.binary.read
+        size = self.chunksize
+        while True:
+            chunk = read(size)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        self.binary.close()
+
+
+def wsgi_response(start_response, binary, filename=None, content_type=None,
+                  inline=False, status='200 OK', chunksize=None):
+    """
+    Start the WSGI response, and return the body iterable
+    """
+    start_response(status, response_headers(binary, filename,
+                                            content_type, inline))
+    return WSGIBody(binary, chunksize)